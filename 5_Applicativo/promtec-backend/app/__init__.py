@@ -6,22 +6,24 @@ It initializes the application, registers blueprints, sets up database connectio
 configures CORS, and starts background jobs for scheduled tasks.
 """
 import os
-import logging
-from logging.handlers import RotatingFileHandler
 from pathlib import Path
 from dotenv import load_dotenv  # For loading environment variables from .env file
 from flask import Flask, request
 from .config import Config  # Application configuration
-from .extensions import db, migrate, cors, ma  # Flask extensions
+from .extensions import db, migrate, cors, ma, limiter, response_cache, replicas, metrics, tracer, profiler, memory_monitor  # Flask extensions
 from flask_wtf.csrf import CSRFProtect  # CSRF protection
 from .security.routes import create_default_user  # Default admin user creation
 from .schools.defaults import create_default_schools  # Default schools setup
 from apscheduler.schedulers.background import BackgroundScheduler  # Scheduler for background tasks
 from .slots.models import EnrollmentActivity  # Model for enrollment activities
+from .utils.crypto_utils import SEARCH_INDEX_KEY, record_request_crypto_ops  # Search index key, per-request encryption counters
+from .utils.database import configure_engine, engine_options  # Engine settings and pool instrumentation
+from .utils.metrics import JOB_DURATION, observe_duration  # Durations of the background jobs
+from .utils.logging_config import configure_logging  # Queued logging to the console and the log files
 import atexit  # For registering shutdown handlers
 
 
-def create_app():
+def create_app(test_config=None):
     """
     Flask application factory function.
     
@@ -33,34 +35,39 @@ def create_app():
     - Creating database tables and default data if needed
     - Setting up background tasks for periodic operations
     
+    Args:
+        test_config (dict, optional): Settings overriding the Config class, used by
+                                      the tools running the application on a throwaway database
+    
     Returns:
         Flask: The configured Flask application instance ready to be run
     """
     # Load environment variables from .env file
     load_dotenv()
 
+    # The student search index needs its own stable key (see .env.example)
+    if not SEARCH_INDEX_KEY:
+        raise RuntimeError(
+            'STUDENT_SEARCH_KEY is not set: add a random secret to promtec-backend/.env, for example '
+            'python -c "import secrets; print(secrets.token_hex(32))", and keep it unchanged across '
+            'encryption key rotations (see .env.example)'
+        )
+
     # Create Flask application instance
     app = Flask(__name__)
     app.config.from_object(Config)  # Apply configuration from Config class
+    if test_config:
+        app.config.from_mapping(test_config)  # Apply the overrides of the caller
     app.secret_key = os.environ.get('FLASK_SECRET_KEY')  # Set secret key for sessions and CSRF
     
-    # Set up error logging
+    # Set up logging
     log_dir = Path(os.environ.get('LOG_DIR', 'logs'))
     # Create logs directory if it doesn't exist
     log_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Configure logging for application errors
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    error_log_file = log_dir / 'errors.log'
-    
-    # Create a file handler for error logs with rotation (max 10MB, keep 10 backup files)
-    file_handler = RotatingFileHandler(error_log_file, maxBytes=10485760, backupCount=10)
-    file_handler.setFormatter(formatter)
-    file_handler.setLevel(logging.ERROR)
-    
-    # Add the logger to the application
-    app.logger.addHandler(file_handler)
-    app.logger.setLevel(logging.ERROR)
+
+    # Console, errors.log, slow request and memory report logs (rotated at 10MB,
+    # 10 backup files), written by a background thread
+    configure_logging(app, log_dir)
     
     # Set up request logging for failed requests
     @app.after_request
@@ -73,6 +80,9 @@ def create_app():
                 response.status_code
             )
         return response
+
+    # Collect the encryption operations performed and saved by each request
+    app.after_request(record_request_crypto_ops)
             
     # Register error handler for 500 errors
     @app.errorhandler(500)
@@ -82,20 +92,33 @@ def create_app():
         return {'error': 'Internal server error'}, 500
 
     # Initialize Flask extensions
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app)  # Pool defaults of the database
+    replicas.init_app(app)  # Read replicas, declared as binds before the engines are created
     db.init_app(app)  # SQLAlchemy database
     migrate.init_app(app, db)  # Alembic migrations
     cors.init_app(app, resources={r"/*": {"origins": "*"}})  # Cross-Origin Resource Sharing
     ma.init_app(app)  # Marshmallow serialization
     csrf = CSRFProtect()
     csrf.init_app(app)  # CSRF protection
+    limiter.init_app(app)  # Rate limiting of expensive public endpoints
+    response_cache.init_app(app)  # Cache of the hot read endpoints
+    metrics.init_app(app)  # Request metrics and /metrics endpoint
+    tracer.init_app(app)  # Span breakdown and slow request log
+    profiler.init_app(app)  # On-demand profiling for administrators
+    memory_monitor.init_app(app)  # Memory gauges and allocation tracking
 
     # Configure application components with application context
     with app.app_context():
+        configure_engine(app, db.engine)  # Before the first connection is opened
+        for name, engine in replicas.engines().items():
+            configure_engine(app, engine, stats_name=f'database_pool_{name}')
+
         # Import blueprints (must be inside context to avoid circular imports)
         from .security import security as security_blueprint
         from .user_management import user_management as user_management_blueprint
         from .schools import schools as schools_blueprint
         from .slots import slots as slots_blueprint
+        from .monitoring import monitoring as monitoring_blueprint
         from .schools.models import School
 
         # Register blueprints with URL prefixes
@@ -103,19 +126,21 @@ def create_app():
         app.register_blueprint(user_management_blueprint, url_prefix='/api/user-management')
         app.register_blueprint(schools_blueprint, url_prefix='/api/schools')
         app.register_blueprint(slots_blueprint, url_prefix='/api/slots')
+        app.register_blueprint(monitoring_blueprint, url_prefix='/api/monitoring')
 
         # Create database tables and initial data
         db.create_all()
         create_default_user()  # Create default admin user if none exists
         create_default_schools(db, School)  # Create default schools if none exist
 
-        # Create background scheduler for periodic tasks
-        scheduler = BackgroundScheduler()
-        scheduler.add_job(func=lambda: check_enrollment_summaries(app), trigger="interval", minutes=1)
-        scheduler.start()
+        if app.config.get('SCHEDULER_ENABLED', True):
+            # Create background scheduler for periodic tasks
+            scheduler = BackgroundScheduler()
+            scheduler.add_job(func=lambda: check_enrollment_summaries(app), trigger="interval", minutes=1)
+            scheduler.start()
 
-        # Register scheduler shutdown handler to run when application exits
-        atexit.register(lambda: scheduler.shutdown())
+            # Register scheduler shutdown handler to run when application exits
+            atexit.register(lambda: scheduler.shutdown())
 
     return app
 
@@ -132,5 +157,5 @@ def check_enrollment_summaries(app):
     Args:
         app (Flask): The Flask application instance to create context from
     """
-    with app.app_context():
+    with app.app_context(), observe_duration(JOB_DURATION, job='enrollment_summaries'):
         EnrollmentActivity.check_and_send_summaries()
\ No newline at end of file
@@ -6,6 +6,7 @@ including database connection parameters, security settings, and CORS configurat
 It loads settings from environment variables for better security and deployment flexibility.
 """
 import os
+import tempfile
 from dotenv import load_dotenv  # For loading environment variables from .env file
 from pathlib import Path
 
@@ -15,6 +16,37 @@ load_dotenv()
 # Base directory of the application (one level up from this file)
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+
+def database_engine_options():
+    """
+    Build the SQLAlchemy engine options from the environment.
+
+    Only the options that are set are passed to the engine, so each database
+    keeps its own defaults, completed by engine_options() in app/utils/database.py.
+
+    Environment Variables:
+        DB_POOL_SIZE: Connections kept open by each worker
+        DB_MAX_OVERFLOW: Extra connections opened under load
+        DB_POOL_TIMEOUT: Seconds to wait for a free connection
+        DB_POOL_RECYCLE: Seconds after which a connection is replaced
+        DB_POOL_PRE_PING: 'true' to test connections before use
+        DB_ISOLATION_LEVEL: Transaction isolation level (e.g. READ COMMITTED)
+
+    Returns:
+        dict: The options for SQLALCHEMY_ENGINE_OPTIONS
+    """
+    options = {}
+    for name, option in (('DB_POOL_SIZE', 'pool_size'), ('DB_MAX_OVERFLOW', 'max_overflow'),
+                         ('DB_POOL_TIMEOUT', 'pool_timeout'), ('DB_POOL_RECYCLE', 'pool_recycle')):
+        if os.environ.get(name):
+            options[option] = int(os.environ[name])
+    if os.environ.get('DB_POOL_PRE_PING'):
+        options['pool_pre_ping'] = os.environ['DB_POOL_PRE_PING'].lower() == 'true'
+    if os.environ.get('DB_ISOLATION_LEVEL'):
+        options['isolation_level'] = os.environ['DB_ISOLATION_LEVEL'].upper()
+    return options
+
+
 class Config:
     """
     Configuration class containing all settings for the Flask application.
@@ -35,8 +67,34 @@ class Config:
     DB_PORT = os.environ.get('DB_PORT')  # Database port
     DB_NAME = os.environ.get('DB_NAME')  # Database name
 
-    # SQLAlchemy database connection string using PyMySQL driver
-    SQLALCHEMY_DATABASE_URI = f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+    # SQLAlchemy database connection string: a full URL from DATABASE_URL (for example
+    # 'sqlite:////data/promtec.db' for offline load tests), otherwise MySQL through PyMySQL
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
+        f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+    # Connection pool and transaction settings of the engine
+    SQLALCHEMY_ENGINE_OPTIONS = database_engine_options()
+
+    # Read replicas serving the reads of GET requests: comma-separated database URLs
+    DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    # Seconds a user reads from the primary after changing data (read-your-writes)
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', '5'))
+    # Store of the read-your-writes windows, shared by all the workers of the host so the
+    # next request of a user sees their write whichever worker serves it ('memory://'
+    # keeps the windows per worker and is only accepted with a single worker)
+    REPLICA_STICKY_STORE_URI = os.environ.get(
+        'REPLICA_STICKY_STORE_URI', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'promtec-replica-sticky.db'))
+    # Replication lag in seconds above which a replica is skipped, and how often it is measured
+    REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', '2'))
+    REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('REPLICA_LAG_CHECK_INTERVAL', '5'))
+    # Lifetime of the cached responses rendered from a replica
+    REPLICA_RESPONSE_CACHE_TTL = int(os.environ.get('REPLICA_RESPONSE_CACHE_TTL', '10'))
+
+    # SQLite profile, applied when the database URL is an SQLite file: write-ahead
+    # logging lets readers run while a request writes, and busy_timeout makes
+    # concurrent writers wait instead of failing with 'database is locked'
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'))  # Milliseconds
     # Disable SQLAlchemy event system (not needed and improves performance)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
@@ -55,5 +113,85 @@ class Config:
         'x-requested-with',
     ]
 
+    # Storage of student personal data: 'columns' encrypts every field in its own column,
+    # 'envelope' encrypts all fields of a student into one binary record
+    STUDENT_PII_STORAGE = os.environ.get('STUDENT_PII_STORAGE', 'columns')
+    # Format of the encrypted columns: 'text' (base64 tokens in VARCHAR) or 'binary'
+    # (raw tokens in VARBINARY); switch to 'binary' after running the migration
+    ENCRYPTED_COLUMN_STORAGE = os.environ.get('ENCRYPTED_COLUMN_STORAGE', 'text')
+
+    # Run the periodic background jobs (enrollment summaries) in this process
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() == 'true'
+
+    # Seconds a cached row count of a listing is reused in cursor pagination mode
+    COUNT_CACHE_TTL = int(os.environ.get('COUNT_CACHE_TTL', '30'))
+
+    # Rate limiting settings
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() == 'true'
+    # Addresses or networks of the reverse proxies whose X-Forwarded-For / X-Real-IP
+    # headers are trusted (comma-separated); requests from other peers are limited by their own address
+    TRUSTED_PROXIES = os.environ.get('TRUSTED_PROXIES', '')
+    # 'memory://' keeps counters per worker, 'sqlite:////path/file.db' shares them between workers
+    RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI', 'memory://')
+    # Limits per route, with one limit per client IP and one per targeted account
+    RATE_LIMITS = {
+        'login': {
+            'ip': os.environ.get('RATELIMIT_LOGIN_IP', '30/minute'),
+            'account': os.environ.get('RATELIMIT_LOGIN_ACCOUNT', '10/minute'),
+        },
+        'forgot_password': {
+            'ip': os.environ.get('RATELIMIT_FORGOT_PASSWORD_IP', '10/hour'),
+            'account': os.environ.get('RATELIMIT_FORGOT_PASSWORD_ACCOUNT', '3/hour'),
+        },
+        'create_user': {
+            'ip': os.environ.get('RATELIMIT_CREATE_USER_IP', '10/hour'),
+            'account': os.environ.get('RATELIMIT_CREATE_USER_ACCOUNT', '5/hour'),
+        },
+    }
+
+    # Response cache of the hot slot read endpoints
+    RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+    # 'memory://' keeps entries per worker, 'sqlite:////path/file.db' shares them between workers
+    RESPONSE_CACHE_URI = os.environ.get('RESPONSE_CACHE_URI', 'memory://')
+    # Store of the invalidation versions of the cached responses, shared by all the workers
+    # of the host so a write served by one worker invalidates the entries of the others
+    CACHE_VERSIONS_URI = os.environ.get(
+        'CACHE_VERSIONS_URI', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'promtec-cache-versions.db'))
+    # Number of worker processes serving the application, set by gunicorn.conf.py
+    WORKER_PROCESSES = int(os.environ.get('GUNICORN_WORKERS', '1'))
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '2048'))
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', '300'))
+
+    # Bearer token required by the /metrics endpoint, which refuses every request while it is not set
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Request tracing: requests slower than the threshold are written with their
+    # span breakdown to logs/slow_requests.log
+    TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'true').lower() == 'true'
+    SLOW_REQUEST_THRESHOLD_MS = int(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', '1000'))
+
+    # Sampling profiler available to administrators (X-Profile header or time window)
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'true').lower() == 'true'
+    # Directory of the folded stack profiles, defaults to LOG_DIR/profiles
+    PROFILE_DIR = os.environ.get('PROFILE_DIR')
+    PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', '5'))
+    PROFILER_MAX_SECONDS = int(os.environ.get('PROFILER_MAX_SECONDS', '60'))
+    # Shortest sampling interval an administrator may request, and number of profiles kept on disk
+    PROFILER_MIN_INTERVAL_MS = float(os.environ.get('PROFILER_MIN_INTERVAL_MS', '1'))
+    PROFILER_KEEP = int(os.environ.get('PROFILER_KEEP', '50'))
+
+    # Logging: level of every logger, per-module overrides ('app.slots.models=DEBUG,apscheduler=WARNING')
+    # and format of the console and errors.log ('json' or 'text')
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+
+    # Allocation tracking with tracemalloc, slows the workers down: off unless investigating
+    MEMORY_TRACKING_ENABLED = os.environ.get('MEMORY_TRACKING_ENABLED', 'false').lower() == 'true'
+    MEMORY_TRACKING_FRAMES = int(os.environ.get('MEMORY_TRACKING_FRAMES', '1'))
+    # Requests allocating more are written with their allocation diff to logs/memory_reports.log
+    MEMORY_GROWTH_THRESHOLD_MB = float(os.environ.get('MEMORY_GROWTH_THRESHOLD_MB', '50'))
+    MEMORY_REPORT_LINES = int(os.environ.get('MEMORY_REPORT_LINES', '20'))
+
 
 
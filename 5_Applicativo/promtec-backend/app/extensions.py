@@ -9,9 +9,16 @@ from flask_sqlalchemy import SQLAlchemy  # ORM for database operations
 from flask_migrate import Migrate  # Database migration tool built on Alembic
 from flask_cors import CORS  # Cross-Origin Resource Sharing support
 from flask_marshmallow import Marshmallow  # Object serialization/deserialization library
+from .utils.rate_limit import RateLimiter  # Request throttling for expensive endpoints
+from .utils.response_cache import ResponseCache  # Cache of rendered read responses
+from .utils.replicas import ReplicaRouter, RoutingSession  # Reads of GET requests on replicas
+from .utils.metrics import Metrics  # Prometheus metrics of the requests
+from .utils.tracing import Tracer  # Span breakdown of slow requests
+from .utils.profiler import Profiler  # On-demand sampling profiler
+from .utils.memory import MemoryMonitor  # Memory gauges and allocation reports
 
-# SQLAlchemy instance for ORM database operations
-db = SQLAlchemy()
+# SQLAlchemy instance for ORM database operations, its sessions route reads to the replicas
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # Migrate instance for managing database migrations
 migrate = Migrate()
@@ -21,3 +28,24 @@ cors = CORS()
 
 # Marshmallow instance for object serialization/deserialization
 ma = Marshmallow()
+
+# Rate limiter protecting login, registration and password reset endpoints
+limiter = RateLimiter()
+
+# Response cache of the hot slot read endpoints
+response_cache = ResponseCache()
+
+# Router choosing the read replica of each GET request
+replicas = ReplicaRouter()
+
+# Prometheus instrumentation of the requests and /metrics endpoint
+metrics = Metrics()
+
+# Request tracing writing the slow request log
+tracer = Tracer()
+
+# Sampling profiler of single requests or time windows, for administrators
+profiler = Profiler()
+
+# Memory of the workers and allocation diff reports of the requests growing it
+memory_monitor = MemoryMonitor()
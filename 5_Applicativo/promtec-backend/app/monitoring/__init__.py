@@ -0,0 +1,17 @@
+"""
+Monitoring Blueprint Package.
+
+This package exposes runtime information about the backend worker serving the
+request, such as the counters collected by the rate limiter and the caches.
+
+All routes in this blueprint are prefixed with '/api/monitoring' and require
+administrator privileges.
+"""
+from flask import Blueprint
+
+# Create the monitoring blueprint
+monitoring = Blueprint('monitoring', __name__)
+
+# Import routes to register them with the blueprint
+# Import is at the bottom to avoid circular import issues
+from . import routes
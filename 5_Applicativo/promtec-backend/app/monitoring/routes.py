@@ -0,0 +1,161 @@
+"""
+Monitoring API Routes Module.
+
+This module provides administrative endpoints returning the runtime statistics
+of the current worker process, managing the profiles of the sampling profiler
+and switching the allocation tracking of a worker.
+"""
+import os
+from flask import jsonify, request, send_file
+from app.extensions import profiler, memory_monitor  # Sampling profiler and memory tracking
+from app.security.routes import auth  # Authentication functions
+from app.security.decorators import admin_required  # Admin authorization decorator
+from app.utils.stats import collect_stats  # Statistics of registered components
+from . import monitoring  # Blueprint instance
+
+
+@monitoring.route('/stats', methods=['GET'])
+@auth.login_required
+@admin_required
+def get_stats():
+    """
+    Get the runtime statistics of the worker serving the request.
+
+    Each gunicorn worker keeps its own counters, so consecutive calls may be
+    answered by different workers; the process ID is included to tell them apart.
+
+    Returns:
+        200: JSON response with the statistics of every registered component
+        401: If authentication fails
+        403: If the user isn't an administrator
+    """
+    return jsonify({
+        'pid': os.getpid(),
+        'stats': collect_stats()
+    })
+
+
+@monitoring.route('/profile', methods=['POST'])
+@auth.login_required
+@admin_required
+def start_profile_window():
+    """
+    Profile every request served by this worker for a time window.
+
+    The profiler samples in the background, so the window covers the requests
+    this worker serves after this one returns. The profile is written when the
+    window ends and can then be downloaded from any worker.
+
+    Request Body:
+        seconds (number, optional): Length of the window (default 10, capped by PROFILER_MAX_SECONDS)
+        interval_ms (number, optional): Milliseconds between two samples, at least PROFILER_MIN_INTERVAL_MS
+
+    Returns:
+        202: JSON response with the name of the future profile and the worker process ID
+        400: If the parameters are invalid or the profiler is disabled
+        409: If a window is already running on this worker
+    """
+    if not profiler.enabled:
+        return jsonify({'error': 'Profilazione disabilitata'}), 400
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = float(data.get('seconds', 10))
+        interval = float(data['interval_ms']) / 1000 if data.get('interval_ms') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Parametri di profilazione non validi'}), 400
+    if seconds <= 0 or (interval is not None and interval < profiler.min_interval):
+        return jsonify({'error': 'Parametri di profilazione non validi'}), 400
+
+    name = profiler.start_window(seconds, interval)
+    if name is None:
+        return jsonify({'error': 'Profilazione già in corso su questo worker'}), 409
+    return jsonify({
+        'profile': name,
+        'pid': os.getpid(),
+        'seconds': min(seconds, profiler.max_seconds)
+    }), 202
+
+
+@monitoring.route('/profiles', methods=['GET'])
+@auth.login_required
+@admin_required
+def get_profiles():
+    """
+    List the stored profiles, newest first.
+
+    Returns:
+        200: JSON response with the name, size and modification time of every profile
+    """
+    return jsonify({'profiles': profiler.list_profiles()})
+
+
+@monitoring.route('/profiles/<name>', methods=['GET'])
+@auth.login_required
+@admin_required
+def get_profile(name):
+    """
+    Download a profile in the folded stack format (flamegraph.pl, speedscope).
+
+    Args:
+        name (str): Name of the profile
+
+    Returns:
+        200: The profile as plain text
+        404: If the profile does not exist
+    """
+    path = profiler.path(name)
+    if path is None:
+        return jsonify({'error': 'Profilo non trovato'}), 404
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=name)
+
+
+@monitoring.route('/memory', methods=['GET'])
+@auth.login_required
+@admin_required
+def get_memory():
+    """
+    Get the memory of the worker serving the request.
+
+    Returns:
+        200: JSON response with the resident memory, the allocation statistics per
+             endpoint and, while tracking is on, the source lines holding the most memory
+    """
+    return jsonify({
+        'pid': os.getpid(),
+        'memory': memory_monitor.stats(),
+        'top_allocations': memory_monitor.top_allocations()
+    })
+
+
+@monitoring.route('/memory', methods=['POST'])
+@auth.login_required
+@admin_required
+def switch_memory_tracking():
+    """
+    Switch the allocation tracking (tracemalloc) of the worker serving the request.
+
+    Tracking slows the allocations down, so it should only stay on while
+    investigating. To track every worker set MEMORY_TRACKING_ENABLED instead.
+
+    Request Body:
+        enabled (bool): Whether to track the allocations
+        frames (int, optional): Frames stored per allocation (default MEMORY_TRACKING_FRAMES)
+
+    Returns:
+        200: JSON response with the tracking state and the worker process ID
+        400: If the parameters are invalid
+    """
+    data = request.get_json(silent=True) or {}
+    enabled = data.get('enabled')
+    frames = data.get('frames')
+    if not isinstance(enabled, bool) or (frames is not None and (not isinstance(frames, int) or not 1 <= frames <= 100)):
+        return jsonify({'error': 'Parametri di monitoraggio della memoria non validi'}), 400
+
+    if enabled:
+        memory_monitor.start(frames)
+    else:
+        memory_monitor.stop()
+    return jsonify({
+        'pid': os.getpid(),
+        'tracking': memory_monitor.tracking
+    })
@@ -10,13 +10,18 @@ from . import schools  # Blueprint instance
 from .models import School  # School data model
 from ..extensions import db  # Database instance
 from ..security.decorators import admin_required  # Admin-level access control decorator
+from ..utils.http_cache import conditional  # ETag and Cache-Control handling
 # Import auth at function level to avoid circular imports
 
 @schools.route('/', methods=['GET'])
+@conditional
 def get_schools():
     """
     Get a list of all registered schools in the system.
     
+    The response carries an ETag, so clients polling the list receive
+    a 304 Not Modified until a school is added, renamed or removed.
+    
     Returns:
         JSON response with the list of school names.
     """
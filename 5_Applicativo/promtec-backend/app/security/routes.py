@@ -1,7 +1,7 @@
 from flask import request, jsonify, url_for, current_app
 from flask_httpauth import HTTPTokenAuth
 from werkzeug.security import check_password_hash, generate_password_hash
-from ..extensions import db
+from ..extensions import db, limiter, replicas, profiler
 from .models import User, Token, School, PasswordResetToken, UserApproval
 import secrets
 from . import security
@@ -15,6 +15,7 @@ auth = HTTPTokenAuth(scheme='Bearer')
 load_dotenv()
 
 @security.route('/create_user', methods=['POST'])
+@limiter.limit('create_user', account_field='email')
 def create_user():
     """
     Register a new user in the system.
@@ -33,6 +34,7 @@ def create_user():
     Returns:
         201: JSON response with success message when user is created or restored
         400: JSON response with form validation errors
+        429: JSON response when too many registrations were attempted
     """
     form = RegistrationForm()
     if form.validate_on_submit():
@@ -78,6 +80,7 @@ def create_user():
     return jsonify({'errors': form.errors}), 400
 
 @security.route('/login', methods=['POST'])
+@limiter.limit('login', account_field='username')
 def login_view():
     """
     Authenticate a user and issue an access token.
@@ -94,6 +97,7 @@ def login_view():
         200: JSON response with token and user information on successful login
         400: JSON response with form validation errors or invalid credentials
         403: JSON response with appropriate error message for inactive/unapproved accounts
+        429: JSON response when too many login attempts were made
     """
     form = LoginForm()
     if form.validate_on_submit():
@@ -233,9 +237,17 @@ def verify_token(token):
     """
     #print(f"Verifying token: {token}")  # Debug statement
     token_obj = Token.query.filter_by(token=token).first()
+    if token_obj is None and replicas.reading_from_replica():
+        # The token may have been created after the last change applied by the replica
+        replicas.use_primary()
+        token_obj = Token.query.filter_by(token=token).first()
     if token_obj:
         #print(f"Token valid for user_id: {token_obj.user_id}")  # Debug statement
-        return User.query.get(token_obj.user_id)
+        replicas.identify(token_obj.user_id)  # Read-your-writes after the user's own changes
+        user = User.query.get(token_obj.user_id)
+        if user:
+            profiler.start_if_requested(user)  # Only for administrators
+        return user
     #print("Token invalid")  # Debug statement
     return None
 
@@ -256,6 +268,7 @@ def health_check():
     })
 
 @security.route('/forgot-password', methods=['POST'])
+@limiter.limit('forgot_password', account_field='email')
 def forgot_password():
     """
     Initiate the password reset process for a user.
@@ -275,6 +288,7 @@ def forgot_password():
         200: JSON response with a success message (regardless of whether email exists)
         400: JSON response with error if email is missing
         403: JSON response with error for deleted or inactive accounts
+        429: JSON response when too many reset requests were made
     """
     data = request.json
     email = data.get('email')
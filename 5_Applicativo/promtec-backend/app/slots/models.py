@@ -13,17 +13,21 @@ The module also includes several enumeration classes for standardizing options
 such as time periods, departments, and gender categories.
 """
 import os
+import json  # For envelope records decrypted in bulk
+from flask import current_app, has_app_context  # For the configured PII storage
 from datetime import datetime, timedelta, timezone  # For date and time operations
 from enum import Enum  # For defining enumeration types
 from app.extensions import db  # Database ORM instance
 from app.security.models import School, User  # Related models
-from app.utils.crypto_utils import encrypt_value, decrypt_value  # For encrypting sensitive data
+from app.utils.encrypted_type import EncryptedToken  # Column type of encrypted values
+from app.utils.crypto_utils import encrypt_value, decrypt_value, decrypt_many, encrypt_record, decrypt_record, record_memo_hit  # For encrypting sensitive data
 from sqlalchemy.ext.hybrid import hybrid_property  # For property encryption/decryption
+from sqlalchemy.orm.attributes import flag_dirty, set_committed_value  # For changes made during a flush
 from app.utils.email_utils import send_email  # For sending notification emails
+from app.utils.tracing import traced  # Time of the summary check in the request traces
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Module logger, configured by the application factory
 logger = logging.getLogger(__name__)
 
 class EnrollmentActivity(db.Model):
@@ -56,12 +60,12 @@ class EnrollmentActivity(db.Model):
         
         if existing_unsent:
             # If an unsent activity exists, just update its timestamp
-            logger.debug(f"Updating existing unsent activity for user {user_id}")
+            logger.debug("Updating existing unsent activity for user %s", user_id)
             existing_unsent.last_activity = now
             activity = existing_unsent
         else:
             # If no unsent activity exists, create a new one
-            logger.debug(f"Creating new activity record for user {user_id}")
+            logger.debug("Creating new activity record for user %s", user_id)
             activity = cls(
                 user_id=user_id,
                 last_activity=now,
@@ -71,38 +75,55 @@ class EnrollmentActivity(db.Model):
         
         db.session.commit()
         return activity
+
+    def summary_enrollments(self):
+        """
+        Load the enrollments listed in the summary email of this activity.
+
+        The students and slots are loaded with the enrollments and the names of
+        all the students are decrypted at once, so building the email runs no
+        further query.
+
+        Returns:
+            list: The enrollments created by the user in the 30 minutes before the last activity
+        """
+        enrollments = StudentEnrollment.query.filter(
+            StudentEnrollment.user_id == self.user_id,
+            StudentEnrollment.created_at >= self.last_activity - timedelta(minutes=30),
+            StudentEnrollment.created_at <= self.last_activity
+        ).options(*ENROLLMENT_STUDENT_SLOT_LOADING).all()
+        Student.prefetch_pii([enrollment.student for enrollment in enrollments])
+        return enrollments
         
     @classmethod
+    @traced('enrollment.summaries')
     def check_and_send_summaries(cls):
         """Check and send enrollment summaries for users who have been inactive for 30 minutes"""
-        logger.info("Starting periodic enrollment summary check...")
+        logger.debug("Starting periodic enrollment summary check...")
         try:
             cutoff_time = datetime.utcnow() - timedelta(minutes=30)
-            logger.debug(f"Looking for activities before {cutoff_time}")
+            logger.debug("Looking for activities before %s", cutoff_time)
             
             pending_activities = cls.query.filter(
                 cls.last_activity < cutoff_time,
                 cls.email_sent == False
             ).all()
 
-            logger.info(f"Found {len(pending_activities)} pending activities to process")
+            if pending_activities:
+                logger.info("Found %d pending activities to process", len(pending_activities))
 
             for activity in pending_activities:
-                logger.debug(f"Processing activity {activity.id} for user {activity.user_id}")
+                logger.debug("Processing activity %s for user %s", activity.id, activity.user_id)
                 try:
                     # Get all enrollments created by this user in the last 30 minutes
-                    enrollments = StudentEnrollment.query.filter(
-                        StudentEnrollment.user_id == activity.user_id,
-                        StudentEnrollment.created_at >= activity.last_activity - timedelta(minutes=30),
-                        StudentEnrollment.created_at <= activity.last_activity
-                    ).all()
+                    enrollments = activity.summary_enrollments()
 
-                    logger.debug(f"Found {len(enrollments)} enrollments to summarize for user {activity.user_id}")
+                    logger.debug("Found %d enrollments to summarize for user %s", len(enrollments), activity.user_id)
 
                     if enrollments:
                         user = User.query.get(activity.user_id)
                         if user and not user.is_admin:
-                            logger.info(f"Sending enrollment summary for non-admin user {user.email}")
+                            logger.info("Sending enrollment summary for non-admin user %s", user.email)
                             from app.utils.email_utils import send_enrollment_summary_email
                             
                             # Use full name for greeting
@@ -115,24 +136,24 @@ class EnrollmentActivity(db.Model):
                             ) """
                             email_sent = True
                             if email_sent:
-                                logger.info(f"Successfully sent summary email to {user.email}")
+                                logger.info("Successfully sent summary email to %s", user.email)
                             else:
-                                logger.error(f"Failed to send summary email to {user.email}")
+                                logger.error("Failed to send summary email to %s", user.email)
                                 continue  # Don't mark as sent if email failed
 
                     activity.email_sent = True
                     db.session.commit()
-                    logger.info(f"Marked activity {activity.id} as completed")
+                    logger.info("Marked activity %s as completed", activity.id)
                     
                 except Exception as e:
-                    logger.error(f"Error processing activity {activity.id}: {str(e)}")
+                    logger.error("Error processing activity %s: %s", activity.id, e)
                     db.session.rollback()
                     
         except Exception as e:
-            logger.error(f"Error in enrollment summary check: {str(e)}")
+            logger.error("Error in enrollment summary check: %s", e)
             db.session.rollback()
         finally:
-            logger.info("Completed enrollment summary check")
+            logger.debug("Completed enrollment summary check")
             
 class OrganizationInfo(str, Enum):
     FIRST_NAME = "Cesare"
@@ -299,18 +320,38 @@ class Slot(db.Model):
         db.event.listen(cls.total_spots, 'set', cls._set_slot_unconfirmed)
         db.event.listen(cls.max_students_per_school, 'set', cls._set_slot_unconfirmed)
 
+# Encrypted personal fields of a student
+PII_FIELDS = ('first_name', 'last_name', 'school_class', 'gender', 'address',
+              'postal_code', 'city', 'landline', 'mobile')
+
+
+def pii_storage_mode():
+    """
+    Get the storage format used when writing student PII.
+
+    Returns:
+        str: 'columns' (one encrypted column per field) or 'envelope' (one encrypted blob per row)
+    """
+    if has_app_context():
+        return current_app.config.get('STUDENT_PII_STORAGE', 'columns')
+    return 'columns'
+
+
 class Student(db.Model):
     id = db.Column(db.Integer, primary_key=True)
 
-    _first_name = db.Column("first_name", db.String(255), nullable=False)
-    _last_name = db.Column("last_name", db.String(255), nullable=False)
-    _school_class = db.Column("school_class", db.String(255), nullable=False)
-    _gender = db.Column("gender", db.String(255), nullable=False)
-    _address = db.Column("address", db.String(255), nullable=False)
-    _postal_code = db.Column("postal_code", db.String(255), nullable=False)
-    _city = db.Column("city", db.String(255), nullable=False)
-    _landline = db.Column("landline", db.String(255), nullable=True)
-    _mobile = db.Column("mobile", db.String(255), nullable=False)
+    # Column storage: every field is a separate Fernet token (NULL for envelope rows)
+    _first_name = db.Column("first_name", EncryptedToken(255), nullable=True)
+    _last_name = db.Column("last_name", EncryptedToken(255), nullable=True)
+    _school_class = db.Column("school_class", EncryptedToken(255), nullable=True)
+    _gender = db.Column("gender", EncryptedToken(255), nullable=True)
+    _address = db.Column("address", EncryptedToken(255), nullable=True)
+    _postal_code = db.Column("postal_code", EncryptedToken(255), nullable=True)
+    _city = db.Column("city", EncryptedToken(255), nullable=True)
+    _landline = db.Column("landline", EncryptedToken(255), nullable=True)
+    _mobile = db.Column("mobile", EncryptedToken(255), nullable=True)
+    # Envelope storage: all the fields in a single encrypted record (NULL for column rows)
+    _pii = db.Column("pii", db.LargeBinary, nullable=True)
 
     school_name = db.Column(db.String(50), db.ForeignKey('school.name', name='fk_student_school', ondelete='SET NULL'), nullable=True)
     school = db.relationship('School', backref=db.backref('students', lazy=True))
@@ -318,13 +359,140 @@ class Student(db.Model):
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
 
+    # Decrypted fields of this instance: field -> (ciphertext, plaintext)
+    _decrypted = None
+    # Fields set in envelope mode and not flushed yet: field -> plaintext
+    _pending_pii = None
+
+    def _envelope_fields(self):
+        """Get the decrypted envelope of the row, decrypting it at most once"""
+        if self._decrypted is None:
+            self._decrypted = {}
+        memo = self._decrypted.get('pii')
+        if memo is not None and memo[0] == self._pii:
+            record_memo_hit()
+            return memo[1]
+        fields = decrypt_record(self._pii)
+        self._decrypted['pii'] = (self._pii, fields)
+        return fields
+
+    def _read_encrypted(self, field):
+        """
+        Get the plaintext of an encrypted field, decrypting it at most once.
+
+        The memo entry stores the ciphertext it was computed from, so a value
+        reloaded from the database with another ciphertext is decrypted again.
+        """
+        if self._pending_pii and field in self._pending_pii:
+            return self._pending_pii[field]
+        if self._pii is not None:
+            return self._envelope_fields().get(field)
+
+        ciphertext = getattr(self, f'_{field}')
+        if self._decrypted is None:
+            self._decrypted = {}
+        memo = self._decrypted.get(field)
+        if memo is not None and memo[0] == ciphertext:
+            record_memo_hit()
+            return memo[1]
+        value = decrypt_value(ciphertext)
+        self._decrypted[field] = (ciphertext, value)
+        return value
+
+    def _write_column(self, field, plaintext):
+        """Encrypt and store a value in its own column, replacing the memoized plaintext"""
+        ciphertext = encrypt_value(plaintext)
+        setattr(self, f'_{field}', ciphertext)
+        if self._decrypted is None:
+            self._decrypted = {}
+        self._decrypted[field] = (ciphertext, plaintext)
+
+    def _write_encrypted(self, field, value):
+        """
+        Store a field in the configured PII storage format.
+
+        In envelope mode the value is kept in memory and the whole record is
+        encrypted once when the row is flushed, however many fields changed.
+        """
+        # The plain str a decryption would return (enum members become their value)
+        plaintext = None if value is None else value.encode().decode()
+        if pii_storage_mode() == 'envelope':
+            if self._pending_pii is None:
+                self._pending_pii = {}
+            self._pending_pii[field] = plaintext
+            flag_dirty(self)
+            return
+        if self._pii is not None:
+            # The row is stored as an envelope: move every field back to its column first
+            self.store_pii('columns')
+        self._write_column(field, plaintext)
+
+    @classmethod
+    def prefetch_pii(cls, students):
+        """
+        Decrypt the PII of many students at once.
+
+        The ciphertexts not memoized yet are collected column by column and
+        decrypted with decrypt_many, which uses several processes for large
+        batches. The plaintexts fill the memo of every instance, so the
+        getters called afterwards do not decrypt anything.
+
+        Args:
+            students (list): Student instances, typically every student of an export
+        """
+        students = [student for student in students if student is not None]
+        pending = []  # (student, memo key, ciphertext)
+        for student in students:
+            if student._decrypted is None:
+                student._decrypted = {}
+            if student._pii is not None:
+                memo = student._decrypted.get('pii')
+                if memo is None or memo[0] != student._pii:
+                    pending.append((student, 'pii', student._pii))
+        for field in PII_FIELDS:
+            for student in students:
+                if student._pii is not None:
+                    continue
+                ciphertext = getattr(student, f'_{field}')
+                memo = student._decrypted.get(field)
+                if ciphertext is not None and (memo is None or memo[0] != ciphertext):
+                    pending.append((student, field, ciphertext))
+
+        plaintexts = decrypt_many([ciphertext for _, _, ciphertext in pending])
+        for (student, key, ciphertext), plaintext in zip(pending, plaintexts):
+            student._decrypted[key] = (ciphertext, json.loads(plaintext) if key == 'pii' else plaintext)
+
+    def pii_fields(self):
+        """Get every PII field as plaintext, whatever the storage format of the row"""
+        return {field: self._read_encrypted(field) for field in PII_FIELDS}
+
+    def store_pii(self, mode):
+        """
+        Rewrite the PII of the row in the given storage format.
+
+        Args:
+            mode (str): 'columns' or 'envelope'
+        """
+        fields = self.pii_fields()
+        self._pending_pii = None
+        if mode == 'envelope':
+            self._pii = encrypt_record(fields)
+            for field in PII_FIELDS:
+                setattr(self, f'_{field}', None)
+            self._decrypted = {'pii': (self._pii, fields)}
+        else:
+            self._pii = None
+            self._decrypted = {}
+            for field in PII_FIELDS:
+                self._write_column(field, fields[field])
+
     @hybrid_property
     def first_name(self):
-        return decrypt_value(self._first_name)
+        return self._read_encrypted('first_name')
 
     @first_name.setter
     def first_name(self, value):
-        self._first_name = encrypt_value(value)
+        self._write_encrypted('first_name', value)
 
     @first_name.expression
     def first_name(cls):
@@ -332,11 +500,11 @@ class Student(db.Model):
 
     @hybrid_property
     def last_name(self):
-        return decrypt_value(self._last_name)
+        return self._read_encrypted('last_name')
 
     @last_name.setter
     def last_name(self, value):
-        self._last_name = encrypt_value(value)
+        self._write_encrypted('last_name', value)
 
     @last_name.expression
     def last_name(cls):
@@ -344,11 +512,11 @@ class Student(db.Model):
 
     @hybrid_property
     def school_class(self):
-        return decrypt_value(self._school_class)
+        return self._read_encrypted('school_class')
 
     @school_class.setter
     def school_class(self, value):
-        self._school_class = encrypt_value(value)
+        self._write_encrypted('school_class', value)
 
     @school_class.expression
     def school_class(cls):
@@ -356,11 +524,11 @@ class Student(db.Model):
 
     @hybrid_property
     def gender(self):
-        return decrypt_value(self._gender)
+        return self._read_encrypted('gender')
 
     @gender.setter
     def gender(self, value):
-        self._gender = encrypt_value(value)
+        self._write_encrypted('gender', value)
 
     @gender.expression
     def gender(cls):
@@ -368,13 +536,13 @@ class Student(db.Model):
 
     @hybrid_property
     def address(self):
-        return decrypt_value(self._address)
+        return self._read_encrypted('address')
 
     @address.setter
     def address(self, value):
         if value and not value.strip().lower().startswith(('via ', 'viale ')):
             value = f'Via {value.strip()}'
-        self._address = encrypt_value(value)
+        self._write_encrypted('address', value)
 
     @address.expression
     def address(cls):
@@ -382,11 +550,11 @@ class Student(db.Model):
 
     @hybrid_property
     def postal_code(self):
-        return decrypt_value(self._postal_code)
+        return self._read_encrypted('postal_code')
 
     @postal_code.setter
     def postal_code(self, value):
-        self._postal_code = encrypt_value(value)
+        self._write_encrypted('postal_code', value)
 
     @postal_code.expression
     def postal_code(cls):
@@ -394,11 +562,11 @@ class Student(db.Model):
 
     @hybrid_property
     def city(self):
-        return decrypt_value(self._city)
+        return self._read_encrypted('city')
 
     @city.setter
     def city(self, value):
-        self._city = encrypt_value(value)
+        self._write_encrypted('city', value)
 
     @city.expression
     def city(cls):
@@ -406,11 +574,11 @@ class Student(db.Model):
 
     @hybrid_property
     def landline(self):
-        return decrypt_value(self._landline)
+        return self._read_encrypted('landline')
 
     @landline.setter
     def landline(self, value):
-        self._landline = encrypt_value(value)
+        self._write_encrypted('landline', value)
 
     @landline.expression
     def landline(cls):
@@ -418,11 +586,11 @@ class Student(db.Model):
 
     @hybrid_property
     def mobile(self):
-        return decrypt_value(self._mobile)
+        return self._read_encrypted('mobile')
 
     @mobile.setter
     def mobile(self, value):
-        self._mobile = encrypt_value(value)
+        self._write_encrypted('mobile', value)
 
     @mobile.expression
     def mobile(cls):
@@ -432,13 +600,55 @@ class Student(db.Model):
     def __declare_last__(cls):
         # Listen for student changes
         db.event.listen(cls, 'after_update', cls._student_changed)
+        # Encrypt the fields set in envelope mode into the record
+        db.event.listen(cls, 'before_insert', cls._seal_pii)
+        db.event.listen(cls, 'before_update', cls._seal_pii)
+
+    @staticmethod
+    def _seal_pii(mapper, connection, target):
+        """Encrypt the pending envelope fields, with one operation for the whole row"""
+        if target._pending_pii:
+            target.store_pii('envelope')
 
     @staticmethod
     def _student_changed(mapper, connection, target):
         """Set is_confirmed to False for all slots where this student is enrolled"""
-        for enrollment in target.enrollments:
-            if enrollment.slot:
-                enrollment.slot.is_confirmed = False
+        # A single statement on the flush connection: changing the loaded slots
+        # inside the flush would be discarded and cost one query per enrollment
+        connection.execute(
+            db.update(Slot.__table__)
+            .where(Slot.id.in_(db.select(StudentEnrollment.slot_id).where(StudentEnrollment.student_id == target.id)))
+            .where(Slot.is_confirmed == True)
+            .values(is_confirmed=False)
+        )
+        for enrollment in target.__dict__.get('enrollments', []):
+            slot = enrollment.__dict__.get('slot')
+            if slot is not None:
+                set_committed_value(slot, 'is_confirmed', False)
+
+
+class StudentSearchToken(db.Model):
+    """
+    Blind index entry for the student name search.
+
+    Every student has one row per distinct normalized prefix (3 to
+    SEARCH_PREFIX_MAX_LENGTH characters) of the words of the first and last
+    name. The prefix is stored as a keyed HMAC, so the table can be searched
+    through the (token, student_id) index without revealing the names.
+
+    Attributes:
+        id (int): Primary key identifier for the index entry
+        token (str): HMAC of the normalized prefix
+        student_id (int): Foreign key to the indexed student
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(24), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (
+        db.Index('idx_student_search_token', token, student_id),
+        db.Index('idx_student_search_token_student', student_id),
+    )
 
 
 class StudentEnrollment(db.Model):
@@ -483,4 +693,14 @@ class StudentEnrollment(db.Model):
         # Listen for changes to enrollments
         db.event.listen(cls, 'after_insert', cls._enrollment_changed)
         db.event.listen(cls, 'after_update', cls._enrollment_changed)
-        db.event.listen(cls, 'after_delete', cls._enrollment_changed)
\ No newline at end of file
+        db.event.listen(cls, 'after_delete', cls._enrollment_changed)
+
+
+# Named loader options of the enrollment code paths. Each bundle loads the rows a
+# path reads together with its enrollments, so the path runs in a fixed number of
+# queries whatever the number of enrollments.
+ENROLLMENT_STUDENT_LOADING = (db.joinedload(StudentEnrollment.student),)
+ENROLLMENT_STUDENT_SLOT_LOADING = (db.joinedload(StudentEnrollment.student), db.joinedload(StudentEnrollment.slot))
+ENROLLMENT_LETTER_LOADING = (db.joinedload(StudentEnrollment.student).joinedload(Student.school),)
+# Slot listings compute the occupied spots of every slot from its enrollments
+SLOT_ENROLLMENTS_LOADING = (db.selectinload(Slot.enrollments),)
\ No newline at end of file
@@ -13,21 +13,50 @@ and enrollment records. It includes functionalities for:
 All routes in this blueprint are prefixed with '/api/slots' and require authentication.
 Some administrative operations additionally require admin privileges.
 """
-from flask import g, jsonify, request, send_file  # Flask web framework components
-from app.extensions import db  # Database instance
+from flask import Response, g, jsonify, request, send_file  # Flask web framework components
+from app.extensions import db, response_cache  # Database instance and response cache
 from app.security.routes import auth  # Authentication functions
 from app.security.decorators import admin_required  # Admin authorization decorator
 from . import slots  # Blueprint instance
 from .models import Slot, StudentEnrollment, TimePeriod, OrganizationInfo, Department, GenderCategory, Student, Gender, User, EnrollmentActivity  # Data models
+from .models import ENROLLMENT_STUDENT_LOADING, ENROLLMENT_STUDENT_SLOT_LOADING, SLOT_ENROLLMENTS_LOADING  # Eager loading
 from datetime import datetime, timedelta, timezone  # Date and time utilities
 from sqlalchemy import distinct, and_  # Database query utilities
-from io import BytesIO  # For in-memory file operations
+from io import BytesIO, StringIO  # For in-memory file operations
+import csv  # For the enrollment export
+import logging  # Diagnostics of the enrollment checks
 import os  # Operating system utilities
+from ..utils.pagination import cursor_page, estimated_count, page_size  # Keyset pagination helpers
+from ..utils.http_cache import conditional, static_conditional  # ETag and Cache-Control handling
+from ..utils.response_cache import add_cache_tags  # Tags of cached slot responses
+from .search import SEARCH_PREFIX_MIN_LENGTH, candidate_query, matches, search_words  # Blind name index
+from .sort_index import ENROLLMENT_SORTS, sorted_enrollment_ids  # Decrypted sort keys per slot
 
 # Import utility functions
 from ..utils.letter import generate_letters_for_slot  # Document generation
 from ..utils.email_utils import send_email, send_slot_confirmation_email  # Email sending
 
+# Module logger, configured by the application factory
+logger = logging.getLogger(__name__)
+
+def invalidate_slot_cache(*slot_ids, listing=False):
+    """
+    Invalidate the cached responses depending on the given slots.
+
+    Called by the write endpoints after a successful commit. Changes to the
+    enrollments of a slot only affect the pages showing that slot, while
+    creating, deleting or moving a slot can change which slots every page and
+    the available dates contain.
+
+    Args:
+        *slot_ids (int): IDs of the changed slots
+        listing (bool): Whether the set of slots or their dates changed
+    """
+    tags = [f'slot:{slot_id}' for slot_id in slot_ids]
+    if listing:
+        tags += ['slots:set', 'slots:dates']
+    response_cache.invalidate(*tags)
+
 def format_slot(slot):
     """
     Format a Slot model instance into a JSON-serializable dictionary.
@@ -174,7 +203,7 @@ def get_pagination_params():
     return {
         # Pagination settings
         'page': request.args.get('page', 1, type=int),  # Current page number
-        'per_page': request.args.get('per_page', 10, type=int),  # Items per page
+        'per_page': page_size(request.args.get('per_page', type=int)),  # Items per page, at most MAX_PER_PAGE
         # Sorting settings
         'sort_by': request.args.get('sort_by', 'date'),  # Field to sort by
         'sort_order': request.args.get('sort_order', 'desc'),  # Sort direction (newest first)
@@ -186,11 +215,26 @@ def get_pagination_params():
             'gender_category': request.args.get('gender_category'),  # Gender category filter
             'is_locked': request.args.get('is_locked', type=lambda x: x.lower() == 'true' if x else None),  # Locked status
             'is_admin': is_admin  # User's admin status for visibility rules
-        }
+        },
+        # Keyset pagination, enabled when the cursor parameter is present (empty for the first page)
+        'cursor': request.args.get('cursor'),
+        'with_count': request.args.get('with_count', 'false').lower() == 'true'
     }
 
+# Sort fields supported by cursor pagination: (SQL expression, getter of the row value)
+# Enum columns are compared as strings so that MySQL orders and compares them consistently
+SLOT_CURSOR_SORTS = {
+    'date': (Slot.date, lambda slot: slot.date),
+    'created_at': (Slot.created_at, lambda slot: slot.created_at),
+    'time_period': (db.cast(Slot.time_period, db.String), lambda slot: slot.time_period.name),
+    'department': (db.cast(Slot.department, db.String), lambda slot: slot.department.name),
+    'id': (Slot.id, lambda slot: slot.id),
+}
+
 @slots.route('/', methods=['GET'])
 @auth.login_required
+@conditional
+@response_cache.cached('slots:set', vary=lambda: auth.current_user().is_admin)
 def get_slots():
     """
     Get a paginated, filtered, and sorted list of enrollment slots.
@@ -201,7 +245,7 @@ def get_slots():
     
     Query Parameters:
         page (int): The page number to retrieve (default: 1)
-        per_page (int): Number of items per page (default: 10)
+        per_page (int): Number of items per page (default: 10, at most 100)
         sort_by (str): Field to sort by (date, time_period, department)
         sort_order (str): Sort direction (asc, desc)
         date (str): Filter by specific date (YYYY-MM-DD format)
@@ -209,15 +253,45 @@ def get_slots():
         department (str): Filter by department
         gender_category (str): Filter by gender category
         is_locked (bool): Filter by locked status
+        cursor (str): Enables cursor pagination; empty for the first page, then
+                      the next_cursor value of the previous response
+        with_count (bool): In cursor mode, include an estimated total (default: false)
     
     Returns:
         JSON response with slots data and pagination information
+        304: If the client's ETag (If-None-Match) is still current
     """
     params = get_pagination_params()
-    query = Slot.query
+    query = Slot.query.options(*SLOT_ENROLLMENTS_LOADING)
     
     query = apply_filters(query, params['filters'])
     
+    if params['cursor'] is not None:
+        # Keyset pagination: no COUNT(*) and no OFFSET scan, deep pages cost like the first
+        sort_by = params['sort_by']
+        if sort_by not in SLOT_CURSOR_SORTS:
+            return jsonify({'error': 'Ordinamento non supportato con la paginazione a cursore'}), 400
+        sort_expr, sort_getter = SLOT_CURSOR_SORTS[sort_by]
+        try:
+            page = cursor_page(query, sort_by, sort_expr, sort_getter, Slot.id,
+                               params['sort_order'] == 'desc', params['cursor'], params['per_page'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        add_cache_tags(*[f'slot:{slot.id}' for slot in page['items']])
+        total = None
+        if params['with_count']:
+            total = estimated_count(('slots', tuple(sorted(params['filters'].items()))), query)
+        
+        return jsonify({
+            'slots': [format_slot(slot) for slot in page['items']],
+            'total': total,
+            'next_cursor': page['next_cursor'],
+            'has_next': page['has_next'],
+            'filters': params['filters'],
+            'sort': {'sort_by': sort_by, 'sort_order': params['sort_order']}
+        })
+    
     # Apply sorting - prioritize date sorting for a consistent experience
     if params['sort_by'] == 'date':
         # Default to sorting from future to past
@@ -227,6 +301,8 @@ def get_slots():
         query = query.order_by(sort_column.desc() if params['sort_order'] == 'desc' else sort_column)
     
     pagination = query.paginate(page=params['page'], per_page=params['per_page'], error_out=False)
+    # The page depends on the slots it shows: their enrollments change the occupied spots
+    add_cache_tags(*[f'slot:{slot.id}' for slot in pagination.items])
     
     return jsonify({
         'slots': [format_slot(slot) for slot in pagination.items],
@@ -241,6 +317,7 @@ def get_slots():
 
 @slots.route('/<int:slot_id>', methods=['GET'])
 @auth.login_required
+@conditional
 def get_slot(slot_id):
     """
     Get detailed information for a specific slot by ID.
@@ -263,6 +340,7 @@ def get_slot(slot_id):
 
 @slots.route('/enum-values', methods=['GET'])
 @auth.login_required
+@static_conditional(max_age=86400)
 def get_enum_values():
     """
     Get all available enum values used in the slots system.
@@ -345,6 +423,7 @@ def create_slot():
         
         db.session.add(slot)
         db.session.commit()
+        invalidate_slot_cache(slot.id, listing=True)
         
         return jsonify({
             'message': 'Slot created successfully',
@@ -441,6 +520,7 @@ def update_slot(slot_id):
             slot.is_confirmed = data['is_confirmed']
             
         db.session.commit()
+        invalidate_slot_cache(slot_id, listing=True)
         return jsonify({
             'message': 'Slot updated successfully',
             'slot': format_slot(slot)
@@ -482,6 +562,7 @@ def delete_slot(slot_id):
         # Then delete the slot itself
         db.session.delete(slot)
         db.session.commit()
+        invalidate_slot_cache(slot_id, listing=True)
         return jsonify({'message': 'Slot deleted successfully'})
     except Exception as e:
         db.session.rollback()
@@ -489,6 +570,8 @@ def delete_slot(slot_id):
 
 @slots.route('/available-dates', methods=['GET'])
 @auth.login_required
+@conditional
+@response_cache.cached('slots:dates')
 def get_slot_options():
     """
     Get available dates, departments, and time periods for slots.
@@ -508,6 +591,7 @@ def get_slot_options():
 
 @slots.route('/organization-info', methods=['GET'])
 @auth.login_required
+@static_conditional(max_age=86400)
 def get_organization_info():
     """
     Get the organization's contact information.
@@ -640,7 +724,7 @@ def create_enrollment(slot_id):
             
         # Check available spots
         available_spots = slot.total_spots - slot.get_occupied_spots()
-        print(f"Available spots: {available_spots}")
+        logger.debug("Available spots: %d", available_spots)
         
         # Initialize waiting list status
         data['is_in_waiting_list'] = False
@@ -667,7 +751,7 @@ def create_enrollment(slot_id):
                 if school_user:
                     creator_user = school_user
             except Exception as e:
-                print(f"Error finding school user: {str(e)}")
+                logger.error("Error finding school user: %s", e)
 
         # Use the factory method to create enrollment with the determined user 
         enrollment = StudentEnrollment.create(slot, student, creator_user)
@@ -684,6 +768,7 @@ def create_enrollment(slot_id):
             EnrollmentActivity.update_activity(current_user.id)
 
         db.session.commit()
+        invalidate_slot_cache(slot_id)
 
         # Check for pending summaries after commit to ensure activity is saved
         if not current_user.is_admin:
@@ -716,9 +801,11 @@ def delete_enrollment(enrollment_id):
     
     try:
         # Set slot as unconfirmed before deleting enrollment
+        slot_id = enrollment.slot_id
         enrollment.slot.is_confirmed = False
         db.session.delete(enrollment)
         db.session.commit()
+        invalidate_slot_cache(slot_id)
         return jsonify({'message': 'Enrollment deleted successfully'})
     except Exception as e:
         db.session.rollback()
@@ -768,7 +855,7 @@ def update_enrollment_waiting_list(enrollment_id):
         if not is_in_waiting_list and enrollment.is_in_waiting_list:
             # First get available spots
             available_spots = slot.total_spots - slot.get_occupied_spots() 
-            print(f"Available spots: {available_spots}")
+            logger.debug("Available spots: %d", available_spots)
             
             # Only check total spots limit for everyone (including admins)
             if available_spots <= 0:
@@ -778,12 +865,12 @@ def update_enrollment_waiting_list(enrollment_id):
             if not current_user.is_admin:
                 # A school can't have more students than the available spots
                 max_allowed = min(slot.max_students_per_school, available_spots)
-                print(f"Max allowed: {max_allowed}")
+                logger.debug("Max allowed: %d", max_allowed)
 
                 # Now check this specific school's current count
                 school_count = slot.get_school_enrollment_count(enrollment.student.school_name)
 
-                print(f"School count: {school_count}")
+                logger.debug("School count: %d", school_count)
                 if max_allowed < 1: 
                     return jsonify({'error': 'Limite di capacità della scuola raggiunto'}), 400
                 
@@ -793,6 +880,7 @@ def update_enrollment_waiting_list(enrollment_id):
         # Ensure slot is marked as unconfirmed when enrollment status changes
         slot.is_confirmed = False
         db.session.commit()
+        invalidate_slot_cache(slot.id)
         
         return jsonify({
             'message': 'Enrollment waiting list status updated successfully',
@@ -808,8 +896,61 @@ def update_enrollment_waiting_list(enrollment_id):
 @slots.route('/<int:slot_id>/enrollments', methods=['GET'])
 @auth.login_required
 def get_slot_enrollments(slot_id):
+    """
+    Get the enrollments of a slot.
+    
+    Without sort_by and page the enrollments are returned in insertion order.
+    Otherwise they are sorted on the server through the cached sort index of
+    the slot (see sort_index.py), and only the student data of the requested
+    page is loaded and decrypted. Non-admin users only see their own enrollments.
+    
+    Args:
+        slot_id (int): The ID of the slot
+        
+    Query Parameters:
+        is_waiting_list (bool, optional): Filter by waiting list status
+        sort_by (str, optional): last_name, first_name, school_class, created_at or id
+        sort_order (str, optional): Sort direction (asc, desc; default: asc)
+        page (int, optional): Page number; when present the response is paginated
+        per_page (int, optional): Number of enrollments per page (default: 50)
+        
+    Returns:
+        200: JSON response with the enrollments, and pagination data when sorted or paginated
+        400: JSON response with error message if the sort field is unknown
+    """
     is_waiting_list = request.args.get('is_waiting_list', type=lambda x: x.lower() == 'true')
     
+    sort_by = request.args.get('sort_by')
+    if sort_by or request.args.get('page'):
+        sort_by = sort_by or 'id'
+        if sort_by not in ENROLLMENT_SORTS:
+            return jsonify({'error': f'Campo di ordinamento non valido: {sort_by}'}), 400
+        sort_order = request.args.get('sort_order', 'asc')
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 50, type=int), 1), 500)
+        
+        ids = sorted_enrollment_ids(
+            slot_id, sort_by, sort_order == 'desc', is_waiting_list,
+            None if auth.current_user().is_admin else auth.current_user().id
+        )
+        page_ids = ids[(page - 1) * per_page:page * per_page]
+        enrollments = StudentEnrollment.query.filter(StudentEnrollment.id.in_(page_ids)) \
+            .options(*ENROLLMENT_STUDENT_LOADING).all()
+        Student.prefetch_pii([enrollment.student for enrollment in enrollments])
+        # Enrollments deleted since the index was read are left out of the page
+        by_id = {enrollment.id: enrollment for enrollment in enrollments}
+        pages = (len(ids) + per_page - 1) // per_page
+        
+        return jsonify({
+            'enrollments': [format_enrollment(by_id[i]) for i in page_ids if i in by_id],
+            'total': len(ids),
+            'pages': pages,
+            'current_page': page,
+            'has_next': page < pages,
+            'has_prev': page > 1,
+            'sort': {'sort_by': sort_by, 'sort_order': sort_order}
+        })
+    
     query = StudentEnrollment.query.filter_by(slot_id=slot_id)
     
     # Filter by waiting list status if specified
@@ -820,12 +961,131 @@ def get_slot_enrollments(slot_id):
     if not auth.current_user().is_admin:
         query = query.filter_by(user_id=auth.current_user().id)
     
-    enrollments = query.all()
+    enrollments = query.options(*ENROLLMENT_STUDENT_LOADING).all()
+    Student.prefetch_pii([enrollment.student for enrollment in enrollments])
     
     return jsonify({
         'enrollments': [format_enrollment(enrollment) for enrollment in enrollments]
     })
 
+# Columns of the enrollment export: (header, function returning the value of an enrollment)
+ENROLLMENT_EXPORT_COLUMNS = [
+    ('slot_date', lambda e: e.slot.date.isoformat()),
+    ('time_period', lambda e: e.slot.time_period.value),
+    ('department', lambda e: e.slot.department.value),
+    ('is_in_waiting_list', lambda e: 'true' if e.is_in_waiting_list else 'false'),
+    ('school_name', lambda e: e.student.school_name),
+    ('first_name', lambda e: e.student.first_name),
+    ('last_name', lambda e: e.student.last_name),
+    ('school_class', lambda e: e.student.school_class),
+    ('gender', lambda e: e.student.gender),
+    ('address', lambda e: e.student.address),
+    ('postal_code', lambda e: e.student.postal_code),
+    ('city', lambda e: e.student.city),
+    ('landline', lambda e: e.student.landline),
+    ('mobile', lambda e: e.student.mobile),
+]
+
+@slots.route('/enrollments/export', methods=['GET'])
+@auth.login_required
+@admin_required
+def export_enrollments():
+    """
+    Export the enrollments of many slots as a CSV file.
+    
+    The student data of all the exported enrollments is decrypted in one bulk
+    operation spread over several processes, so exporting a whole season stays
+    fast. This endpoint requires admin privileges.
+    
+    Query Parameters:
+        school_name (str, optional): Only export the students of this school
+        date_from (str, optional): First slot date included (YYYY-MM-DD)
+        date_to (str, optional): Last slot date included (YYYY-MM-DD)
+        
+    Returns:
+        200: CSV file with one row per enrollment
+        400: JSON response with error message if a date is invalid
+    """
+    query = StudentEnrollment.query.join(Slot).options(*ENROLLMENT_STUDENT_SLOT_LOADING)
+    try:
+        if request.args.get('date_from'):
+            query = query.filter(Slot.date >= datetime.strptime(request.args['date_from'], '%Y-%m-%d').date())
+        if request.args.get('date_to'):
+            query = query.filter(Slot.date <= datetime.strptime(request.args['date_to'], '%Y-%m-%d').date())
+    except ValueError:
+        return jsonify({'error': 'Formato data non valido, usare YYYY-MM-DD'}), 400
+    if request.args.get('school_name'):
+        query = query.join(Student).filter(Student.school_name == request.args['school_name'])
+    
+    enrollments = query.order_by(Slot.date, Slot.id, StudentEnrollment.id).all()
+    Student.prefetch_pii([enrollment.student for enrollment in enrollments])
+    
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow([header for header, _ in ENROLLMENT_EXPORT_COLUMNS])
+    for enrollment in enrollments:
+        writer.writerow([value(enrollment) for _, value in ENROLLMENT_EXPORT_COLUMNS])
+    
+    return Response(
+        output.getvalue(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=enrollments.csv'}
+    )
+
+# Most candidates decrypted for one student search
+STUDENT_SEARCH_MAX_CANDIDATES = 500
+
+@slots.route('/students/search', methods=['GET'])
+@auth.login_required
+def search_students():
+    """
+    Search students by the beginning of their first or last name.
+    
+    Names are encrypted, so the search goes through the blind prefix index
+    (see search.py): the candidates are found with an indexed lookup and only
+    their names are decrypted to confirm the match. Every word of the term must
+    start a word of the first or last name. Non-admin users only see the
+    students of their own school, or the students they enrolled if they have no
+    school.
+    
+    Query Parameters:
+        q (str): Search term, every word at least 3 characters long (e.g. 'ross')
+        school_name (str, optional): Only search the students of this school (admins only)
+        limit (int, optional): Maximum number of results (default 20, max 100)
+        
+    Returns:
+        200: JSON response with the matching students sorted by last and first name
+        400: JSON response with error message if the term is too short
+    """
+    words = search_words(request.args.get('q', ''))
+    if not words:
+        return jsonify({'error': f'Inserire almeno {SEARCH_PREFIX_MIN_LENGTH} caratteri per ogni parola'}), 400
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    
+    current_user = auth.current_user()
+    query = candidate_query(words)
+    if current_user.is_admin:
+        if request.args.get('school_name'):
+            query = query.filter(Student.school_name == request.args['school_name'])
+    elif current_user.school_name:
+        query = query.filter(Student.school_name == current_user.school_name)
+    else:
+        query = query.filter(Student.id.in_(
+            db.select(StudentEnrollment.student_id).where(StudentEnrollment.user_id == current_user.id)
+        ))
+    
+    candidates = query.order_by(Student.id).limit(STUDENT_SEARCH_MAX_CANDIDATES).all()
+    Student.prefetch_pii(candidates)
+    students = sorted(
+        (student for student in candidates if matches(student, words)),
+        key=lambda student: ((student.last_name or '').lower(), (student.first_name or '').lower(), student.id)
+    )
+    
+    return jsonify({
+        'students': [format_student(student) for student in students[:limit]],
+        'truncated': len(students) > limit or len(candidates) == STUDENT_SEARCH_MAX_CANDIDATES
+    })
+
 @slots.route('/students/<int:student_id>', methods=['PUT'])
 @auth.login_required
 def update_student(student_id):
@@ -901,6 +1161,7 @@ def update_student(student_id):
             # If we found a duplicate, we'll merge the enrollments into the existing student
             # Get all enrollments for the current student
             enrollments = StudentEnrollment.query.filter_by(student_id=student_id).all()
+            merged_slot_ids = [enrollment.slot_id for enrollment in enrollments]
             
             # Update each enrollment to use the duplicate student ID
             for enrollment in enrollments:
@@ -920,6 +1181,7 @@ def update_student(student_id):
             # Delete the current student since all enrollments have been moved
             db.session.delete(student)
             db.session.commit()
+            invalidate_slot_cache(*merged_slot_ids)
             
             return jsonify({
                 'message': 'Student merged with existing identical student',
@@ -948,7 +1210,10 @@ def update_student(student_id):
         if 'mobile' in data:
             student.mobile = data['mobile']
             
+        # The student's slots lose their confirmation, their cached listings must be refreshed
+        slot_ids = [enrollment.slot_id for enrollment in student.enrollments]
         db.session.commit()
+        invalidate_slot_cache(*slot_ids)
         return jsonify({
             'message': 'Student updated successfully',
             'student': format_student(student)
@@ -997,7 +1262,7 @@ def get_slot_letters(slot_id):
     except ValueError as e:
         return jsonify({"error": str(e)}), 404
     except Exception as e:
-        print(str(e))
+        logger.exception("Failed to generate letters for slot %s", slot_id)
         return jsonify({"error": "Failed to generate letters " + str(e)}), 500
 
 @slots.route('/<int:slot_id>/confirm', methods=['POST'])
@@ -1027,30 +1292,34 @@ def confirm_slot(slot_id):
         # First confirm the slot
         slot.is_confirmed = True
         db.session.commit()
+        invalidate_slot_cache(slot_id)
         
         # Get all non-waitlist enrollments for this slot
         enrollments = StudentEnrollment.query.filter_by(
             slot_id=slot_id,
             is_in_waiting_list=False
-        ).all()
+        ).options(*ENROLLMENT_STUDENT_LOADING).all()
         
-        # Group students by school and collect associated users
+        # Decrypt the names of all the students at once
+        Student.prefetch_pii([enrollment.student for enrollment in enrollments])
+        
+        # Group students by school
         school_data = {}
         for enrollment in enrollments:
             school_name = enrollment.student.school_name
             if school_name not in school_data:
-                # Get all non-admin users associated with this school
-                school_users = User.query.filter_by(
-                    school_name=school_name,
-                    is_admin=False
-                ).all()
-                
-                school_data[school_name] = {
-                    'students': [],
-                    'users': school_users
-                }
+                school_data[school_name] = {'students': [], 'users': []}
             school_data[school_name]['students'].append(enrollment.student)
         
+        # Get the non-admin users of all these schools with one query
+        # (students without a school are notified to the users without a school)
+        school_condition = User.school_name.in_([name for name in school_data if name is not None])
+        if None in school_data:
+            school_condition = db.or_(school_condition, User.school_name.is_(None))
+        school_users = User.query.filter(school_condition, User.is_admin == False).all() if school_data else []
+        for user in school_users:
+            school_data[user.school_name]['users'].append(user)
+        
         # Send emails to each school's users
         for school_name, data in school_data.items():
             if not data['users']:  # Skip if no users found for school
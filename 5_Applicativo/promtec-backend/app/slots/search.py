@@ -0,0 +1,172 @@
+"""
+Student Search Index Module.
+
+This module maintains the blind prefix index used to search students by name
+and builds the queries that use it.
+
+Student names are encrypted, so they cannot be compared in SQL. Instead every
+student has keyed tokens of the prefixes of the words of its first and last
+name, kept up to date by mapper events on the Student model. A search looks up
+the token of each word of the term, and only the few matching rows are
+decrypted to confirm the match.
+"""
+from sqlalchemy import delete, insert, select
+from app.extensions import db
+from app.user_management.search import normalize
+from app.utils.crypto_utils import blind_index
+from .models import Student, StudentSearchToken
+
+# Fields of the Student model covered by the search
+SEARCH_FIELDS = ('first_name', 'last_name')
+
+# Shortest and longest indexed prefix; longer terms are looked up by their first
+# SEARCH_PREFIX_MAX_LENGTH characters and confirmed after decryption
+SEARCH_PREFIX_MIN_LENGTH = 3
+SEARCH_PREFIX_MAX_LENGTH = 10
+
+
+def name_prefixes(value):
+    """
+    Get the indexed prefixes of a name.
+
+    Args:
+        value (str): The name, possibly made of several words
+
+    Returns:
+        set: The normalized prefixes of every word
+    """
+    prefixes = set()
+    for word in normalize(value).split():
+        for length in range(SEARCH_PREFIX_MIN_LENGTH, min(len(word), SEARCH_PREFIX_MAX_LENGTH) + 1):
+            prefixes.add(word[:length])
+    return prefixes
+
+
+def student_tokens(student):
+    """Get the index tokens of a student"""
+    prefixes = set()
+    for field in SEARCH_FIELDS:
+        prefixes |= name_prefixes(getattr(student, field))
+    return {blind_index(prefix) for prefix in prefixes}
+
+
+def write_student_tokens(connection, student_id, tokens):
+    """
+    Replace the index entries of a student.
+
+    Args:
+        connection: The database connection of the current transaction
+        student_id (int): ID of the student
+        tokens (set): The tokens to store
+    """
+    connection.execute(delete(StudentSearchToken).where(StudentSearchToken.student_id == student_id))
+    if tokens:
+        connection.execute(
+            insert(StudentSearchToken),
+            [{'student_id': student_id, 'token': token} for token in tokens]
+        )
+
+
+def _student_inserted(mapper, connection, target):
+    """Index a newly created student"""
+    write_student_tokens(connection, target.id, student_tokens(target))
+
+
+def _student_updated(mapper, connection, target):
+    """Re-index a student when its names (or its envelope record) changed"""
+    state = db.inspect(target)
+    if any(state.attrs[column].history.has_changes() for column in ('_first_name', '_last_name', '_pii')):
+        write_student_tokens(connection, target.id, student_tokens(target))
+
+
+db.event.listen(Student, 'after_insert', _student_inserted)
+db.event.listen(Student, 'after_update', _student_updated)
+
+
+def search_words(term):
+    """
+    Split a search term into the normalized words to look up.
+
+    Args:
+        term (str): The search term
+
+    Returns:
+        list: The words, or an empty list if a word is shorter than SEARCH_PREFIX_MIN_LENGTH
+    """
+    words = normalize(term).split()
+    if any(len(word) < SEARCH_PREFIX_MIN_LENGTH for word in words):
+        return []
+    return words
+
+
+def candidate_query(words):
+    """
+    Build the query of the students whose names may match every word.
+
+    Args:
+        words (list): Normalized words returned by search_words
+
+    Returns:
+        The SQLAlchemy query of candidate students
+    """
+    query = Student.query
+    for word in words:
+        token = blind_index(word[:SEARCH_PREFIX_MAX_LENGTH])
+        query = query.filter(Student.id.in_(
+            select(StudentSearchToken.student_id).where(StudentSearchToken.token == token)
+        ))
+    return query
+
+
+def matches(student, words):
+    """
+    Check on the decrypted names that every word starts a word of the names.
+
+    Args:
+        student (Student): A candidate student
+        words (list): Normalized words returned by search_words
+
+    Returns:
+        bool: True if the student matches the search
+    """
+    name_words = normalize(f'{student.first_name} {student.last_name}').split()
+    return all(any(name_word.startswith(word) for name_word in name_words) for word in words)
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Rebuild the search index of every student.
+
+    Used to populate the index for students created before it existed, or
+    after the index key changed. The names of each batch are decrypted in bulk,
+    and the old entries of the batch are replaced by the new ones in a single
+    transaction, so searches keep finding every student while the index is
+    rebuilt.
+
+    Args:
+        batch_size (int): Number of students indexed per transaction
+
+    Returns:
+        int: The number of indexed students
+    """
+    count = 0
+    last_id = 0
+    while True:
+        students = Student.query.filter(Student.id > last_id).order_by(Student.id).limit(batch_size).all()
+        if not students:
+            break
+        Student.prefetch_pii(students)
+        rows = [
+            {'student_id': student.id, 'token': token}
+            for student in students
+            for token in student_tokens(student)
+        ]
+        db.session.execute(delete(StudentSearchToken).where(
+            StudentSearchToken.student_id.in_([student.id for student in students])))
+        if rows:
+            db.session.execute(insert(StudentSearchToken), rows)
+        db.session.commit()
+        count += len(students)
+        last_id = students[-1].id
+        db.session.expunge_all()
+    return count
@@ -0,0 +1,120 @@
+"""
+Enrollment Sort Index Module.
+
+This module keeps, for each slot, the decrypted sort keys of its enrollments,
+so the enrollment list of a slot can be sorted by student name or class and
+paginated on the server.
+
+Student names are encrypted, so the database cannot order them. The first
+request for a slot decrypts the names of its students once and caches the
+small (enrollment, sort keys) index in the worker. Later requests only
+compute a change marker of the slot from the ciphertexts, without decrypting
+them, and sort the cached index; the student data is then loaded and
+decrypted for the rows of the requested page only.
+"""
+import hashlib
+import os
+from sqlalchemy import select
+from app.extensions import db
+from app.user_management.search import normalize
+from app.utils.lru import LRUCache
+from app.utils.stats import register_stats_provider
+from .models import ENROLLMENT_STUDENT_LOADING, Student, StudentEnrollment
+
+# Sort indexes of the most recently listed slots (slot ID -> (marker, entries))
+_sort_indexes = LRUCache(
+    maxsize=int(os.environ.get('ENROLLMENT_SORT_INDEX_SIZE', 256)),
+    ttl=float(os.environ.get('ENROLLMENT_SORT_INDEX_TTL', 600))
+)
+register_stats_provider('enrollment_sort_index', _sort_indexes.stats)
+
+# Sort fields: function building the sort key of an index entry, ties broken by enrollment ID
+ENROLLMENT_SORTS = {
+    'last_name': lambda entry: (entry['last_name'], entry['first_name'], entry['id']),
+    'first_name': lambda entry: (entry['first_name'], entry['last_name'], entry['id']),
+    'school_class': lambda entry: (entry['school_class'], entry['last_name'], entry['first_name'], entry['id']),
+    'created_at': lambda entry: (entry['created_at'], entry['id']),
+    'id': lambda entry: entry['id'],
+}
+
+
+def slot_marker(slot_id):
+    """
+    Get a value that changes whenever the enrollments of a slot or their students change.
+
+    The marker is a hash of the enrollment rows and of the ciphertexts of the
+    sorted student fields. Fernet ciphertexts change on every write, so any
+    edit of a name or class is detected without decrypting anything, even
+    when it happens within the same second as the previous one.
+
+    Args:
+        slot_id (int): ID of the slot
+
+    Returns:
+        str: The change marker
+    """
+    rows = db.session.execute(
+        select(StudentEnrollment.id, StudentEnrollment.user_id, StudentEnrollment.is_in_waiting_list,
+               StudentEnrollment.student_id, Student._last_name, Student._first_name,
+               Student._school_class, Student._pii)
+        .join(Student, StudentEnrollment.student_id == Student.id)
+        .where(StudentEnrollment.slot_id == slot_id)
+        .order_by(StudentEnrollment.id)
+    ).all()
+    return hashlib.sha1(repr([tuple(row) for row in rows]).encode()).hexdigest()
+
+
+def build_sort_index(slot_id):
+    """
+    Decrypt the sort keys of every enrollment of a slot.
+
+    Args:
+        slot_id (int): ID of the slot
+
+    Returns:
+        list: One dict per enrollment with its ID, filter values and normalized sort keys
+    """
+    enrollments = StudentEnrollment.query.filter_by(slot_id=slot_id) \
+        .options(*ENROLLMENT_STUDENT_LOADING).all()
+    Student.prefetch_pii([enrollment.student for enrollment in enrollments])
+    return [{
+        'id': enrollment.id,
+        'user_id': enrollment.user_id,
+        'is_in_waiting_list': bool(enrollment.is_in_waiting_list),
+        'created_at': enrollment.created_at.isoformat() if enrollment.created_at else '',
+        'last_name': normalize(enrollment.student.last_name),
+        'first_name': normalize(enrollment.student.first_name),
+        'school_class': normalize(enrollment.student.school_class),
+    } for enrollment in enrollments]
+
+
+def sorted_enrollment_ids(slot_id, sort_by, descending, is_waiting_list=None, user_id=None):
+    """
+    Get the IDs of the enrollments of a slot in the requested order.
+
+    The cached index of the slot is reused while its change marker is
+    unchanged, otherwise it is rebuilt.
+
+    Args:
+        slot_id (int): ID of the slot
+        sort_by (str): Key of ENROLLMENT_SORTS
+        descending (bool): Whether to sort in descending order
+        is_waiting_list (bool, optional): Only keep enrollments with this waiting list status
+        user_id (int, optional): Only keep the enrollments created by this user
+
+    Returns:
+        list: The sorted enrollment IDs
+    """
+    marker = slot_marker(slot_id)
+    cached = _sort_indexes.get(slot_id)
+    if cached is None or cached[0] != marker:
+        cached = (marker, build_sort_index(slot_id))
+        _sort_indexes.set(slot_id, cached)
+
+    entries = [
+        entry for entry in cached[1]
+        if (is_waiting_list is None or entry['is_in_waiting_list'] == is_waiting_list)
+        and (user_id is None or entry['user_id'] == user_id)
+    ]
+    entries.sort(key=ENROLLMENT_SORTS[sort_by], reverse=descending)
+    return [entry['id'] for entry in entries]
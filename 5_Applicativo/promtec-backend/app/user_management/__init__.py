@@ -16,4 +16,4 @@ user_management = Blueprint('user_management', __name__)
 
 # Import routes to register them with the blueprint
 # Import is at the bottom to avoid circular import issues
-from . import routes
\ No newline at end of file
+from . import routes, models
\ No newline at end of file
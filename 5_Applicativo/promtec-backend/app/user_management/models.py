@@ -0,0 +1,30 @@
+"""
+User Management Models Module.
+
+This module defines the data models supporting the administrative user listings.
+"""
+from ..extensions import db  # Database ORM instance
+
+
+class UserSearchToken(db.Model):
+    """
+    Trigram index entry for the user search.
+
+    Every user has one row per distinct trigram of the normalized email, first
+    name and last name. A substring search only has to look up the trigrams of
+    the search term through the (token, user_id) index instead of scanning the
+    whole user table with a leading-wildcard LIKE.
+
+    Attributes:
+        id (int): Primary key identifier for the index entry
+        token (str): Normalized trigram (lower case, without accents)
+        user_id (int): Foreign key to the indexed user
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(12), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (
+        db.Index('idx_user_search_token', token, user_id),
+        db.Index('idx_user_search_token_user', user_id),
+    )
@@ -1,3 +1,4 @@
+from datetime import datetime
 from flask import jsonify, request
 from app.security.models import User, UserApproval
 from app.extensions import db
@@ -7,6 +8,8 @@ from . import user_management
 from werkzeug.security import generate_password_hash
 from sqlalchemy import desc, and_, exists
 from app.utils.email_utils import send_account_approval_email
+from app.utils.pagination import cursor_page, estimated_count, page_size
+from .search import search_condition, relevance
 
 def apply_filters(query, filters):
     if filters.get('school_name'):
@@ -20,36 +23,91 @@ def apply_filters(query, filters):
     return query
 
 def apply_search(query, search):
+    # Substring search answered through the trigram index (see search.py)
     if search:
-        search_term = f"%{search}%"
-        return query.filter(db.or_(
-            User.email.ilike(search_term),
-            User.first_name.ilike(search_term),
-            User.last_name.ilike(search_term)
-        ))
+        return query.filter(search_condition(search))
     return query
 
-def apply_sorting(query, sort_by, sort_order):
+def apply_sorting(query, sort_by, sort_order, search=None):
+    if sort_by == 'relevance' and search:
+        # Best matches first, ties in a stable order
+        return query.order_by(relevance(search), User.id)
     if sort_by in ['id', 'email', 'first_name', 'last_name', 'school_name', 'created_at']:
         sort_column = getattr(User, sort_by)
         return query.order_by(sort_column.desc() if sort_order == 'desc' else sort_column)
     return query
 
 def get_pagination_params():
+    search = request.args.get('search', '').strip()
+    cursor = request.args.get('cursor')
     return {
         'page': request.args.get('page', 1, type=int),
-        'per_page': request.args.get('per_page', 10, type=int),
-        'sort_by': request.args.get('sort_by', 'id'),
+        'per_page': page_size(request.args.get('per_page', type=int)),
+        # Search results are ranked by relevance unless another order is requested
+        # (relevance is not available in cursor pagination mode)
+        'sort_by': request.args.get('sort_by', 'relevance' if search and cursor is None else 'id'),
         'sort_order': request.args.get('sort_order', 'asc'),
-        'search': request.args.get('search', '').strip(),
+        'search': search,
         'filters': {
             'school_name': request.args.get('school_name'),
             'is_admin': request.args.get('is_admin', type=lambda x: x.lower() == 'true'),
             'is_active': request.args.get('is_active', type=lambda x: x.lower() == 'true'),
             'is_approved': request.args.get('is_approved', type=lambda x: x.lower() == 'true'),
-        }
+        },
+        # Keyset pagination, enabled when the cursor parameter is present (empty for the first page)
+        'cursor': cursor,
+        'with_count': request.args.get('with_count', 'false').lower() == 'true'
     }
 
+# Sort fields supported by cursor pagination: (SQL expression, getter of the row value)
+# Nullable columns are compared through COALESCE because NULL never satisfies a keyset condition
+# (users without a creation date sort as created at the epoch, before all the others)
+NO_CREATED_AT = datetime(1970, 1, 1)
+USER_CURSOR_SORTS = {
+    'id': (User.id, lambda user: user.id),
+    'email': (User.email, lambda user: user.email),
+    'first_name': (db.func.coalesce(User.first_name, ''), lambda user: user.first_name or ''),
+    'last_name': (db.func.coalesce(User.last_name, ''), lambda user: user.last_name or ''),
+    'school_name': (db.func.coalesce(User.school_name, ''), lambda user: user.school_name or ''),
+    'created_at': (db.func.coalesce(User.created_at, NO_CREATED_AT), lambda user: user.created_at or NO_CREATED_AT),
+}
+
+def cursor_response(query, params):
+    """
+    Build the response of a user listing in cursor pagination mode.
+    
+    Args:
+        query: The filtered and searched user query
+        params (dict): The parameters returned by get_pagination_params
+        
+    Returns:
+        The JSON response, or a 400 error for an invalid cursor or an ordering
+        not supported in cursor mode (such as relevance)
+    """
+    sort_by = params['sort_by']
+    if sort_by not in USER_CURSOR_SORTS:
+        return jsonify({'error': 'Ordinamento non supportato con la paginazione a cursore'}), 400
+    sort_expr, sort_getter = USER_CURSOR_SORTS[sort_by]
+    try:
+        page = cursor_page(query, sort_by, sort_expr, sort_getter, User.id,
+                           params['sort_order'] == 'desc', params['cursor'], params['per_page'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    total = None
+    if params['with_count']:
+        cache_key = (request.endpoint, params['search'], tuple(sorted(params['filters'].items())))
+        total = estimated_count(cache_key, query)
+    
+    return jsonify({
+        'users': format_user_list(page['items']),
+        'total': total,
+        'next_cursor': page['next_cursor'],
+        'has_next': page['has_next'],
+        'filters': params['filters'],
+        'sort': {'sort_by': sort_by, 'sort_order': params['sort_order']}
+    })
+
 def format_user_list(users):
     return [{
         'id': user.id,
@@ -76,14 +134,18 @@ def get_users():
     
     Query Parameters:
         page (int): Page number for pagination (default: 1)
-        per_page (int): Number of items per page (default: 10)
-        sort_by (str): Field to sort by (default: 'id')
+        per_page (int): Number of items per page (default: 10, at most 100)
+        sort_by (str): Field to sort by (default: 'relevance' when searching, otherwise 'id';
+                       relevance is not available with a cursor)
         sort_order (str): 'asc' or 'desc' (default: 'asc')
         search (str): Search term for filtering by name or email
         school_name (str): Filter by school name
         is_admin (bool): Filter by admin status
         is_active (bool): Filter by active status
         is_approved (bool): Filter by approval status
+        cursor (str): Enables cursor pagination; empty for the first page, then
+                      the next_cursor value of the previous response
+        with_count (bool): In cursor mode, include an estimated total (default: false)
         
     Returns:
         200: JSON response with paginated user list and metadata
@@ -95,7 +157,11 @@ def get_users():
     
     query = apply_filters(query, params['filters'])
     query = apply_search(query, params['search'])
-    query = apply_sorting(query, params['sort_by'], params['sort_order'])
+    
+    if params['cursor'] is not None:
+        return cursor_response(query, params)
+    
+    query = apply_sorting(query, params['sort_by'], params['sort_order'], params['search'])
     
     pagination = query.paginate(page=params['page'], per_page=params['per_page'], error_out=False)
     
@@ -126,14 +192,18 @@ def get_approved_users():
     
     Query Parameters:
         page (int): Page number for pagination (default: 1)
-        per_page (int): Number of items per page (default: 10)
-        sort_by (str): Field to sort by (default: 'id')
+        per_page (int): Number of items per page (default: 10, at most 100)
+        sort_by (str): Field to sort by (default: 'relevance' when searching, otherwise 'id';
+                       relevance is not available with a cursor)
         sort_order (str): 'asc' or 'desc' (default: 'asc')
         search (str): Search term for filtering by name or email
         school_name (str): Filter by school name
         is_admin (bool): Filter by admin status
         is_active (bool): Filter by active status
         is_approved (bool): Filter by approval status
+        cursor (str): Enables cursor pagination; empty for the first page, then
+                      the next_cursor value of the previous response
+        with_count (bool): In cursor mode, include an estimated total (default: false)
         
     Returns:
         200: JSON response with paginated approved user list and metadata
@@ -176,7 +246,11 @@ def get_approved_users():
     
     query = apply_filters(query, params['filters'])
     query = apply_search(query, params['search'])
-    query = apply_sorting(query, params['sort_by'], params['sort_order'])
+    
+    if params['cursor'] is not None:
+        return cursor_response(query, params)
+    
+    query = apply_sorting(query, params['sort_by'], params['sort_order'], params['search'])
     
     pagination = query.paginate(page=params['page'], per_page=params['per_page'], error_out=False)
     
@@ -204,14 +278,18 @@ def get_pending_users():
     
     Query Parameters:
         page (int): Page number for pagination (default: 1)
-        per_page (int): Number of items per page (default: 10)
-        sort_by (str): Field to sort by (default: 'id')
+        per_page (int): Number of items per page (default: 10, at most 100)
+        sort_by (str): Field to sort by (default: 'relevance' when searching, otherwise 'id';
+                       relevance is not available with a cursor)
         sort_order (str): 'asc' or 'desc' (default: 'asc')
         search (str): Search term for filtering by name or email
         school_name (str): Filter by school name
         is_admin (bool): Filter by admin status
         is_active (bool): Filter by active status
         is_approved (bool): Filter by approval status
+        cursor (str): Enables cursor pagination; empty for the first page, then
+                      the next_cursor value of the previous response
+        with_count (bool): In cursor mode, include an estimated total (default: false)
         
     Returns:
         200: JSON response with paginated pending user list and metadata
@@ -231,7 +309,11 @@ def get_pending_users():
     
     query = apply_filters(query, params['filters'])
     query = apply_search(query, params['search'])
-    query = apply_sorting(query, params['sort_by'], params['sort_order'])
+    
+    if params['cursor'] is not None:
+        return cursor_response(query, params)
+    
+    query = apply_sorting(query, params['sort_by'], params['sort_order'], params['search'])
     
     pagination = query.paginate(page=params['page'], per_page=params['per_page'], error_out=False)
     
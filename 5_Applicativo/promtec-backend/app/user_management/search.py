@@ -0,0 +1,203 @@
+"""
+User Search Index Module.
+
+This module maintains the trigram index used by the user administration listings
+and builds the search conditions that use it.
+
+The index is kept up to date by mapper events on the User model, so every insert
+or update of an email or name rewrites the trigrams of that user in the same
+transaction. A search term of at least three characters is answered by looking up
+its trigrams in the index; the remaining LIKE check only runs on the few
+candidate rows to discard false positives.
+"""
+import unicodedata
+from sqlalchemy import case, delete, func, insert, select
+from app.extensions import db
+from app.security.models import User
+from .models import UserSearchToken
+
+# Fields of the User model covered by the search
+SEARCH_FIELDS = ('email', 'first_name', 'last_name')
+
+# Shortest term that can be answered through the trigram index
+MIN_INDEXED_TERM_LENGTH = 3
+
+
+def normalize(value):
+    """
+    Normalize a value for indexing: lower case and without accents.
+
+    Args:
+        value (str): The value to normalize, or None
+
+    Returns:
+        str: The normalized value ('' for None)
+    """
+    if not value:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', value.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).strip()
+
+
+def value_trigrams(value):
+    """
+    Get the trigrams of an indexed value.
+
+    The value is padded with two leading spaces and one trailing space, so that
+    short values and word boundaries still produce trigrams.
+
+    Args:
+        value (str): The field value
+
+    Returns:
+        set: The distinct trigrams of the value
+    """
+    normalized = normalize(value)
+    if not normalized:
+        return set()
+    padded = f'  {normalized} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def term_trigrams(term):
+    """
+    Get the trigrams a value must contain to contain the search term.
+
+    Args:
+        term (str): The search term
+
+    Returns:
+        set: The distinct trigrams of the term (empty if the term is too short)
+    """
+    normalized = normalize(term)
+    return {normalized[i:i + 3] for i in range(len(normalized) - 2)}
+
+
+def user_trigrams(user):
+    """Get the trigrams of every searchable field of a user"""
+    tokens = set()
+    for field in SEARCH_FIELDS:
+        tokens |= value_trigrams(getattr(user, field))
+    return tokens
+
+
+def write_user_tokens(connection, user_id, tokens):
+    """
+    Replace the index entries of a user.
+
+    Args:
+        connection: The database connection of the current transaction
+        user_id (int): ID of the user
+        tokens (set): The trigrams to store
+    """
+    connection.execute(delete(UserSearchToken).where(UserSearchToken.user_id == user_id))
+    if tokens:
+        connection.execute(
+            insert(UserSearchToken),
+            [{'user_id': user_id, 'token': token} for token in tokens]
+        )
+
+
+def _user_inserted(mapper, connection, target):
+    """Index a newly created user"""
+    write_user_tokens(connection, target.id, user_trigrams(target))
+
+
+def _user_updated(mapper, connection, target):
+    """Re-index a user when one of the searchable fields changed"""
+    state = db.inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in SEARCH_FIELDS):
+        write_user_tokens(connection, target.id, user_trigrams(target))
+
+
+db.event.listen(User, 'after_insert', _user_inserted)
+db.event.listen(User, 'after_update', _user_updated)
+
+
+def search_condition(term):
+    """
+    Build the filter condition selecting the users matching a search term.
+
+    Args:
+        term (str): The search term
+
+    Returns:
+        The SQLAlchemy condition: users containing the term in their email,
+        first name or last name
+    """
+    like_term = f"%{term}%"
+    matches = db.or_(
+        User.email.ilike(like_term),
+        User.first_name.ilike(like_term),
+        User.last_name.ilike(like_term)
+    )
+
+    tokens = term_trigrams(term)
+    if len(normalize(term)) < MIN_INDEXED_TERM_LENGTH or not tokens:
+        # Terms shorter than a trigram cannot use the index
+        return matches
+
+    # Users having every trigram of the term are the only possible matches
+    candidates = select(UserSearchToken.user_id).where(
+        UserSearchToken.token.in_(tokens)
+    ).group_by(UserSearchToken.user_id).having(
+        func.count(func.distinct(UserSearchToken.token)) == len(tokens)
+    )
+    return db.and_(User.id.in_(candidates), matches)
+
+
+def relevance(term):
+    """
+    Build an ordering expression ranking users by how well they match a term.
+
+    Exact matches of a field come first, then fields starting with the term,
+    then the remaining substring matches.
+
+    Args:
+        term (str): The search term
+
+    Returns:
+        The SQLAlchemy expression to use in ORDER BY (lower is better)
+    """
+    fields = [getattr(User, field) for field in SEARCH_FIELDS]
+    lowered = term.lower()
+    return case(
+        (db.or_(*[func.lower(field) == lowered for field in fields]), 0),
+        (db.or_(*[field.ilike(f"{term}%") for field in fields]), 1),
+        else_=2
+    )
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Rebuild the search index of every user.
+
+    Used to populate the index for users created before it existed. Users are
+    processed in batches, and the old entries of a batch are replaced by the
+    new ones in a single transaction, so searches keep finding every user
+    while the index is rebuilt.
+
+    Args:
+        batch_size (int): Number of users indexed per transaction
+
+    Returns:
+        int: The number of indexed users
+    """
+    count = 0
+    last_id = 0
+    while True:
+        users = User.query.filter(User.id > last_id).order_by(User.id).limit(batch_size).all()
+        if not users:
+            break
+        rows = [
+            {'user_id': user.id, 'token': token}
+            for user in users
+            for token in user_trigrams(user)
+        ]
+        db.session.execute(delete(UserSearchToken).where(UserSearchToken.user_id.in_([user.id for user in users])))
+        if rows:
+            db.session.execute(insert(UserSearchToken), rows)
+        db.session.commit()
+        count += len(users)
+        last_id = users[-1].id
+    return count
@@ -4,21 +4,195 @@ Cryptography Utilities Module.
 This module provides utilities for encrypting and decrypting sensitive data
 using the Fernet symmetric encryption algorithm from the cryptography package.
 The encryption key is loaded from environment variables for security.
+
+FERNET_KEYS may list several comma-separated keys (newest first) to rotate the
+key without downtime: new values are always encrypted with the first key, while
+values encrypted with any of the listed keys can still be decrypted until
+scripts/rotate_encryption_key.py has re-encrypted them. FERNET_KEY is used when
+FERNET_KEYS is not set.
+
+Decrypted values are kept in a bounded, process-local LRU cache keyed by the
+SHA-256 digest of the ciphertext, so the same token is only decrypted once per
+worker while it stays in the cache. The size and lifetime of the cache are set
+with the DECRYPT_CACHE_SIZE and DECRYPT_CACHE_TTL environment variables
+(DECRYPT_CACHE_SIZE=0 disables it). Counters of the performed and saved AES
+operations are kept per worker and per request.
+
+Tokens can be handled in their usual base64 text form or as raw bytes, which
+are a quarter smaller and are stored in binary columns (see encrypted_type.py).
+
+Large batches of values (exports, reports) can be decrypted with decrypt_many,
+which spreads them in chunks over a pool of processes, so the decryption runs
+on several cores instead of the single request thread.
 """
-from cryptography.fernet import Fernet  # Symmetric encryption implementation
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet  # Symmetric encryption implementation
+import atexit  # For clearing the cache on shutdown
 import base64  # For encoding and decoding binary data
+import hashlib  # For the cache keys
+import hmac  # For the blind search index
+import multiprocessing  # For the bulk decryption pool
+import json  # For serializing encrypted records
+import logging  # For the per-request counters
 import os  # For accessing environment variables
+import threading  # For the global counters
+from collections import deque  # For the recent request counters
+from concurrent.futures import ProcessPoolExecutor  # For the bulk decryption pool
+from concurrent.futures.process import BrokenProcessPool  # Raised when a pool process dies
 from dotenv import load_dotenv  # For loading environment variables from .env file
+from flask import g, has_request_context, request  # Per-request counters
+from .lru import LRUCache  # Bounded cache of decrypted values
+from .metrics import FERNET_OPERATIONS  # Exported to Prometheus
+from .tracing import span  # Time of the operations in the request traces
+from .stats import register_stats_provider  # Exposed through the monitoring endpoint
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Get the encryption key from environment variables
+# Get the encryption keys from environment variables, the first one encrypts new values
 FERNET_KEY = os.environ.get('FERNET_KEY')
-# Initialize the Fernet encryption system with the key
-fernet = Fernet(FERNET_KEY)
+FERNET_KEYS = [key.strip() for key in os.environ.get('FERNET_KEYS', FERNET_KEY or '').split(',') if key.strip()]
+# Key used to encrypt new values
+primary_fernet = Fernet(FERNET_KEYS[0] if FERNET_KEYS else FERNET_KEY)
+# Initialize the Fernet encryption system: encrypts with the first key, decrypts with any of them
+fernet = MultiFernet([primary_fernet] + [Fernet(key) for key in FERNET_KEYS[1:]])
+# First byte of every Fernet token
+FERNET_VERSION = 0x80
+
+# Key of the blind search index. It is independent of the encryption keys so a key
+# rotation leaves the index valid; changing it requires rebuilding the index.
+# Required: the application factory refuses to start without it
+SEARCH_INDEX_KEY = os.environ.get('STUDENT_SEARCH_KEY', '').encode()
+
+# Plaintexts of recently used ciphertexts (sha256 digest -> plaintext)
+DECRYPT_CACHE_SIZE = int(os.environ.get('DECRYPT_CACHE_SIZE', '10000'))
+DECRYPT_CACHE_TTL = int(os.environ.get('DECRYPT_CACHE_TTL', '600'))
+_decrypt_cache = LRUCache(maxsize=DECRYPT_CACHE_SIZE, ttl=DECRYPT_CACHE_TTL or None)
+
+# Bulk decryption: processes of the pool, smallest batch sent to the pool and values per task
+DECRYPT_POOL_WORKERS = int(os.environ.get('DECRYPT_POOL_WORKERS', str(min(4, os.cpu_count() or 1))))
+DECRYPT_POOL_MIN_ITEMS = int(os.environ.get('DECRYPT_POOL_MIN_ITEMS', '2000'))
+DECRYPT_POOL_CHUNK_SIZE = int(os.environ.get('DECRYPT_POOL_CHUNK_SIZE', '500'))
+# Pools created on first use, by number of processes
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Worker-wide counters of AES operations
+_counters = {'encrypts': 0, 'decrypts': 0, 'cache_hits': 0, 'memo_hits': 0,
+             'requests': 0, 'max_saved_per_request': 0}
+_counters_lock = threading.Lock()
+# Counters of the last requests that used the cipher: (method, path, decrypts, saved)
+_recent_requests = deque(maxlen=20)
+# Prometheus counters of the operations, resolved once per label
+_operation_metrics = {name: FERNET_OPERATIONS.labels(name) for name in ('encrypts', 'decrypts', 'cache_hits', 'memo_hits')}
+
+
+def _count(name):
+    """Increment a worker-wide counter and the counter of the current request"""
+    with _counters_lock:
+        _counters[name] += 1
+    _operation_metrics[name].inc()
+    if has_request_context():
+        if 'crypto_ops' not in g:
+            g.crypto_ops = {'encrypts': 0, 'decrypts': 0, 'cache_hits': 0, 'memo_hits': 0}
+        g.crypto_ops[name] += 1
+
+
+def _cache_key(token):
+    return hashlib.sha256(token).digest()
+
+
+def record_memo_hit():
+    """Count a decryption avoided by the per-instance memo of a model"""
+    _count('memo_hits')
 
-def encrypt_value(value):
+
+def record_request_crypto_ops(response):
+    """
+    Add the counters of the finished request to the worker statistics.
+
+    Registered as an after_request handler by the application factory.
+
+    Args:
+        response: The Flask response, returned unchanged
+    """
+    ops = g.pop('crypto_ops', None)
+    if ops:
+        saved = ops['cache_hits'] + ops['memo_hits']
+        with _counters_lock:
+            _counters['requests'] += 1
+            _counters['max_saved_per_request'] = max(_counters['max_saved_per_request'], saved)
+            _recent_requests.append({
+                'request': f'{request.method} {request.path}',
+                'decrypts': ops['decrypts'],
+                'encrypts': ops['encrypts'],
+                'saved': saved,
+            })
+        logger.debug("%s %s: %d decryptions, %d saved by the caches",
+                     request.method, request.path, ops['decrypts'], saved)
+    return response
+
+
+def crypto_stats():
+    """Return the AES operation counters and the state of the decrypt cache"""
+    with _counters_lock:
+        stats = dict(_counters)
+        stats['recent_requests'] = list(_recent_requests)
+    stats['saved'] = stats['cache_hits'] + stats['memo_hits']
+    stats['avg_saved_per_request'] = round(stats['saved'] / stats['requests'], 2) if stats['requests'] else None
+    stats['cache'] = _decrypt_cache.stats()
+    stats['keys'] = max(len(FERNET_KEYS), 1)
+    return stats
+
+
+def clear_decrypt_cache():
+    """
+    Drop every cached plaintext.
+
+    Called on shutdown and after a key rotation. Python strings are immutable
+    and cannot be overwritten in place, so this removes the last references held
+    by the cache and lets the memory be reclaimed.
+    """
+    _decrypt_cache.clear()
+
+
+def shutdown_decrypt_pools():
+    """Stop the processes of the bulk decryption pools"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
+
+
+register_stats_provider('crypto', crypto_stats)
+atexit.register(clear_decrypt_cache)
+atexit.register(shutdown_decrypt_pools)
+
+def is_raw_token(value):
+    """
+    Check whether a binary value is a raw Fernet token.
+
+    Raw tokens start with the Fernet version byte (0x80), while the base64 text
+    form of a token always starts with 'g'.
+
+    Args:
+        value (bytes): The stored value
+
+    Returns:
+        bool: True for a raw token, False for a token stored as text
+    """
+    return len(value) > 0 and value[0] == FERNET_VERSION
+
+def token_to_raw(token):
+    """Convert a base64 text token into raw bytes"""
+    return base64.urlsafe_b64decode(token)
+
+def raw_to_token(raw):
+    """Convert a raw token into its base64 text form"""
+    return base64.urlsafe_b64encode(bytes(raw)).decode()
+
+def encrypt_value(value, raw=False):
     """
     Encrypt a string value using Fernet symmetric encryption.
     
@@ -27,13 +201,24 @@ def encrypt_value(value):
     
     Args:
         value (str): The string value to encrypt, or None
+        raw (bool): Return the token as raw bytes instead of base64 text
         
     Returns:
-        str: The encrypted value as a base64-encoded string, or None if input was None
+        str: The encrypted value as a base64-encoded string (bytes if raw),
+             or None if input was None
     """
     if value is None:
         return None
-    return fernet.encrypt(value.encode()).decode()  # Encrypt and convert to string
+    data = value.encode()
+    with span('fernet.encrypt'):
+        token = fernet.encrypt(data)  # Encrypt the UTF-8 bytes
+    _count('encrypts')
+    if DECRYPT_CACHE_SIZE:
+        # The new ciphertext will be read back soon, so its plaintext is cached right away
+        _decrypt_cache.set(_cache_key(token), data.decode())
+    if raw:
+        return token_to_raw(token)
+    return token.decode()  # Convert to string
 
 def decrypt_value(value):
     """
@@ -41,9 +226,12 @@ def decrypt_value(value):
     
     This function takes an encrypted base64-encoded string, decrypts it 
     using the Fernet key, and returns the original plaintext string.
+    Recently decrypted values are served from the decrypt cache.
     
     Args:
-        value (str): The encrypted string value to decrypt, or None
+        value (str): The encrypted string value to decrypt, or None. Raw
+                     bytes tokens and text tokens read from a binary
+                     column are accepted as well.
         
     Returns:
         str: The decrypted plaintext value, or None if input was None
@@ -54,4 +242,273 @@ def decrypt_value(value):
     """
     if value is None:
         return None
-    return fernet.decrypt(value.encode()).decode()  # Decrypt and convert to string
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+        token = base64.urlsafe_b64encode(value) if is_raw_token(value) else value
+    else:
+        token = value.encode()
+    if DECRYPT_CACHE_SIZE:
+        key = _cache_key(token)
+        plaintext = _decrypt_cache.get(key)
+        if plaintext is not None:
+            _count('cache_hits')
+            return plaintext
+    with span('fernet.decrypt'):
+        plaintext = fernet.decrypt(token).decode()  # Decrypt and convert to string
+    _count('decrypts')
+    if DECRYPT_CACHE_SIZE:
+        _decrypt_cache.set(key, plaintext)
+    return plaintext
+
+def encrypt_record(fields):
+    """
+    Encrypt several string fields into a single authenticated blob.
+
+    The fields are serialized as JSON and encrypted with one Fernet operation.
+    The token is stored base64-decoded, as raw bytes, which is a quarter smaller
+    than the text form.
+
+    Args:
+        fields (dict): Field names mapped to string values or None
+
+    Returns:
+        bytes: The encrypted record
+    """
+    data = json.dumps(fields, separators=(',', ':'), ensure_ascii=False)
+    with span('fernet.encrypt'):
+        blob = token_to_raw(fernet.encrypt(data.encode()))
+    _count('encrypts')
+    if DECRYPT_CACHE_SIZE:
+        _decrypt_cache.set(_cache_key(blob), data)
+    return blob
+
+def decrypt_record(blob):
+    """
+    Decrypt a record created by encrypt_record.
+
+    Args:
+        blob (bytes): The encrypted record
+
+    Returns:
+        dict: The field names mapped to their plaintext values
+
+    Raises:
+        cryptography.fernet.InvalidToken: If the record is invalid or was
+                                         encrypted with a different key
+    """
+    blob = bytes(blob)
+    data = None
+    if DECRYPT_CACHE_SIZE:
+        key = _cache_key(blob)
+        data = _decrypt_cache.get(key)
+        if data is not None:
+            _count('cache_hits')
+    if data is None:
+        with span('fernet.decrypt'):
+            data = fernet.decrypt(raw_to_token(blob)).decode()
+        _count('decrypts')
+        if DECRYPT_CACHE_SIZE:
+            _decrypt_cache.set(key, data)
+    # The cache holds the JSON text, so every caller gets its own dict
+    return json.loads(data)
+
+def primary_key_fingerprint():
+    """
+    Get a short fingerprint of the key used to encrypt new values.
+
+    Used to recognize the target key of a rotation without exposing the key.
+
+    Returns:
+        str: The first 16 hex digits of the SHA-256 digest of the key
+    """
+    return hashlib.sha256((FERNET_KEYS[0] if FERNET_KEYS else FERNET_KEY).encode()).hexdigest()[:16]
+
+def rotate_value(value):
+    """
+    Re-encrypt a value with the primary key if it was encrypted with an older key.
+
+    The original timestamp of the token is kept.
+
+    Args:
+        value (str or bytes): A text token, or a raw token as stored in binary columns
+
+    Returns:
+        The re-encrypted value in the same form as the input, or None if the
+        value is already encrypted with the primary key
+
+    Raises:
+        cryptography.fernet.InvalidToken: If none of the keys can decrypt the value
+    """
+    raw = isinstance(value, (bytes, bytearray, memoryview))
+    token = raw_to_token(value).encode() if raw else value.encode()
+    try:
+        primary_fernet.decrypt(token)
+        return None
+    except InvalidToken:
+        rotated = fernet.rotate(token)
+    _count('encrypts')
+    return token_to_raw(rotated) if raw else rotated.decode()
+
+# Cipher of a pool process, created by _init_pool_process
+_pool_fernet = None
+
+def _init_pool_process(keys):
+    """Create the cipher of a pool process from the keys of the parent"""
+    global _pool_fernet
+    _pool_fernet = MultiFernet([Fernet(key) for key in keys])
+
+def _decrypt_chunk(tokens):
+    """Decrypt a chunk of base64 tokens in a pool process"""
+    return [_pool_fernet.decrypt(token).decode() for token in tokens]
+
+def _encrypt_chunk(values):
+    """Encrypt a chunk of strings in a pool process (with the first key, like fernet)"""
+    return [_pool_fernet.encrypt(value.encode()).decode() for value in values]
+
+def _get_pool(workers):
+    """Get the pool with the given number of processes, starting it on first use"""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            # Processes are spawned rather than forked: the web worker runs other
+            # threads (scheduler, server) whose locks must not be copied mid-use
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_pool_process,
+                initargs=(FERNET_KEYS or [FERNET_KEY],),
+            )
+            _pools[workers] = pool
+        return pool
+
+def _discard_pool(workers):
+    with _pools_lock:
+        pool = _pools.pop(workers, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def decrypt_many(values, workers=None, chunk_size=None):
+    """
+    Decrypt a list of values, using several processes for large lists.
+
+    Values found in the decrypt cache are resolved directly. The others are
+    split in chunks decrypted in parallel by the process pool, or serially when
+    there are fewer than DECRYPT_POOL_MIN_ITEMS of them (starting the work in
+    other processes costs more than it saves on small batches).
+
+    Args:
+        values (list): Text tokens, raw tokens or None, like decrypt_value accepts
+        workers (int, optional): Number of processes, defaults to DECRYPT_POOL_WORKERS
+        chunk_size (int, optional): Values per task, defaults to DECRYPT_POOL_CHUNK_SIZE
+
+    Returns:
+        list: The plaintexts, in the order of the values (None for None)
+
+    Raises:
+        cryptography.fernet.InvalidToken: If a value is invalid or was encrypted
+                                         with an unknown key
+    """
+    workers = workers or DECRYPT_POOL_WORKERS
+    chunk_size = chunk_size or DECRYPT_POOL_CHUNK_SIZE
+    results = [None] * len(values)
+
+    # Normalize to base64 tokens and resolve the cached values
+    pending = {}  # token -> positions in values
+    for index, value in enumerate(values):
+        if value is None:
+            continue
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            value = bytes(value)
+            token = base64.urlsafe_b64encode(value) if is_raw_token(value) else value
+        else:
+            token = value.encode()
+        if DECRYPT_CACHE_SIZE and token not in pending:
+            plaintext = _decrypt_cache.get(_cache_key(token))
+            if plaintext is not None:
+                _count('cache_hits')
+                results[index] = plaintext
+                continue
+        pending.setdefault(token, []).append(index)
+
+    tokens = list(pending)
+    with span('fernet.decrypt_many'):
+        if workers > 1 and len(tokens) >= DECRYPT_POOL_MIN_ITEMS:
+            chunks = [tokens[i:i + chunk_size] for i in range(0, len(tokens), chunk_size)]
+            try:
+                plaintexts = [plaintext for chunk in _get_pool(workers).map(_decrypt_chunk, chunks)
+                              for plaintext in chunk]
+            except BrokenProcessPool:
+                # A pool process died: start a new pool next time and finish serially
+                logger.error("Bulk decryption pool broken, decrypting %d values serially", len(tokens))
+                _discard_pool(workers)
+                plaintexts = [fernet.decrypt(token).decode() for token in tokens]
+        else:
+            plaintexts = [fernet.decrypt(token).decode() for token in tokens]
+
+    for token, plaintext in zip(tokens, plaintexts):
+        _count('decrypts')
+        if DECRYPT_CACHE_SIZE:
+            _decrypt_cache.set(_cache_key(token), plaintext)
+        for index in pending[token]:
+            results[index] = plaintext
+    return results
+
+def encrypt_many(values, raw=False, workers=None, chunk_size=None):
+    """
+    Encrypt a list of values, using several processes for large lists.
+
+    Used by bulk imports and data generators. Unlike encrypt_value, the new
+    tokens are not added to the decrypt cache, so a large import does not
+    evict the values the application is using.
+
+    Args:
+        values (list): Strings or None
+        raw (bool): Return the tokens as raw bytes instead of base64 text
+        workers (int, optional): Number of processes, defaults to DECRYPT_POOL_WORKERS
+        chunk_size (int, optional): Values per task, defaults to DECRYPT_POOL_CHUNK_SIZE
+
+    Returns:
+        list: The tokens, in the order of the values (None for None)
+    """
+    workers = workers or DECRYPT_POOL_WORKERS
+    chunk_size = chunk_size or DECRYPT_POOL_CHUNK_SIZE
+    positions = [index for index, value in enumerate(values) if value is not None]
+    plaintexts = [values[index] for index in positions]
+
+    with span('fernet.encrypt_many'):
+        if workers > 1 and len(plaintexts) >= DECRYPT_POOL_MIN_ITEMS:
+            chunks = [plaintexts[i:i + chunk_size] for i in range(0, len(plaintexts), chunk_size)]
+            try:
+                tokens = [token for chunk in _get_pool(workers).map(_encrypt_chunk, chunks) for token in chunk]
+            except BrokenProcessPool:
+                logger.error("Bulk encryption pool broken, encrypting %d values serially", len(plaintexts))
+                _discard_pool(workers)
+                tokens = [fernet.encrypt(value.encode()).decode() for value in plaintexts]
+        else:
+            tokens = [fernet.encrypt(value.encode()).decode() for value in plaintexts]
+
+    results = [None] * len(values)
+    for index, token in zip(positions, tokens):
+        _count('encrypts')
+        results[index] = token_to_raw(token) if raw else token
+    return results
+
+def blind_index(value):
+    """
+    Compute the keyed token of a value for the blind search index.
+
+    The token reveals nothing about the value without the key, but equal values
+    always give the same token, so they can be looked up with an index.
+
+    Args:
+        value (str): The normalized value to index
+
+    Returns:
+        str: The first 24 hex digits of the HMAC-SHA256 of the value
+
+    Raises:
+        RuntimeError: If STUDENT_SEARCH_KEY is not set
+    """
+    if not SEARCH_INDEX_KEY:
+        raise RuntimeError('STUDENT_SEARCH_KEY is not set')
+    return hmac.new(SEARCH_INDEX_KEY, value.encode(), hashlib.sha256).hexdigest()[:24]
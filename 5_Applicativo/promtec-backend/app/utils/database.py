@@ -0,0 +1,240 @@
+"""
+Database Engine Module.
+
+This module adapts the SQLAlchemy engine to the configured database. MySQL is
+the production database; SQLite files are supported so the whole API can be
+run and load-tested without a database server.
+
+For SQLite every new connection gets the pragmas of the SQLite profile
+(write-ahead logging, synchronous level, busy timeout and foreign key
+enforcement, which MySQL always applies). The SQL function now(), used by
+the created_at and updated_at columns, is also rendered with microseconds on
+SQLite: its default CURRENT_TIMESTAMP has a one second resolution and a text
+format different from the one SQLAlchemy writes, so rows created in the same
+second could not be told apart by the cursor pagination.
+
+The connection pool is instrumented through the pool events: connections in
+use, overflow, invalidations and the time requests wait for a connection are
+exposed as the 'database_pool' statistics of each worker.
+"""
+import threading
+import time
+from collections import deque
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql import functions
+from .stats import register_stats_provider
+
+# Number of recent checkout wait times kept for the percentiles
+WAIT_SAMPLES = 1000
+
+
+@compiles(functions.now, 'sqlite')
+def _sqlite_now(element, compiler, **kw):
+    """Render now() on SQLite in the 'YYYY-MM-DD HH:MM:SS.ffffff' format written by SQLAlchemy"""
+    return "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+
+
+class PoolMonitor:
+    """
+    Counters of the connection pool of one engine, fed by the pool events.
+
+    The counters are per worker process, like the pool itself.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.in_use = 0
+        self.in_use_peak = 0
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+
+    def record_wait(self, seconds, timed_out=False):
+        """Record the time a caller waited for a connection"""
+        with self._lock:
+            self._waits.append(seconds)
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def listen(self, engine):
+        """Register the pool event listeners on the engine (also kept by a recreated pool)"""
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'close', self._on_close)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+        event.listen(engine, 'soft_invalidate', self._on_soft_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_close(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.closes += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.in_use_peak = max(self.in_use_peak, self.in_use)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def _on_soft_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.soft_invalidations += 1
+
+    def stats(self, pool):
+        """
+        Return the counters together with the current state of the pool.
+
+        Args:
+            pool: The current pool of the engine
+
+        Returns:
+            dict: Pool settings, gauges, event counters and wait times in milliseconds
+        """
+        with self._lock:
+            waits = sorted(self._waits)
+            wait_count, wait_total = self.wait_count, self.wait_total
+            stats = {
+                'pool_class': type(pool).__name__,
+                'in_use': self.in_use,
+                'in_use_peak': self.in_use_peak,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'closes': self.closes,
+                'invalidations': self.invalidations,
+                'soft_invalidations': self.soft_invalidations,
+            }
+        if isinstance(pool, QueuePool):
+            stats.update({
+                'size': pool.size(),
+                'max_overflow': pool._max_overflow,
+                'timeout': pool.timeout(),
+                'checked_in': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                # Negative while the pool has not opened all its permanent connections
+                'overflow': max(pool.overflow(), 0),
+            })
+        if waits:
+            stats['wait_ms'] = {
+                'samples': len(waits),
+                'mean': round(wait_total / wait_count * 1000, 3),
+                'p50': round(waits[len(waits) // 2] * 1000, 3),
+                'p95': round(waits[min(int(len(waits) * 0.95), len(waits) - 1)] * 1000, 3),
+                'max': round(self.wait_max * 1000, 3),
+            }
+        return stats
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool measuring how long each checkout waits for a connection.
+
+    The pool events only report a checkout once it succeeded, so the wait for
+    a free connection (including opening a new one) and the timeouts when the
+    pool is exhausted are measured around the queue access.
+    """
+
+    # PoolMonitor of the engine, set by configure_engine()
+    monitor = None
+
+    def _do_get(self):
+        if self.monitor is None:
+            return super()._do_get()
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.monitor.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        self.monitor.record_wait(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        # Keep measuring after the pool is replaced (engine.dispose())
+        pool = super().recreate()
+        pool.monitor = self.monitor
+        return pool
+
+
+def engine_options(app):
+    """
+    Complete the configured engine options with the defaults of the database.
+
+    On MySQL connections are tested before use, so a connection closed by the
+    server while idle (wait_timeout) is replaced instead of failing a request.
+    Pools with a queue use InstrumentedQueuePool; in-memory SQLite databases
+    keep the single shared connection set by Flask-SQLAlchemy.
+
+    Args:
+        app (Flask): The application, for SQLALCHEMY_DATABASE_URI and SQLALCHEMY_ENGINE_OPTIONS
+
+    Returns:
+        dict: The options to use for SQLALCHEMY_ENGINE_OPTIONS
+    """
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'mysql':
+        options.setdefault('pool_pre_ping', True)
+    options.setdefault('poolclass', InstrumentedQueuePool)
+    return options
+
+
+def configure_engine(app, engine, stats_name='database_pool'):
+    """
+    Apply the settings of the configured database to the engine.
+
+    Must be called before the first connection is opened.
+
+    Args:
+        app (Flask): The application, for the SQLITE_* settings
+        engine: The SQLAlchemy engine of the application or of a read replica
+        stats_name (str): Name under which the pool statistics are exposed
+    """
+    monitor = PoolMonitor()
+    monitor.listen(engine)
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        engine.pool.monitor = monitor
+    register_stats_provider(stats_name, lambda: monitor.stats(engine.pool))
+
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(app.config.get('SQLITE_BUSY_TIMEOUT', 5000))}",
+        'PRAGMA foreign_keys = ON',
+    ]
+    if engine.url.database and engine.url.database != ':memory:':
+        # In-memory databases only support the default journal
+        pragmas.insert(0, f"PRAGMA journal_mode = {app.config.get('SQLITE_JOURNAL_MODE', 'WAL')}")
+        pragmas.insert(1, f"PRAGMA synchronous = {app.config.get('SQLITE_SYNCHRONOUS', 'NORMAL')}")
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
@@ -21,6 +21,8 @@ import os  # For accessing environment variables
 from dotenv import load_dotenv  # For loading environment variables from .env file
 import logging  # For logging email sending status
 from datetime import datetime  # For timestamp formatting
+from .metrics import SMTP_SEND_DURATION, observe_duration  # Send latency exported to Prometheus
+from .tracing import span  # Send time in the request traces
 
 # Load environment variables from .env file
 load_dotenv()
@@ -33,8 +35,7 @@ ORG_TELEPHONE = "091 815 10 11"
 ORG_EMAIL = "decs-cpt.trevano.promtec@edu.ti.ch"
 
 
-# Configure logging for this module
-logging.basicConfig(level=logging.INFO)
+# Module logger, configured by the application factory
 logger = logging.getLogger(__name__)
 
 def get_contact_info_html():
@@ -114,21 +115,20 @@ def send_email(
     if is_html:
         msg.attach(MIMEText(body, 'html'))
 
-    logger.info(f"Attempting to send email to {to_email}")
-    logger.info(f"Using SMTP server: {smtp_server}:{smtp_port}")
-    logger.info(f"Using SMTP user: {smtp_user}")
+    logger.info("Attempting to send email to %s", to_email)
+    logger.debug("Using SMTP server %s:%s as %s", smtp_server, smtp_port, smtp_user)
 
     try:
-        with smtplib.SMTP_SSL(smtp_server, smtp_port) as server:
-            logger.info("Connected to SMTP server")
+        with span('smtp.send'), observe_duration(SMTP_SEND_DURATION), smtplib.SMTP_SSL(smtp_server, smtp_port) as server:
+            logger.debug("Connected to SMTP server")
             server.login(smtp_user, smtp_password)
-            logger.info("Logged in successfully")
+            logger.debug("Logged in successfully")
             server.send_message(msg)
             logger.info("Email sent successfully")
         return True
     except Exception as e:
-        logger.error(f"Failed to send email: {str(e)}")
-        logger.error(f"SMTP Configuration - Server: {smtp_server}, Port: {smtp_port}, User: {smtp_user}")
+        logger.error("Failed to send email: %s", e)
+        logger.error("SMTP Configuration - Server: %s, Port: %s, User: %s", smtp_server, smtp_port, smtp_user)
         return False
 
 def send_account_approval_email(user_email: str, user_name: str) -> bool:
@@ -187,7 +187,7 @@ def send_slot_confirmation_email(student_email: str, user_full_name: str, slot_i
     Returns:
         bool: True if the email was sent successfully, False otherwise
     """
-    logger.info(f"Sending slot confirmation email to {student_email}")
+    logger.info("Sending slot confirmation email to %s", student_email)
     
     # Format the date nicely
     slot_date = slot_info.get('date')
@@ -318,7 +318,7 @@ def send_enrollment_summary_email(user_email: str, user_name: str, enrollments:
     Returns:
         bool: True if the email was sent successfully, False otherwise
     """
-    logger.info(f"Preparing enrollment summary email for {user_email}")
+    logger.debug("Preparing enrollment summary email for %s", user_email)
     
     # Format the student list as HTML table rows
     student_rows = ""
@@ -384,7 +384,7 @@ def send_enrollment_summary_email(user_email: str, user_name: str, enrollments:
     </html>
     """
 
-    logger.info(f"Sending summary email to {user_email}")
+    logger.info("Sending summary email to %s", user_email)
     return send_email(
         to_email=user_email,
         subject=subject,
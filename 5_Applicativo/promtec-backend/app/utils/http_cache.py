@@ -0,0 +1,87 @@
+"""
+HTTP Conditional Request Module.
+
+This module provides decorators adding ETag and Cache-Control headers to read
+endpoints, and answering 304 Not Modified when the client already has the
+current version of the resource.
+
+For data endpoints the ETag is a hash of the rendered body: change markers such
+as the latest updated_at have a resolution of one second in MySQL and would
+miss two changes within the same second. Static endpoints compute their ETag
+once per worker from the response body.
+"""
+import hashlib
+from functools import wraps
+from flask import Response, request
+
+# ETags of static endpoints, computed on their first call (endpoint -> etag)
+_static_etags = {}
+
+
+def _not_modified(etag, cache_control):
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def conditional(f):
+    """
+    Decorator adding conditional GET support to a data endpoint.
+
+    The strong ETag is a hash of the rendered body, so it changes with any
+    change of the data, however close to the previous one, and covers
+    everything the response depends on (query string, caller, current date).
+    A matching If-None-Match header is answered with 304 Not Modified without
+    sending the body again. The view still runs; hot endpoints are cheap to
+    render thanks to the response cache. Responses must be revalidated on
+    every use (Cache-Control: no-cache) so clients never show stale data.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        cache_control = 'private, no-cache'
+        response = f(*args, **kwargs)
+        if not isinstance(response, Response) or response.status_code != 200:
+            return response
+
+        etag = hashlib.sha256(response.get_data()).hexdigest()[:32]
+        if request.if_none_match.contains(etag):
+            return _not_modified(etag, cache_control)
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        return response
+    return decorated
+
+
+def static_conditional(max_age=3600):
+    """
+    Decorator adding caching headers to an endpoint whose response never changes
+    while the application is running (for example the enum values).
+
+    The ETag is computed from the first response of the worker and reused, so
+    later requests with a matching If-None-Match skip the view entirely.
+
+    Args:
+        max_age (int): Number of seconds clients may reuse the response without revalidating
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            cache_control = f'private, max-age={max_age}'
+            etag = _static_etags.get(request.endpoint)
+            if etag and request.if_none_match.contains(etag):
+                return _not_modified(etag, cache_control)
+
+            response = f(*args, **kwargs)
+            if not isinstance(response, Response) or response.status_code != 200:
+                return response
+
+            if etag is None:
+                etag = hashlib.sha256(response.get_data()).hexdigest()[:32]
+                _static_etags[request.endpoint] = etag
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = cache_control
+            return response
+        return decorated
+    return decorator
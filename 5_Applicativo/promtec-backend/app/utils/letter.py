@@ -5,10 +5,13 @@ from datetime import datetime
 from docxtpl import DocxTemplate
 from PyPDF2 import PdfMerger
 from io import BytesIO
+from .metrics import PDF_CONVERSION_DURATION, observe_duration
+from .tracing import span
 from ..slots.models import (
     Student,
     Gender,
     StudentEnrollment,
+    ENROLLMENT_LETTER_LOADING,
     Slot,
     OrganizationInfo,
     TimePeriod,
@@ -52,13 +55,14 @@ def convert_to_pdf(input_docx):
     """
     with tempfile.TemporaryDirectory() as temp_dir:
         # Use LibreOffice in headless mode to convert the document
-        subprocess.run([
-            'soffice',
-            '--headless',
-            '--convert-to', 'pdf',
-            '--outdir', temp_dir,
-            input_docx
-        ], check=True)
+        with span('libreoffice.convert'), observe_duration(PDF_CONVERSION_DURATION):
+            subprocess.run([
+                'soffice',
+                '--headless',
+                '--convert-to', 'pdf',
+                '--outdir', temp_dir,
+                input_docx
+            ], check=True)
         
         # LibreOffice creates the PDF with the same name as input but .pdf extension
         output_pdf = os.path.join(
@@ -70,6 +74,49 @@ def convert_to_pdf(input_docx):
         with open(output_pdf, 'rb') as f:
             return f.read()
 
+def letter_context(student, slot):
+    """
+    Build the values rendered in the letter of a student.
+    Args:
+        student: Student model instance, with its school loaded
+        slot: Slot model instance
+    Returns:
+        dict: The template placeholders mapped to their values
+    """
+    day_en = slot.date.strftime('%A')
+    month_en = slot.date.strftime('%B')
+
+    time_periods = {
+        TimePeriod.MORNING: DetailedTimePeriod.MORNING.value,
+        TimePeriod.AFTERNOON: DetailedTimePeriod.AFTERNOON.value
+    }
+
+    current_time_period = time_periods[slot.time_period]
+    start_time, end_time = current_time_period.split('-')
+
+
+    # Create the context dictionary for template rendering
+    context = {
+        'FORMA': 'Al ragazzo' if student.gender == Gender.BOY else 'Alla ragazza',
+        'SEDE_SCUOLA': student.school.name,
+        'ORGANIZZATORE': f"{OrganizationInfo.FIRST_NAME.value} {OrganizationInfo.LAST_NAME.value}",
+        'NoCo': f"{OrganizationInfo.FIRST_NAME.value[:2].capitalize()}{OrganizationInfo.LAST_NAME.value[:2].capitalize()}",
+        'TEL': OrganizationInfo.TELEPHONE.value,
+        'EMAIL': OrganizationInfo.EMAIL.value,
+        'COGNOME': student.last_name,
+        'NOME': student.first_name,
+        'INDIRIZZO': student.address,
+        'NAP': student.postal_code,
+        'LUOGO': student.city,
+        'SETTORE': slot.department.value.upper(),
+        'GIORNO': weekday_map[day_en],
+        'DATA': slot.date.strftime('%d/%m/%Y'),
+        'ORA_INIZIO': start_time,
+        'ORA_FINE': end_time,
+        'DATA_ATTUALE': datetime.now().strftime('%d/%m/%Y')
+    }
+    return context
+
 def generate_letter_as_pdf(student, slot):
     """
     Generate a PDF letter for a student using the template.
@@ -92,41 +139,9 @@ def generate_letter_as_pdf(student, slot):
         template_path = os.path.join(current_dir, template_file)
         doc = DocxTemplate(template_path)
         
-        day_en = slot.date.strftime('%A')
-        month_en = slot.date.strftime('%B')
-
-        time_periods = {
-            TimePeriod.MORNING: DetailedTimePeriod.MORNING.value,
-            TimePeriod.AFTERNOON: DetailedTimePeriod.AFTERNOON.value
-        }
-
-        current_time_period = time_periods[slot.time_period]
-        start_time, end_time = current_time_period.split('-')
-
-
-        # Create the context dictionary for template rendering
-        context = {
-            'FORMA': 'Al ragazzo' if student.gender == Gender.BOY else 'Alla ragazza',
-            'SEDE_SCUOLA': student.school.name,
-            'ORGANIZZATORE': f"{OrganizationInfo.FIRST_NAME.value} {OrganizationInfo.LAST_NAME.value}",
-            'NoCo': f"{OrganizationInfo.FIRST_NAME.value[:2].capitalize()}{OrganizationInfo.LAST_NAME.value[:2].capitalize()}",
-            'TEL': OrganizationInfo.TELEPHONE.value,
-            'EMAIL': OrganizationInfo.EMAIL.value,
-            'COGNOME': student.last_name,
-            'NOME': student.first_name,
-            'INDIRIZZO': student.address,
-            'NAP': student.postal_code,
-            'LUOGO': student.city,
-            'SETTORE': slot.department.value.upper(),
-            'GIORNO': weekday_map[day_en],
-            'DATA': slot.date.strftime('%d/%m/%Y'),
-            'ORA_INIZIO': start_time,
-            'ORA_FINE': end_time,
-            'DATA_ATTUALE': datetime.now().strftime('%d/%m/%Y')
-        }
-        
         # Render the template with the context
-        doc.render(context)
+        with span('docx.render'):
+            doc.render(letter_context(student, slot))
         
         # Save temporary docx and convert to PDF
         temp_docx = os.path.join(temp_dir, "temp.docx")
@@ -153,16 +168,19 @@ def merge_pdfs_in_memory(pdf_contents):
     output.seek(0)
     return output.read()
 
-def generate_letters_for_slot(slot_id):
+def load_letter_enrollments(slot_id):
     """
-    Generate PDF letters for all enrolled students in a slot (not in waiting list)
-    and combine them into a single PDF file.
+    Load a slot and the enrollments receiving a letter (not in waiting list).
+    The students and their schools are loaded with the enrollments and the data
+    of all the students is decrypted at once, so rendering the letters runs no
+    further query.
     Args:
-        slot_id: ID of the slot to generate letters for
+        slot_id: ID of the slot
     Returns:
-        bytes: The combined PDF content, or None if no letters were generated
+        tuple: The slot and the list of its active enrollments
+    Raises:
+        ValueError: If the slot does not exist
     """
-    # Get slot and its active enrollments
     slot = Slot.query.get(slot_id)
     if not slot:
         raise ValueError(f"Slot with ID {slot_id} not found")
@@ -170,7 +188,23 @@ def generate_letters_for_slot(slot_id):
     enrollments = StudentEnrollment.query.filter_by(
         slot_id=slot.id,
         is_in_waiting_list=False
-    ).all()
+    ).options(*ENROLLMENT_LETTER_LOADING).all()
+    
+    # Decrypt the data of all the students at once
+    Student.prefetch_pii([enrollment.student for enrollment in enrollments])
+    return slot, enrollments
+
+def generate_letters_for_slot(slot_id):
+    """
+    Generate PDF letters for all enrolled students in a slot (not in waiting list)
+    and combine them into a single PDF file.
+    Args:
+        slot_id: ID of the slot to generate letters for
+    Returns:
+        bytes: The combined PDF content, or None if no letters were generated
+    """
+    # Get slot and its active enrollments
+    slot, enrollments = load_letter_enrollments(slot_id)
     
     if not enrollments:
         return None
@@ -0,0 +1,185 @@
+"""
+Logging Configuration Module.
+
+The logging of the application is configured here, once, by the application
+factory; modules only create their logger with logging.getLogger(__name__)
+and log with %-style arguments, so the message is only built when the record
+is emitted.
+
+Writing to the log files and to the console happens off the request thread:
+the loggers only put the records on a queue (QueueHandler) and a background
+thread (QueueListener) formats and writes them. The records of a level below
+the one configured for their module are dropped before any work is done, so
+DEBUG messages cost a level check in production.
+
+Destinations:
+- Console (stderr, collected by gunicorn/docker): every record from LOG_LEVEL up
+- logs/errors.log: the errors
+- logs/slow_requests.log and logs/memory_reports.log: the records of the
+  slow_requests and memory_reports loggers, already JSON objects
+
+LOG_FORMAT selects JSON lines ('json', default) or text ('text') for the
+console and errors.log. LOG_LEVELS overrides the level of single modules, for
+example 'app.slots.models=DEBUG,apscheduler=WARNING'.
+"""
+import atexit
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask.logging import default_handler
+from .memory import memory_report_logger
+from .tracing import slow_request_logger
+
+# Loggers writing structured records to their own file instead of the console and errors.log
+RECORD_LOGGERS = (slow_request_logger.name, memory_report_logger.name)
+
+# Size of a log file before it is rotated and number of rotated files kept
+MAX_BYTES = 10485760
+BACKUP_COUNT = 10
+
+# Listener writing the queued records, started once per process
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as a JSON object on one line"""
+
+    def format(self, record):
+        entry = {
+            'timestamp': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False)
+
+    def formatTime(self, record, datefmt=None):
+        return super().formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}'
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    Queue handler keeping the traceback apart from the message.
+
+    The message is merged with its arguments before the record is queued (the
+    arguments may change afterwards), the formatting itself is left to the
+    handlers of the listener.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class LoggerFilter(logging.Filter):
+    """
+    Select the records of some loggers (and their children).
+
+    Args:
+        names (tuple): Names of the loggers
+        exclude (bool): Keep the records of every other logger instead
+    """
+
+    def __init__(self, names, exclude=False):
+        super().__init__()
+        self.names = tuple(names)
+        self.exclude = exclude
+
+    def filter(self, record):
+        selected = any(record.name == name or record.name.startswith(name + '.') for name in self.names)
+        return selected != self.exclude
+
+
+def parse_levels(levels):
+    """
+    Parse the per-module levels of LOG_LEVELS.
+
+    Args:
+        levels (str): Comma-separated 'logger=LEVEL' pairs
+
+    Returns:
+        dict: Level names by logger name
+    """
+    parsed = {}
+    for item in (levels or '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            parsed[name.strip()] = level.strip().upper()
+    return parsed
+
+
+def _file_handler(path, formatter, level=logging.NOTSET):
+    handler = RotatingFileHandler(path, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding='utf-8')
+    handler.setFormatter(formatter)
+    handler.setLevel(level)
+    return handler
+
+
+def configure_logging(app, log_dir):
+    """
+    Configure the loggers of the process and start the writing thread.
+
+    The handlers are set up by the first application created in the process;
+    the levels are applied on every call.
+
+    Args:
+        app (Flask): The application, whose configuration holds the LOG_* settings
+        log_dir (Path): Directory of the log files
+    """
+    global _listener
+
+    levels = {'': app.config.get('LOG_LEVEL', 'INFO').upper()}
+    levels.update(parse_levels(app.config.get('LOG_LEVELS')))
+    # The application logger is the parent of the app.* module loggers, its
+    # records go through the queue like the others
+    app.logger.removeHandler(default_handler)
+    if app.logger.name not in levels:
+        levels[app.logger.name] = logging.getLevelName(logging.NOTSET)
+    for name, level in levels.items():
+        logging.getLogger(name or None).setLevel(level)
+    for logger in (slow_request_logger, memory_report_logger):
+        logger.setLevel(logging.WARNING)
+
+    if _listener is not None:
+        return
+
+    if app.config.get('LOG_FORMAT', 'json') == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    general = LoggerFilter(RECORD_LOGGERS, exclude=True)
+
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+    console.addFilter(general)
+
+    errors = _file_handler(log_dir / 'errors.log', formatter, logging.ERROR)
+    errors.addFilter(general)
+
+    handlers = [console, errors]
+    for logger, filename in ((slow_request_logger, 'slow_requests.log'), (memory_report_logger, 'memory_reports.log')):
+        handler = _file_handler(log_dir / filename, logging.Formatter('%(message)s'))
+        handler.addFilter(LoggerFilter((logger.name,)))
+        handlers.append(handler)
+
+    records = queue.SimpleQueue()
+    _listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # Write the queued records before the process exits
+
+    # Replace the handlers installed by imported libraries or a previous basicConfig
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(RecordQueueHandler(records))
@@ -0,0 +1,91 @@
+"""
+LRU Cache Module.
+
+This module provides a small thread-safe least-recently-used cache with an
+optional time-to-live, used by the different in-process caches of the backend.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# Sentinel distinguishing a missing key from a cached None
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with optional expiration.
+
+    When the cache is full the least recently used entry is evicted. Entries
+    older than the time-to-live are treated as missing.
+
+    Args:
+        maxsize (int): Maximum number of entries kept in the cache
+        ttl (float, optional): Lifetime of an entry in seconds, None for no expiration
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing or expired"""
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value, evicting the least recently used entries if needed.
+
+        Args:
+            key: The cache key
+            value: The value to store
+            ttl (float, optional): Lifetime of this entry, defaults to the cache ttl
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        """Remove an entry if present"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Return the size and the hit/miss counters of the cache"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / total, 4) if total else None,
+        }
@@ -0,0 +1,267 @@
+"""
+Memory Instrumentation Module.
+
+This module follows the memory of the workers, to find the requests that make
+their resident memory grow (letter generation keeping every PDF in memory,
+endpoints loading whole tables into the session):
+
+- The resident memory and the peak resident memory of the worker are
+  published as Prometheus gauges after every request (one series per worker).
+- While memory tracking is on (MEMORY_TRACKING_ENABLED, or switched on by an
+  administrator through POST /api/monitoring/memory), tracemalloc records the
+  Python allocations. Every request then records how much it allocated at its
+  peak and how much it still holds at its end, aggregated per endpoint.
+- A request allocating more than MEMORY_GROWTH_THRESHOLD_MB marks its endpoint
+  as watched: the next requests of that endpoint take a snapshot when they
+  start, and those that cross the threshold again write the allocation diff
+  (the source lines that allocated the most) to logs/memory_reports.log, one
+  JSON object per line.
+
+tracemalloc slows the allocations down noticeably, so tracking is off by
+default and is meant to be switched on while investigating. Its counters are
+per process: under gunicorn sync workers a worker serves one request at a
+time, with a threaded server the figures include the concurrent requests.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from flask import g, request
+from .metrics import PROCESS_PEAK_RSS, PROCESS_RSS, REQUEST_MEMORY_PEAK
+from .stats import register_stats_provider
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+# Logger of the allocation diff reports, its file handler is set up by the application factory
+memory_report_logger = logging.getLogger('memory_reports')
+
+MEGABYTE = 1024 * 1024
+
+# Allocations left out of the snapshots: the bookkeeping of tracemalloc and of the imports
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def current_rss():
+    """
+    Return the resident memory of the process.
+
+    Returns:
+        int: Resident memory in bytes, or None where /proc is not available
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss():
+    """
+    Return the highest resident memory reached by the process.
+
+    Returns:
+        int: Peak resident memory in bytes, or None on Windows
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _megabytes(size):
+    return round(size / MEGABYTE, 3) if size is not None else None
+
+
+def _top_lines(statistics, limit):
+    """Serialize the largest tracemalloc statistics (or statistic diffs) by source line"""
+    lines = []
+    for stat in statistics[:limit]:
+        frame = stat.traceback[0]
+        line = {'location': f'{frame.filename}:{frame.lineno}', 'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+        if isinstance(stat, tracemalloc.StatisticDiff):
+            line['size_diff_kb'] = round(stat.size_diff / 1024, 1)
+            line['count_diff'] = stat.count_diff
+        lines.append(line)
+    return lines
+
+
+class MemoryMonitor:
+    """
+    Memory gauges, per-endpoint allocation statistics and allocation diff
+    reports, used as a Flask extension.
+
+    Settings:
+        MEMORY_TRACKING_ENABLED: Start tracemalloc when the application starts (default False)
+        MEMORY_TRACKING_FRAMES: Frames stored per allocation
+        MEMORY_GROWTH_THRESHOLD_MB: Allocations of a request above which a report is written
+        MEMORY_REPORT_LINES: Source lines listed in a report
+    """
+
+    def __init__(self):
+        self.frames = 1
+        self.threshold = 50 * MEGABYTE
+        self.report_lines = 20
+        self.endpoints = {}  # endpoint -> allocation statistics of its requests
+        self.watched = set()  # endpoints whose requests take a starting snapshot
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Read the settings, register the request hooks and the stats provider"""
+        self.frames = app.config.get('MEMORY_TRACKING_FRAMES', 1)
+        self.threshold = app.config.get('MEMORY_GROWTH_THRESHOLD_MB', 50) * MEGABYTE
+        self.report_lines = app.config.get('MEMORY_REPORT_LINES', 20)
+        app.extensions['memory_monitor'] = self
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        register_stats_provider('memory', self.stats)
+        if app.config.get('MEMORY_TRACKING_ENABLED', False):
+            self.start()
+
+    @property
+    def tracking(self):
+        """Whether tracemalloc is recording the allocations of this worker"""
+        return tracemalloc.is_tracing()
+
+    def start(self, frames=None):
+        """
+        Start recording the allocations of this worker.
+
+        Args:
+            frames (int, optional): Frames stored per allocation, more frames
+                                    cost more memory and time
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames or self.frames)
+
+    def stop(self):
+        """Stop recording the allocations and free the recorded traces, the statistics are kept"""
+        tracemalloc.stop()
+        self.watched.clear()
+
+    def _start_request(self):
+        if not tracemalloc.is_tracing():
+            return
+        tracemalloc.reset_peak()
+        g.memory_started = tracemalloc.get_traced_memory()[0]
+        if request.endpoint in self.watched:
+            g.memory_snapshot = tracemalloc.take_snapshot()
+
+    def _finish_request(self, response):
+        rss = current_rss()
+        if rss is not None:
+            PROCESS_RSS.set(rss)
+        peak = peak_rss()
+        if peak is not None:
+            # The kernel updates the peak lazily, it can lag behind the current value
+            PROCESS_PEAK_RSS.set(max(peak, rss or 0))
+
+        started = g.pop('memory_started', None)
+        snapshot = g.pop('memory_snapshot', None)
+        if started is None or not tracemalloc.is_tracing():
+            return response
+        current, peak_traced = tracemalloc.get_traced_memory()
+        growth = max(peak_traced - started, 0)
+        retained = current - started
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_MEMORY_PEAK.labels(endpoint).observe(growth)
+        self._record(endpoint, growth, retained)
+
+        if growth >= self.threshold:
+            if snapshot is None:
+                # Compare the next requests of this endpoint with their starting state
+                self.watched.add(endpoint)
+            memory_report_logger.warning(json.dumps(self.report(response, growth, retained, rss, snapshot)))
+        return response
+
+    def _record(self, endpoint, growth, retained):
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {'requests': 0, 'peak_max': 0, 'peak_total': 0, 'retained_total': 0}
+            stats['requests'] += 1
+            stats['peak_max'] = max(stats['peak_max'], growth)
+            stats['peak_total'] += growth
+            stats['retained_total'] += retained
+
+    def report(self, response, growth, retained, rss, snapshot=None):
+        """
+        Build the record of a request whose allocations crossed the threshold.
+
+        Args:
+            response: The Flask response
+            growth (int): Peak allocations of the request in bytes
+            retained (int): Allocations still held at the end of the request in bytes
+            rss (int): Resident memory of the worker in bytes
+            snapshot (Snapshot, optional): Snapshot taken when the request started
+
+        Returns:
+            dict: Request, memory figures and, with a starting snapshot, the source
+                  lines whose allocations grew the most during the request
+        """
+        record = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'pid': os.getpid(),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'peak_mb': _megabytes(growth),
+            'retained_mb': _megabytes(retained),
+            'rss_mb': _megabytes(rss),
+            'peak_rss_mb': _megabytes(peak_rss()),
+        }
+        if snapshot is None:
+            record['allocation_diff'] = None  # Written by the next requests of the endpoint
+        else:
+            end = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+            diff = end.compare_to(snapshot.filter_traces(SNAPSHOT_FILTERS), 'lineno')
+            record['allocation_diff'] = _top_lines([stat for stat in diff if stat.size_diff > 0], self.report_lines)
+        return record
+
+    def top_allocations(self, limit=None):
+        """
+        Return the source lines holding the most memory right now.
+
+        Returns:
+            list: Location, size and number of blocks of each line, empty if tracking is off
+        """
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        return _top_lines(snapshot.statistics('lineno'), limit or self.report_lines)
+
+    def stats(self):
+        """Return the memory of the worker and the allocation statistics per endpoint"""
+        stats = {
+            'rss_mb': _megabytes(current_rss()),
+            'peak_rss_mb': _megabytes(peak_rss()),
+            'tracking': tracemalloc.is_tracing(),
+            'threshold_mb': _megabytes(self.threshold),
+            'watched_endpoints': sorted(self.watched),
+        }
+        if tracemalloc.is_tracing():
+            stats['traced_mb'] = _megabytes(tracemalloc.get_traced_memory()[0])
+            stats['tracemalloc_overhead_mb'] = _megabytes(tracemalloc.get_tracemalloc_memory())
+        with self._lock:
+            stats['endpoints'] = {
+                endpoint: {
+                    'requests': values['requests'],
+                    'peak_max_mb': _megabytes(values['peak_max']),
+                    'peak_mean_mb': _megabytes(values['peak_total'] / values['requests']),
+                    'retained_mean_mb': _megabytes(values['retained_total'] / values['requests']),
+                }
+                for endpoint, values in self.endpoints.items()
+            }
+        return stats
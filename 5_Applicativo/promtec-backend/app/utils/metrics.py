@@ -0,0 +1,183 @@
+"""
+Prometheus Metrics Module.
+
+This module defines the Prometheus metrics of the backend and serves them on
+the /metrics endpoint:
+
+- HTTP request latency per blueprint route (endpoint), method and status
+- Requests in progress
+- Database statements and database time of each request
+- Fernet operations (encryptions, decryptions and decryptions saved by the caches)
+- SMTP send latency, LibreOffice conversion latency and scheduler job durations
+- Resident and peak resident memory of every worker, and the peak Python
+  allocations of each request while memory tracking is on (see memory.py)
+
+Under gunicorn every worker is a separate process: gunicorn.conf.py sets
+PROMETHEUS_MULTIPROC_DIR, where each worker writes its values, and /metrics
+aggregates the files of all workers whichever worker answers the scrape.
+Without that variable (development server, scripts) the values of the
+current process are served.
+
+The endpoint is not proxied by nginx (only /api/ is), but the backend port is
+published; the scraper must send 'Authorization: Bearer <METRICS_TOKEN>', and
+every request is refused while METRICS_TOKEN is not set.
+"""
+import hmac
+import os
+import time
+from contextlib import contextmanager
+from flask import Response, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Histogram buckets in seconds for requests and database time, and for slow external operations
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Histogram buckets of the number of statements per request
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+# Histogram buckets in bytes of the memory allocated by a request
+MEMORY_BUCKETS = tuple(2 ** power * 1024 * 1024 for power in range(10))  # 1 MB to 512 MB
+
+REQUEST_DURATION = Histogram(
+    'promtec_http_request_duration_seconds', 'Duration of the HTTP requests',
+    ['method', 'endpoint', 'status'], buckets=REQUEST_BUCKETS)
+REQUESTS_IN_PROGRESS = Gauge(
+    'promtec_http_requests_in_progress', 'HTTP requests being served',
+    multiprocess_mode='livesum')
+DB_QUERIES = Histogram(
+    'promtec_db_queries_per_request', 'Database statements executed by a request',
+    ['endpoint'], buckets=QUERY_COUNT_BUCKETS)
+DB_TIME = Histogram(
+    'promtec_db_time_per_request_seconds', 'Time a request spent executing database statements',
+    ['endpoint'], buckets=REQUEST_BUCKETS)
+FERNET_OPERATIONS = Counter(
+    'promtec_fernet_operations_total', 'Fernet operations, cache_hits and memo_hits are saved decryptions',
+    ['operation'])
+SMTP_SEND_DURATION = Histogram(
+    'promtec_smtp_send_duration_seconds', 'Duration of sending an email through SMTP',
+    ['result'], buckets=SLOW_BUCKETS)
+PDF_CONVERSION_DURATION = Histogram(
+    'promtec_pdf_conversion_duration_seconds', 'Duration of a LibreOffice conversion to PDF',
+    ['result'], buckets=SLOW_BUCKETS)
+JOB_DURATION = Histogram(
+    'promtec_scheduler_job_duration_seconds', 'Duration of the runs of the background jobs',
+    ['job', 'result'], buckets=SLOW_BUCKETS)
+# One series per worker (pid label under gunicorn), dropped when the worker exits
+PROCESS_RSS = Gauge(
+    'promtec_process_resident_memory_bytes', 'Resident memory of the worker process',
+    multiprocess_mode='liveall')
+PROCESS_PEAK_RSS = Gauge(
+    'promtec_process_peak_resident_memory_bytes', 'Highest resident memory reached by the worker process',
+    multiprocess_mode='liveall')
+REQUEST_MEMORY_PEAK = Histogram(
+    'promtec_request_memory_peak_bytes', 'Peak Python allocations of a request, observed while memory tracking is on',
+    ['endpoint'], buckets=MEMORY_BUCKETS)
+
+
+@contextmanager
+def observe_duration(histogram, **labels):
+    """
+    Observe the duration of the block in a histogram with a 'result' label.
+
+    Args:
+        histogram (Histogram): Histogram with a 'result' label among its labels
+        **labels: The values of the other labels
+
+    Usage:
+        with observe_duration(SMTP_SEND_DURATION):
+            server.send_message(msg)  # result='error' if it raises
+    """
+    started = time.perf_counter()
+    result = 'error'
+    try:
+        yield
+        result = 'ok'
+    finally:
+        histogram.labels(result=result, **labels).observe(time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_started')
+    if started and has_request_context():
+        g.metrics_db_queries = g.get('metrics_db_queries', 0) + 1
+        g.metrics_db_time = g.get('metrics_db_time', 0.0) + time.perf_counter() - started.pop()
+
+
+class Metrics:
+    """
+    Request instrumentation and /metrics endpoint, used as a Flask extension.
+
+    Usage:
+        metrics = Metrics()
+        metrics.init_app(app)
+    """
+
+    def __init__(self):
+        self.token = None
+
+    def init_app(self, app):
+        """
+        Instrument the requests of the application and register the /metrics endpoint.
+
+        The database statements of every engine (primary and replicas) are counted.
+        """
+        self.token = app.config.get('METRICS_TOKEN')
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._observe_request)
+        app.teardown_request(self._end_request)
+        app.add_url_rule('/metrics', 'metrics', self.export, methods=['GET'])
+        app.extensions['metrics'] = self
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+        REQUESTS_IN_PROGRESS.inc()
+
+    def _observe_request(self, response):
+        if 'metrics_started' in g and request.endpoint != 'metrics':
+            endpoint = request.endpoint or 'unmatched'
+            REQUEST_DURATION.labels(request.method, endpoint, response.status_code).observe(
+                time.perf_counter() - g.metrics_started)
+            DB_QUERIES.labels(endpoint).observe(g.get('metrics_db_queries', 0))
+            DB_TIME.labels(endpoint).observe(g.get('metrics_db_time', 0.0))
+        return response
+
+    def _end_request(self, error=None):
+        # Also runs when the request failed before producing a response
+        if g.pop('metrics_started', None) is not None:
+            REQUESTS_IN_PROGRESS.dec()
+
+    def export(self):
+        """
+        Serve the metrics in the Prometheus text format.
+
+        Returns:
+            200: The metrics of all the workers (or of this process)
+            401: If the request does not carry METRICS_TOKEN, or no token is set
+        """
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not self.token or not hmac.compare_digest(supplied.encode(), self.token.encode()):
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
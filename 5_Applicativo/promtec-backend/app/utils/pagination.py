@@ -0,0 +1,222 @@
+"""
+Keyset Pagination Module.
+
+This module implements cursor (keyset) pagination for the listing endpoints.
+Instead of OFFSET, each page continues after the (sort value, id) pair of the
+last row of the previous page, so deep pages cost the same as the first one
+and no COUNT(*) is needed.
+
+The cursor returned to the client is an opaque URL-safe string encoding the
+sort field, the direction and the last (sort value, id) pair.
+"""
+import base64
+import json
+from datetime import date, datetime
+from enum import Enum
+from flask import current_app
+from sqlalchemy import and_, or_
+from .lru import LRUCache
+
+# Cached row count estimates, shared by all listing endpoints of the worker
+_count_cache = LRUCache(maxsize=512)
+
+# Largest page a listing endpoint returns, whatever per_page the client asks for
+MAX_PER_PAGE = 100
+
+
+def page_size(value, default=10):
+    """
+    Clamp the per_page parameter of a listing.
+
+    Args:
+        value (int): The requested page size, or None when missing or not a number
+        default (int): Page size used when none was requested
+
+    Returns:
+        int: A page size between 1 and MAX_PER_PAGE
+    """
+    if value is None:
+        return default
+    return min(max(value, 1), MAX_PER_PAGE)
+
+
+def _encode_value(value):
+    """Convert a sort value into a JSON-serializable tagged value"""
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    if isinstance(value, Enum):
+        return value.name
+    return value
+
+
+def _decode_value(value):
+    """Convert a tagged value back into the original sort value"""
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+    return value
+
+
+def _expected_type(sort_expr):
+    """Python type of the values of a sort expression, or None if unknown"""
+    try:
+        return sort_expr.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def _check_sort_value(sort_expr, value):
+    """
+    Check that a sort value decoded from a cursor can be compared with the sort expression.
+
+    A tampered cursor must be rejected with a 400 instead of failing while the
+    query is executed.
+
+    Raises:
+        ValueError: If the value has the wrong type
+    """
+    expected = _expected_type(sort_expr)
+    if value is None or isinstance(value, (dict, list)):
+        raise ValueError('Invalid cursor')
+    if expected is None:
+        return
+    if issubclass(expected, Enum):
+        # Enum values are stored in the cursor by name
+        valid = isinstance(value, str) and value in expected.__members__
+    elif expected is float:
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+    elif expected is int:
+        valid = isinstance(value, int) and not isinstance(value, bool)
+    elif expected is date:
+        valid = isinstance(value, date)
+    else:
+        valid = isinstance(value, expected)
+    if not valid:
+        raise ValueError('Invalid cursor')
+
+
+def encode_cursor(sort_by, descending, sort_value, last_id):
+    """
+    Encode the position after a row into an opaque cursor.
+
+    Args:
+        sort_by (str): Name of the sort field
+        descending (bool): Whether the listing is sorted in descending order
+        sort_value: Sort value of the last row of the page
+        last_id (int): ID of the last row of the page
+
+    Returns:
+        str: The cursor string
+    """
+    payload = json.dumps({
+        's': sort_by,
+        'o': 'desc' if descending else 'asc',
+        'v': _encode_value(sort_value),
+        'id': last_id,
+    }, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort_by, descending):
+    """
+    Decode a cursor created by encode_cursor.
+
+    Args:
+        cursor (str): The cursor string
+        sort_by (str): Sort field of the current request
+        descending (bool): Sort direction of the current request
+
+    Returns:
+        tuple: (sort_value, last_id)
+
+    Raises:
+        ValueError: If the cursor is malformed or was created for another ordering
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        sort_value, last_id = _decode_value(payload['v']), int(payload['id'])
+        same_ordering = payload['s'] == sort_by and payload['o'] == ('desc' if descending else 'asc')
+    except (ValueError, KeyError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not same_ordering:
+        raise ValueError('Cursor does not match the requested sorting')
+    return sort_value, last_id
+
+
+def cursor_page(query, sort_by, sort_expr, sort_getter, id_column, descending, cursor, per_page):
+    """
+    Fetch one page of a query using keyset pagination.
+
+    Rows are ordered by (sort expression, id) so the order is total even when
+    several rows share the same sort value.
+
+    Args:
+        query: The filtered SQLAlchemy query (its ordering is replaced)
+        sort_by (str): Name of the sort field, stored in the cursor
+        sort_expr: SQL expression to sort by (must not be NULL)
+        sort_getter (callable): Function returning the sort value of a row
+        id_column: Primary key column used as tie-breaker
+        descending (bool): Whether to sort in descending order
+        cursor (str): Cursor of the previous page, empty for the first page
+        per_page (int): Number of rows per page
+
+    Returns:
+        dict: 'items' (the rows), 'next_cursor' (None on the last page) and 'has_next'
+
+    Raises:
+        ValueError: If the cursor is invalid
+    """
+    query = query.order_by(None)
+    if cursor:
+        sort_value, last_id = decode_cursor(cursor, sort_by, descending)
+        _check_sort_value(sort_expr, sort_value)
+        if descending:
+            query = query.filter(or_(sort_expr < sort_value,
+                                     and_(sort_expr == sort_value, id_column < last_id)))
+        else:
+            query = query.filter(or_(sort_expr > sort_value,
+                                     and_(sort_expr == sort_value, id_column > last_id)))
+
+    if descending:
+        query = query.order_by(sort_expr.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_expr.asc(), id_column.asc())
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.limit(per_page + 1).all()
+    has_next = len(rows) > per_page
+    items = rows[:per_page]
+
+    next_cursor = None
+    if has_next and items:
+        last = items[-1]
+        next_cursor = encode_cursor(sort_by, descending, sort_getter(last), last.id)
+
+    return {'items': items, 'next_cursor': next_cursor, 'has_next': has_next}
+
+
+def estimated_count(cache_key, query):
+    """
+    Get the row count of a query, served from a short-lived cache.
+
+    The count is exact when computed but may be up to COUNT_CACHE_TTL seconds
+    old, which is good enough to display a total next to infinite scrolling.
+
+    Args:
+        cache_key: Key identifying the endpoint and its filters
+        query: The filtered SQLAlchemy query
+
+    Returns:
+        int: The (possibly cached) number of rows
+    """
+    count = _count_cache.get(cache_key)
+    if count is None:
+        count = query.order_by(None).count()
+        _count_cache.set(cache_key, count, ttl=current_app.config.get('COUNT_CACHE_TTL', 30))
+    return count
+
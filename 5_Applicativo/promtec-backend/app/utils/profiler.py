@@ -0,0 +1,276 @@
+"""
+Sampling Profiler Module.
+
+This module profiles the requests of a worker with a sampling profiler: a
+background thread reads the Python stack of the profiled threads every few
+milliseconds (sys._current_frames) and counts identical stacks. The profiled
+code runs unmodified, so the overhead stays low and the profile reflects the
+real data volumes of production.
+
+Profiles are written in the folded stack format ('frame;frame;frame count'
+per line) read by flamegraph.pl, speedscope and most flamegraph viewers, to
+PROFILE_DIR (default logs/profiles) so any worker can serve them. Only the
+newest PROFILER_KEEP profiles are kept.
+
+Two ways to profile, both reserved to administrators:
+- A single request: send the 'X-Profile: 1' header or the 'profile=1' query
+  parameter; the flag is only honoured once the token is verified and the
+  user is an administrator. The response carries the profile name in the
+  X-Profile-Id header.
+- A time window on one worker (POST /api/monitoring/profile): every request
+  served by that worker during the window is profiled, each stack starting
+  with its endpoint.
+"""
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from flask import g, request
+
+# Valid profile file names, checked before serving a file
+PROFILE_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+\.folded$')
+
+
+class SamplingProfiler:
+    """
+    Background thread sampling the stacks of registered threads.
+
+    Args:
+        interval (float): Seconds between two samples
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = {}  # folded stack -> number of samples
+        self.threads = {}  # thread ident -> label of the root frame
+        self._names = {}  # code object -> frame label
+        # Import paths removed from the file names, longest first
+        self._prefixes = sorted((path for path in sys.path if path), key=len, reverse=True)
+        self._stop = threading.Event()
+        self._thread = None
+        self.started = None
+        self.duration = None
+
+    def add_thread(self, ident, label):
+        """Start sampling a thread, its stacks start with the label"""
+        self.threads[ident] = label
+
+    def remove_thread(self, ident):
+        """Stop sampling a thread"""
+        self.threads.pop(ident, None)
+
+    def _frame_name(self, code):
+        name = self._names.get(code)
+        if name is None:
+            filename = code.co_filename
+            for prefix in self._prefixes:
+                if filename.startswith(prefix):
+                    filename = filename[len(prefix):].lstrip(os.sep)
+                    break
+            name = self._names[code] = f'{code.co_name} ({filename})'
+        return name
+
+    def _sample(self):
+        frames = sys._current_frames()
+        for ident, label in list(self.threads.items()):
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.append(label)
+            folded = ';'.join(reversed(stack))
+            self.samples[folded] = self.samples.get(folded, 0) + 1
+
+    def _run(self, until):
+        while not self._stop.wait(self.interval):
+            self._sample()
+            if until is not None and time.monotonic() >= until:
+                break
+
+    def start(self, seconds=None, on_finish=None):
+        """
+        Start sampling in a daemon thread.
+
+        Args:
+            seconds (float, optional): Stop by itself after this time
+            on_finish (callable, optional): Called with the profiler when a timed run ends
+        """
+        self.started = time.monotonic()
+        until = self.started + seconds if seconds else None
+
+        def run():
+            self._run(until)
+            self.duration = time.monotonic() - self.started
+            if on_finish is not None and not self._stop.is_set():
+                on_finish(self)
+
+        self._thread = threading.Thread(target=run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and wait for the sampling thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.monotonic() - self.started
+
+    def folded(self):
+        """Return the profile in the folded stack format, most sampled stacks first"""
+        lines = sorted(self.samples.items(), key=lambda item: item[1], reverse=True)
+        return ''.join(f'{stack} {count}\n' for stack, count in lines)
+
+
+class Profiler:
+    """
+    On-demand profiling of the requests of a worker, used as a Flask extension.
+
+    Settings:
+        PROFILER_ENABLED: Allow administrators to profile (default True)
+        PROFILE_DIR: Directory of the profile files
+        PROFILER_INTERVAL_MS: Milliseconds between two samples
+        PROFILER_MAX_SECONDS: Longest time window
+        PROFILER_MIN_INTERVAL_MS: Shortest interval a time window may request
+        PROFILER_KEEP: Number of profiles kept in the profile directory
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self.interval = 0.005
+        self.max_seconds = 60
+        self.min_interval = 0.001
+        self.keep = 50
+        self.window = None  # SamplingProfiler of the running time window
+        self.window_name = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Read the settings and register the request hooks"""
+        self.enabled = app.config.get('PROFILER_ENABLED', True)
+        self.directory = app.config.get('PROFILE_DIR') or os.path.join(os.environ.get('LOG_DIR', 'logs'), 'profiles')
+        self.interval = app.config.get('PROFILER_INTERVAL_MS', 5) / 1000
+        self.max_seconds = app.config.get('PROFILER_MAX_SECONDS', 60)
+        self.min_interval = app.config.get('PROFILER_MIN_INTERVAL_MS', 1) / 1000
+        self.keep = app.config.get('PROFILER_KEEP', 50)
+        app.extensions['profiler'] = self
+        if self.enabled:
+            app.before_request(self._join_window)
+            app.after_request(self._finish_request_profile)
+            app.teardown_request(self._leave_window)
+
+    def _profile_name(self, label):
+        """Unique file name of a new profile"""
+        label = re.sub(r'[^A-Za-z0-9_-]', '_', label)
+        return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{secrets.token_hex(3)}-{label}.folded"
+
+    def save(self, name, profiler):
+        """
+        Write a profile to the profile directory and delete the oldest
+        profiles beyond PROFILER_KEEP.
+
+        Args:
+            name (str): File name of the profile
+            profiler (SamplingProfiler): The stopped profiler
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = os.path.join(self.directory, name + '.tmp')
+        with open(temporary, 'w') as f:
+            f.write(profiler.folded())
+        os.replace(temporary, os.path.join(self.directory, name))
+        for profile in self.list_profiles()[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, profile['name']))
+            except FileNotFoundError:
+                pass  # Already deleted by another worker
+
+    def path(self, name):
+        """
+        Return the path of a stored profile.
+
+        Returns:
+            str: The path, or None if the name is invalid or the file does not exist
+        """
+        if not PROFILE_NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    def list_profiles(self):
+        """Return the stored profiles, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in os.listdir(self.directory):
+            if PROFILE_NAME_PATTERN.match(name):
+                stat = os.stat(os.path.join(self.directory, name))
+                profiles.append({'name': name, 'size': stat.st_size, 'modified': stat.st_mtime})
+        return sorted(profiles, key=lambda profile: profile['modified'], reverse=True)
+
+    def start_if_requested(self, user):
+        """
+        Start profiling the current request if an administrator asked for it.
+
+        Called once the user of the request is authenticated.
+
+        Args:
+            user (User): The authenticated user
+        """
+        if not self.enabled or not user.is_admin or 'request_profiler' in g:
+            return
+        if request.headers.get('X-Profile') != '1' and request.args.get('profile') != '1':
+            return
+        profiler = SamplingProfiler(self.interval)
+        profiler.add_thread(threading.get_ident(), request.endpoint or 'unmatched')
+        profiler.start()
+        g.request_profiler = profiler
+
+    def _finish_request_profile(self, response):
+        profiler = g.pop('request_profiler', None)
+        if profiler is not None:
+            profiler.stop()
+            name = self._profile_name(request.endpoint or 'unmatched')
+            self.save(name, profiler)
+            response.headers['X-Profile-Id'] = name
+        return response
+
+    def start_window(self, seconds, interval=None):
+        """
+        Profile every request served by this worker for a time window.
+
+        Args:
+            seconds (float): Length of the window, at most PROFILER_MAX_SECONDS
+            interval (float, optional): Seconds between two samples
+
+        Returns:
+            str: Name of the profile, written when the window ends; None if a
+                 window is already running on this worker
+        """
+        with self._lock:
+            if self.window is not None:
+                return None
+            self.window = SamplingProfiler(interval or self.interval)
+            self.window_name = self._profile_name('window')
+            self.window.start(seconds=min(seconds, self.max_seconds), on_finish=self._finish_window)
+            return self.window_name
+
+    def _finish_window(self, profiler):
+        with self._lock:
+            name = self.window_name
+            self.window = None
+            self.window_name = None
+        self.save(name, profiler)
+
+    def _join_window(self):
+        window = self.window
+        if window is not None:
+            window.add_thread(threading.get_ident(), request.endpoint or 'unmatched')
+
+    def _leave_window(self, error=None):
+        window = self.window
+        if window is not None:
+            window.remove_thread(threading.get_ident())
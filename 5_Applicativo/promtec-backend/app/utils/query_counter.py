@@ -0,0 +1,56 @@
+"""
+Query Counter Module.
+
+This module counts the SQL statements sent to the database while a block of
+code runs. It is used to check that a code path runs in a fixed number of
+queries (no lazy load per row) whatever the amount of data it processes.
+
+Usage:
+    with count_queries() as counter:
+        confirm_slot(slot_id)
+    print(counter.count, counter.statements)
+
+The budgets of the endpoints and of the background jobs are checked by
+scripts/check_query_counts.py.
+"""
+from contextlib import contextmanager
+from sqlalchemy import event
+from app.extensions import db
+
+
+class QueryCounter:
+    """
+    Collects the statements executed on an engine.
+
+    Attributes:
+        count (int): Number of executed statements
+        statements (list): The SQL of every executed statement
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """
+    Count the statements executed on the engine inside the block.
+
+    Args:
+        engine: The SQLAlchemy engine to watch (default: the engine of the application)
+
+    Yields:
+        QueryCounter: The counter, updated while the block runs
+    """
+    engine = engine or db.engine
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter)
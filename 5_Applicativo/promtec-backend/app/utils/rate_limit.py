@@ -0,0 +1,247 @@
+"""
+Rate Limiting Module.
+
+This module throttles expensive public endpoints (login, password reset,
+registration) so that a misbehaving client cannot monopolize the CPU with
+password hashing or flood the SMTP server.
+
+Limits are enforced with sliding-window counters: the hits of the current fixed
+window are added to the hits of the previous window weighted by how much of it
+still overlaps the sliding window. This needs only two counters per key and
+gives a smooth limit without storing every request timestamp.
+
+Each protected route has a rule in the RATE_LIMITS configuration, with one limit
+per scope (for example 'ip' and 'account'). A request is rejected with HTTP 429
+as soon as one of its scopes is over the limit, before the view runs and
+without touching the database.
+"""
+import ipaddress
+import re
+import threading
+import time
+from functools import wraps
+from flask import current_app, jsonify, request
+from .shared_store import create_store
+from .stats import register_stats_provider
+
+# Number of seconds of each supported time unit
+_UNITS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+}
+
+_RATE_PATTERN = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$')
+
+
+def parse_rate(rate):
+    """
+    Parse a rate string such as '10/minute' or '100/5minutes'.
+
+    Args:
+        rate (str): The rate string
+
+    Returns:
+        tuple: (limit, window_seconds)
+
+    Raises:
+        ValueError: If the rate string is not valid
+    """
+    match = _RATE_PATTERN.match(rate or '')
+    if not match:
+        raise ValueError(f"Invalid rate limit: {rate}")
+    limit, multiplier, unit = match.groups()
+    return int(limit), int(multiplier or 1) * _UNITS[unit]
+
+
+def parse_trusted_proxies(value):
+    """
+    Parse the TRUSTED_PROXIES setting.
+
+    Args:
+        value (str): Comma-separated addresses or networks ('172.28.0.10,10.0.0.0/8')
+
+    Returns:
+        list: The networks of the trusted proxies
+
+    Raises:
+        ValueError: If an entry is not a valid address or network
+    """
+    return [ipaddress.ip_network(item.strip(), strict=False) for item in (value or '').split(',') if item.strip()]
+
+
+def _is_trusted(address, trusted_proxies):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+def client_ip(trusted_proxies=()):
+    """
+    Get the address of the client that made the request.
+
+    Forwarding headers are only honoured when the direct peer is one of the
+    trusted proxies (the nginx reverse proxy), otherwise any client could pick
+    a new address for every request. X-Forwarded-For is read from the right,
+    skipping the trusted proxies, so addresses prepended by the client are ignored.
+
+    Args:
+        trusted_proxies (list): Networks of the trusted proxies (see parse_trusted_proxies)
+    """
+    peer = request.remote_addr or 'unknown'
+    if not _is_trusted(peer, trusted_proxies):
+        return peer
+    forwarded = [address.strip() for address in request.headers.get('X-Forwarded-For', '').split(',') if address.strip()]
+    for address in reversed(forwarded):
+        if not _is_trusted(address, trusted_proxies):
+            return address
+    return request.headers.get('X-Real-IP') or peer
+
+
+def request_field(name):
+    """
+    Get a field from the request body, either form data or JSON.
+
+    Args:
+        name (str): Name of the field
+
+    Returns:
+        str: The lower-cased field value, or None if missing
+    """
+    value = request.form.get(name)
+    if value is None:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            value = data.get(name)
+    if not isinstance(value, str) or not value.strip():
+        return None
+    return value.strip().lower()
+
+
+class RateLimiter:
+    """
+    Sliding-window rate limiter used as a Flask extension.
+
+    Usage:
+        limiter = RateLimiter()
+        limiter.init_app(app)
+
+        @limiter.limit('login', account_field='username')
+        def login_view(): ...
+    """
+
+    def __init__(self):
+        self.store = None
+        self.trusted_proxies = []
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def init_app(self, app):
+        """
+        Configure the limiter for an application.
+
+        Reads the storage backend from RATELIMIT_STORAGE_URI and the reverse
+        proxies allowed to forward the client address from TRUSTED_PROXIES, and
+        registers the limiter statistics with the stats registry.
+        """
+        self.store = create_store(app.config.get('RATELIMIT_STORAGE_URI', 'memory://'))
+        self.trusted_proxies = parse_trusted_proxies(app.config.get('TRUSTED_PROXIES'))
+        # Validate the configured rules at startup rather than on the first request
+        for rule in app.config.get('RATE_LIMITS', {}).values():
+            for rate in rule.values():
+                parse_rate(rate)
+        app.extensions['rate_limiter'] = self
+        register_stats_provider('rate_limiter', self.stats)
+
+    def _record(self, name, allowed):
+        with self._lock:
+            counters = self._stats.setdefault(name, {'allowed': 0, 'rejected': 0})
+            counters['allowed' if allowed else 'rejected'] += 1
+
+    def stats(self):
+        """Return the number of allowed and rejected requests per rule"""
+        with self._lock:
+            rules = {name: dict(counters) for name, counters in self._stats.items()}
+        return {
+            'rules': rules,
+            'total_allowed': sum(c['allowed'] for c in rules.values()),
+            'total_rejected': sum(c['rejected'] for c in rules.values()),
+        }
+
+    def hit(self, name, identities, rule, now=None):
+        """
+        Check and count a request against the limits of a rule.
+
+        All scopes are checked first, and the request is counted only if every
+        scope is under its limit, so rejected requests do not extend a lockout.
+        The check and the count are one atomic operation of the store, so
+        concurrent workers cannot all slip under a limit.
+
+        Args:
+            name (str): Name of the rule, used in the counter keys
+            identities (dict): Identity of the client for each scope (scope -> value)
+            rule (dict): Rate string for each scope (scope -> '10/minute')
+            now (float, optional): Current timestamp, defaults to time.time()
+
+        Returns:
+            int: 0 if the request is allowed, otherwise the suggested number of
+                 seconds to wait before retrying
+        """
+        now = time.time() if now is None else now
+        windows = []
+        ends = []
+        for scope, rate in rule.items():
+            identity = identities.get(scope)
+            if identity is None:
+                continue
+            limit, window = parse_rate(rate)
+            index = int(now // window)
+            # Portion of the previous window still covered by the sliding window
+            overlap = 1 - (now - index * window) / window
+            # Counters live for two windows so they can serve as the previous window
+            windows.append((f'rl:{name}:{scope}:{identity}:{index}',
+                            f'rl:{name}:{scope}:{identity}:{index - 1}',
+                            overlap, limit, 2 * window))
+            ends.append((index + 1) * window)
+
+        over = self.store.incr_windows(windows) if windows else None
+        if over is None:
+            return 0
+        return max(1, int(ends[over] - now))
+
+    def limit(self, name, account_field=None):
+        """
+        Decorator enforcing the RATE_LIMITS rule with the given name.
+
+        Args:
+            name (str): Key of the rule in the RATE_LIMITS configuration
+            account_field (str, optional): Request field identifying the account
+                                           used for the 'account' scope
+
+        Response codes:
+            - 429: Returned when the client exceeded one of the limits
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated(*args, **kwargs):
+                rule = current_app.config.get('RATE_LIMITS', {}).get(name)
+                if not rule or not current_app.config.get('RATELIMIT_ENABLED', True):
+                    return f(*args, **kwargs)
+
+                identities = {'ip': client_ip(self.trusted_proxies)}
+                if account_field:
+                    identities['account'] = request_field(account_field)
+
+                retry_after = self.hit(name, identities, rule)
+                self._record(name, retry_after == 0)
+                if retry_after:
+                    response = jsonify({'error': 'Troppe richieste. Riprova tra qualche istante.'})
+                    response.status_code = 429
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response
+                return f(*args, **kwargs)
+            return decorated
+        return decorator
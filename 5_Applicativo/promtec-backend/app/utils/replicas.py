@@ -0,0 +1,287 @@
+"""
+Read Replica Routing Module.
+
+This module sends the reads of GET requests to MySQL read replicas, so the
+listings loaded by every teacher on enrollment day do not compete with the
+enrollment writes on the primary database.
+
+Routing rules:
+- Only SELECT statements of GET/HEAD requests go to a replica; every write,
+  SELECT ... FOR UPDATE, raw SQL, background job and script uses the primary.
+- Once the session of a request has flushed a write, its next reads use the
+  primary too.
+- Read-your-writes: after a request of a user wrote to the database, the
+  requests of that user read from the primary for REPLICA_STICKY_SECONDS.
+- A replica whose replication lag exceeds REPLICA_MAX_LAG, or that cannot be
+  reached, is skipped until its next lag check.
+- A read failing on a replica (connection lost, database error) is retried on
+  the primary, and the replica is skipped until its next lag check.
+
+The replicas are declared as Flask-SQLAlchemy binds named 'replica_0',
+'replica_1', ... from the DATABASE_REPLICA_URLS setting. Any database can be
+used as a replica for local tests (for example a copy of an SQLite file); the
+lag is only measured on MySQL replicas.
+"""
+import itertools
+import logging
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import DisconnectionError, OperationalError
+from sqlalchemy.sql import Select
+from .response_cache import limit_cache_ttl, require_fresh_response
+from .shared_store import create_store
+from .stats import register_stats_provider
+
+logger = logging.getLogger(__name__)
+
+# Methods whose reads can be served by a replica
+READ_METHODS = ('GET', 'HEAD')
+
+
+class RoutingSession(Session):
+    """
+    Session sending the reads of read-only requests to a replica.
+
+    Used as the session class of the application (see extensions.py). Without
+    configured replicas it behaves exactly as the Flask-SQLAlchemy session.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not self.info.get('wrote') and is_replica_read(clause):
+            router = current_app.extensions.get('replica_router')
+            engine = router.read_engine() if router else None
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _execute_internal(self, statement, *args, **kwargs):
+        # Common path of execute(), scalars() and scalar(), also used by queries and lazy loads
+        try:
+            return super()._execute_internal(statement, *args, **kwargs)
+        except (OperationalError, DisconnectionError) as e:
+            replica = g.get('database_replica') if has_request_context() else None
+            if replica is None or g.get('database_primary') or self.info.get('wrote') or not is_replica_read(statement):
+                raise
+            router = current_app.extensions['replica_router']
+            router.mark_unavailable(replica, e)
+            router.use_primary()
+            return super()._execute_internal(statement, *args, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _remember_write(session, flush_context):
+    """Keep the rest of the session on the primary and mark the request as a write"""
+    session.info['wrote'] = True
+    if has_request_context():
+        g.database_wrote = True
+
+
+def is_replica_read(clause):
+    """
+    Check whether a statement may be executed on a replica.
+
+    Args:
+        clause: The statement being executed, None for a lazy load without statement
+
+    Returns:
+        bool: True for a plain SELECT (not FOR UPDATE) in a GET or HEAD request
+    """
+    if not has_request_context() or request.method not in READ_METHODS:
+        return False
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+class ReplicaRouter:
+    """
+    Chooses the replica serving the reads of each request, used as a Flask extension.
+
+    Usage:
+        replicas = ReplicaRouter()
+        replicas.init_app(app)  # Before db.init_app(app)
+
+        replicas.identify(user.id)  # Once the user of the request is known
+    """
+
+    def __init__(self):
+        self.names = []
+        self.store = None
+        self.sticky_seconds = 0
+        self.max_lag = 0
+        self.check_interval = 0
+        self.cache_ttl = 0
+        self._lock = threading.Lock()
+        self._cycle = None
+        self._health = {}
+        self._stats = {'replica_requests': 0, 'sticky_requests': 0, 'lagging_fallbacks': 0, 'replica_errors': 0}
+
+    def init_app(self, app):
+        """
+        Declare the replicas of DATABASE_REPLICA_URLS as binds and read the
+        REPLICA_* settings.
+
+        Must be called before db.init_app(), which creates the engines of the binds.
+
+        Raises:
+            RuntimeError: If the read-your-writes windows are kept per process
+                          while the application runs in several worker processes
+        """
+        urls = app.config.get('DATABASE_REPLICA_URLS') or []
+        self.names = [f'replica_{index}' for index in range(len(urls))]
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.update(zip(self.names, urls))
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+        store_uri = app.config.get('REPLICA_STICKY_STORE_URI') or 'memory://'
+        if urls and store_uri == 'memory://' and app.config.get('WORKER_PROCESSES', 1) > 1:
+            # The next request of a user could land on another worker and read a lagging replica
+            raise RuntimeError('REPLICA_STICKY_STORE_URI must be a shared store when running several workers')
+        # Without replicas the windows are never read
+        self.store = create_store(store_uri if urls else 'memory://')
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 5)
+        self.max_lag = app.config.get('REPLICA_MAX_LAG', 2)
+        self.check_interval = app.config.get('REPLICA_LAG_CHECK_INTERVAL', 5)
+        self.cache_ttl = app.config.get('REPLICA_RESPONSE_CACHE_TTL', 10)
+        self._cycle = itertools.cycle(self.names)
+        self._health = {name: {'lag': None, 'available': True, 'checked_at': 0.0} for name in self.names}
+
+        if self.names:
+            app.extensions['replica_router'] = self
+            app.after_request(self._remember_writer)
+            register_stats_provider('replicas', self.stats)
+
+    def engines(self):
+        """Return the engines of the replicas by bind name (needs an application context)"""
+        engines = current_app.extensions['sqlalchemy'].engines
+        return {name: engines[name] for name in self.names}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        """Return the routing counters and the last measured state of every replica"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['replicas'] = {name: {'lag': health['lag'], 'available': health['available']}
+                                 for name, health in self._health.items()}
+        return stats
+
+    def _measure_lag(self, engine):
+        """
+        Measure the replication lag of a replica in seconds.
+
+        Returns:
+            float: The lag, 0 for a database that is not a replica (local test
+                   instances) and None when replication is stopped
+        """
+        if engine.dialect.name != 'mysql':
+            return 0
+        with engine.connect() as connection:
+            try:
+                row = connection.execute(text('SHOW REPLICA STATUS')).mappings().first()
+                column = 'Seconds_Behind_Source'
+            except Exception:
+                # MySQL before 8.0.22
+                connection.rollback()
+                row = connection.execute(text('SHOW SLAVE STATUS')).mappings().first()
+                column = 'Seconds_Behind_Master'
+        if row is None:
+            return 0
+        return row[column]
+
+    def _is_usable(self, name):
+        """Check whether a replica is reachable and within the lag limit, measuring it when due"""
+        health = self._health[name]
+        now = time.monotonic()
+        if now - health['checked_at'] >= self.check_interval:
+            health['checked_at'] = now  # Other threads keep the previous result meanwhile
+            try:
+                lag = self._measure_lag(self.engines()[name])
+                health.update(lag=lag, available=lag is not None and lag <= self.max_lag)
+            except Exception as e:
+                logger.error("Replica %s unreachable: %s", name, e)
+                health.update(lag=None, available=False)
+        return health['available']
+
+    def mark_unavailable(self, name, error):
+        """
+        Skip a replica that failed a read until its next lag check.
+
+        Args:
+            name (str): Bind name of the replica
+            error (Exception): The error raised by the read
+        """
+        logger.error("Replica %s failed, reading from the primary: %s", name, error)
+        with self._lock:
+            self._health[name].update(available=False, checked_at=time.monotonic())
+            self._stats['replica_errors'] += 1
+
+    def _choose(self):
+        """Return the name of the next usable replica in turn, or None"""
+        with self._lock:
+            candidates = [next(self._cycle) for _ in self.names]
+        for name in candidates:
+            if self._is_usable(name):
+                return name
+        return None
+
+    def read_engine(self):
+        """
+        Return the replica engine serving the reads of the current request.
+
+        The replica is chosen on the first read and kept for the whole request,
+        so all its reads see the same state of the database.
+
+        Returns:
+            Engine: The replica engine, or None to read from the primary
+        """
+        if g.get('database_primary'):
+            return None
+        if 'database_replica' not in g:
+            g.database_replica = self._choose()
+            if g.database_replica is None:
+                self._count('lagging_fallbacks')
+            else:
+                self._count('replica_requests')
+                # Responses rendered from a replica may miss the latest writes of other users
+                limit_cache_ttl(self.cache_ttl)
+        if g.database_replica is None:
+            return None
+        return current_app.extensions['sqlalchemy'].engines[g.database_replica]
+
+    def reading_from_replica(self):
+        """Check whether the reads of the current request went to a replica"""
+        return bool(self.names) and has_request_context() and g.get('database_replica') is not None
+
+    def use_primary(self):
+        """Send the remaining reads of the current request to the primary"""
+        if has_request_context():
+            g.database_primary = True
+
+    def identify(self, user_id):
+        """
+        Declare the user of the current request.
+
+        Requests of a user who wrote to the database in the last
+        REPLICA_STICKY_SECONDS read from the primary and skip the response
+        cache, so the user always sees the result of their own changes.
+
+        Args:
+            user_id (int): ID of the authenticated user
+        """
+        if not self.names or not has_request_context():
+            return
+        g.database_client = user_id
+        if request.method in READ_METHODS and self.store.get(f'replica-sticky:{user_id}'):
+            self._count('sticky_requests')
+            self.use_primary()
+            require_fresh_response()
+
+    def _remember_writer(self, response):
+        """Start the read-your-writes window of a user whose request wrote to the database"""
+        if g.get('database_wrote') and g.get('database_client') is not None and response.status_code < 400:
+            self.store.set(f'replica-sticky:{g.database_client}', 1, ttl=self.sticky_seconds)
+        return response
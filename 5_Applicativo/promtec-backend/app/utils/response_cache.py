@@ -0,0 +1,212 @@
+"""
+Response Cache Module.
+
+This module caches the rendered JSON responses of hot read endpoints, such as the
+slot listing loaded by every teacher on enrollment day.
+
+Entries are keyed by endpoint, normalized query parameters, the caller's
+visibility (admin or not) and the current date. Every entry also records the
+version of the tags it depends on (for example 'slot:42' for each slot on a
+page). Write endpoints bump the version of the tags they touch, and an entry
+whose tag versions changed is treated as a miss, so invalidation is precise
+without having to know which keys contain a given slot.
+
+Entries live in a process-local LRU cache by default. The tag versions always
+live in a store shared by all the workers of the host (CACHE_VERSIONS_URI, a
+SQLite file by default), so a write served by one worker invalidates the
+entries of every worker. Setting RESPONSE_CACHE_URI to a shared store (see
+shared_store.py) also shares the entries.
+"""
+import hashlib
+import pickle
+import threading
+import time
+from datetime import date
+from functools import wraps
+from flask import Response, current_app, g, request
+from .lru import LRUCache
+from .shared_store import create_store
+from .stats import register_stats_provider
+
+
+def add_cache_tags(*tags):
+    """
+    Declare tags the response of the current request depends on.
+
+    Called by cached view functions once they know which rows they rendered.
+
+    Args:
+        *tags (str): Tags such as 'slot:42'
+    """
+    if not hasattr(g, 'response_cache_tags'):
+        g.response_cache_tags = set()
+    g.response_cache_tags.update(tags)
+
+
+def limit_cache_ttl(seconds):
+    """
+    Limit the lifetime of the response cached for the current request.
+
+    Used when the response is rendered from data that may lag behind the
+    primary database (read replicas), so a stale entry expires quickly.
+
+    Args:
+        seconds (float): Maximum lifetime of the entry
+    """
+    g.response_cache_ttl = min(seconds, g.get('response_cache_ttl', seconds))
+
+
+def require_fresh_response():
+    """
+    Render the response of the current request instead of reading it from the cache.
+
+    Used for a user who just changed data and must see the change; the rendered
+    response is still stored for the next requests.
+    """
+    g.response_cache_fresh = True
+
+
+class ResponseCache:
+    """
+    Cache of rendered responses with tag-based invalidation, used as a Flask extension.
+
+    Usage:
+        response_cache = ResponseCache()
+        response_cache.init_app(app)
+
+        @response_cache.cached('slots:set', vary=lambda: user.is_admin)
+        def get_slots(): ...
+
+        response_cache.invalidate('slot:42')
+    """
+
+    def __init__(self):
+        self.entries = None
+        self.versions = None
+        self.enabled = False
+        self.ttl = None
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'saved_seconds': 0.0, 'invalidations': 0}
+
+    def init_app(self, app):
+        """
+        Configure the cache from RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_URI,
+        CACHE_VERSIONS_URI, RESPONSE_CACHE_SIZE and RESPONSE_CACHE_TTL.
+
+        Raises:
+            RuntimeError: If the tag versions are kept per process while the
+                          application runs in several worker processes
+        """
+        self.enabled = app.config.get('RESPONSE_CACHE_ENABLED', True)
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', 300)
+        uri = app.config.get('RESPONSE_CACHE_URI', 'memory://')
+        if uri == 'memory://':
+            self.entries = LRUCache(maxsize=app.config.get('RESPONSE_CACHE_SIZE', 2048), ttl=self.ttl)
+            versions_uri = app.config.get('CACHE_VERSIONS_URI') or 'memory://'
+            if versions_uri == 'memory://' and self.enabled and app.config.get('WORKER_PROCESSES', 1) > 1:
+                # The other workers would keep serving the entries a write invalidated
+                raise RuntimeError('CACHE_VERSIONS_URI must be a shared store when running several workers')
+            self.versions = create_store(versions_uri)
+        else:
+            store = create_store(uri)
+            self.entries = store
+            self.versions = store
+        app.extensions['response_cache'] = self
+        register_stats_provider('response_cache', self.stats)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self):
+        """Return the hit ratio and the time saved by serving cached responses"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses'] + stats['stale']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+        stats['saved_seconds'] = round(stats['saved_seconds'], 3)
+        if isinstance(self.entries, LRUCache):
+            stats['size'] = len(self.entries)
+        return stats
+
+    def _tag_versions(self, tags):
+        tags = sorted(tags)
+        values = self.versions.get_many([f'cache-tag:{tag}' for tag in tags])
+        return {tag: int(value or 0) for tag, value in zip(tags, values)}
+
+    def invalidate(self, *tags):
+        """
+        Invalidate every cached response depending on one of the tags.
+
+        Args:
+            *tags (str): Tags to invalidate, for example 'slots:set' or 'slot:42'
+        """
+        if not self.enabled:
+            return
+        for tag in set(tags):
+            self.versions.incr(f'cache-tag:{tag}')
+        self._count('invalidations', len(set(tags)))
+
+    def _get(self, key):
+        value = self.entries.get(key)
+        if value is not None and not isinstance(self.entries, LRUCache):
+            value = pickle.loads(value)
+        return value
+
+    def _set(self, key, value, ttl=None):
+        if isinstance(self.entries, LRUCache):
+            self.entries.set(key, value, ttl=ttl)
+        else:
+            self.entries.set(key, pickle.dumps(value), ttl=ttl or self.ttl)
+
+    def cached(self, *tags, vary=None):
+        """
+        Decorator caching the successful JSON responses of a read endpoint.
+
+        Args:
+            *tags (str): Tags every response of the endpoint depends on; the view
+                         can add more with add_cache_tags()
+            vary (callable, optional): Function returning an additional value the
+                                       response depends on (for example the admin status)
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated(*args, **kwargs):
+                if not self.enabled:
+                    return f(*args, **kwargs)
+
+                # Query parameters are sorted so equivalent URLs share one entry
+                params = sorted(request.args.items(multi=True))
+                raw_key = repr((request.endpoint, kwargs, params,
+                                vary() if vary else None, date.today().isoformat()))
+                key = 'response:' + hashlib.sha256(raw_key.encode()).hexdigest()
+
+                entry = None if g.get('response_cache_fresh') else self._get(key)
+                if entry is not None:
+                    if self._tag_versions(entry['tags']) == entry['tags']:
+                        self._count('hits')
+                        self._count('saved_seconds', entry['render_time'])
+                        response = Response(entry['body'], status=200, mimetype=entry['mimetype'])
+                        response.headers['X-Cache'] = 'HIT'
+                        return response
+                    self._count('stale')
+                else:
+                    self._count('misses')
+
+                started = time.perf_counter()
+                g.response_cache_tags = set(tags)
+                response = current_app.make_response(f(*args, **kwargs))
+                render_time = time.perf_counter() - started
+
+                if response.status_code == 200 and response.mimetype == 'application/json':
+                    self._set(key, {
+                        'body': response.get_data(),
+                        'mimetype': response.mimetype,
+                        # Versions read after rendering: a concurrent write makes the entry stale
+                        'tags': self._tag_versions(g.response_cache_tags),
+                        'render_time': render_time,
+                    }, ttl=g.get('response_cache_ttl'))
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return decorated
+        return decorator
@@ -0,0 +1,310 @@
+"""
+Shared Key-Value Store Module.
+
+This module provides a tiny key-value store abstraction used by components that
+need counters or cached values with an expiration time (for example the rate
+limiter). Two backends are available:
+
+- MemoryStore: process-local dictionary, the default and the cheapest option
+- SQLiteStore: a local SQLite file shared by all gunicorn workers on the same
+  host, used as a stand-in for a dedicated shared store
+
+The backend is selected with a URI ('memory://' or 'sqlite:////path/to/file.db').
+"""
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+# Writes of a SQLiteStore between two purges of its expired rows
+PURGE_EVERY = 1000
+
+
+def _window_estimate(current, previous, previous_weight):
+    """Hits of a sliding window from the counters of the current and previous fixed windows"""
+    return int(previous or 0) * previous_weight + int(current or 0)
+
+
+class MemoryStore:
+    """
+    Process-local key-value store with per-key expiration.
+
+    Expired keys are purged lazily and during a periodic sweep so the dictionary
+    cannot grow without bounds when many different keys are used.
+
+    Args:
+        max_keys (int): Number of keys after which a sweep of expired keys is forced
+    """
+
+    def __init__(self, max_keys=100000):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._max_keys = max_keys
+        self._ops = 0
+
+    def _sweep(self, now):
+        """Remove every expired key (caller must hold the lock)"""
+        expired = [key for key, (_, expires_at) in self._data.items() if expires_at and expires_at <= now]
+        for key in expired:
+            del self._data[key]
+
+    def _maybe_sweep(self, now):
+        self._ops += 1
+        if self._ops >= 1000 or len(self._data) >= self._max_keys:
+            self._ops = 0
+            self._sweep(now)
+
+    def get(self, key):
+        """Return the value stored for key, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at and expires_at <= now:
+                del self._data[key]
+                return None
+            return value
+
+    def get_many(self, keys):
+        """Return a list with the value of each key (None when missing)"""
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, ttl=None):
+        """Store a value, optionally expiring after ttl seconds"""
+        now = time.time()
+        with self._lock:
+            self._maybe_sweep(now)
+            self._data[key] = (value, now + ttl if ttl else None)
+
+    def incr(self, key, amount=1, ttl=None):
+        """
+        Atomically increment an integer counter and return the new value.
+
+        The expiration time is only set when the counter is created, so a window
+        counter expires at the end of its window regardless of later increments.
+        """
+        now = time.time()
+        with self._lock:
+            self._maybe_sweep(now)
+            item = self._data.get(key)
+            if item is None or (item[1] and item[1] <= now):
+                value, expires_at = 0, (now + ttl if ttl else None)
+            else:
+                value, expires_at = item
+            value += amount
+            self._data[key] = (value, expires_at)
+            return value
+
+    def _live(self, key, now):
+        """Return the value of a key that has not expired (caller must hold the lock)"""
+        item = self._data.get(key)
+        if item is None or (item[1] and item[1] <= now):
+            return None
+        return item[0]
+
+    def incr_windows(self, windows):
+        """
+        Atomically check sliding-window counters and increment them if all are under their limit.
+
+        Args:
+            windows (list): (current_key, previous_key, previous_weight, limit, ttl) tuples
+
+        Returns:
+            int: Index of the first window over its limit (nothing is incremented),
+                 or None if every counter was incremented
+        """
+        now = time.time()
+        with self._lock:
+            self._maybe_sweep(now)
+            for index, (current_key, previous_key, weight, limit, _) in enumerate(windows):
+                if _window_estimate(self._live(current_key, now), self._live(previous_key, now), weight) >= limit:
+                    return index
+            for current_key, _, _, _, ttl in windows:
+                value = self._live(current_key, now)
+                if value is None:
+                    self._data[current_key] = (1, now + ttl if ttl else None)
+                else:
+                    self._data[current_key] = (value + 1, self._data[current_key][1])
+            return None
+
+    def delete(self, key):
+        """Remove a key if present"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every key"""
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteStore:
+    """
+    Key-value store kept in a local SQLite file shared between processes.
+
+    Each thread uses its own connection. The database runs in WAL mode so that
+    readers in other workers are not blocked by writers. Every PURGE_EVERY
+    writes the expired rows are deleted, since keys such as the counters of a
+    rate limit window are never written again once their window is over.
+
+    Args:
+        path (str): Path of the SQLite database file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = itertools.count(1)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS kv ('
+            'key TEXT PRIMARY KEY, value BLOB, expires_at REAL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS kv_expires_at ON kv (expires_at)')
+        self.purge_expired()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def purge_expired(self):
+        """Delete every expired row"""
+        self._connection().execute('DELETE FROM kv WHERE expires_at <= ?', (time.time(),))
+
+    def _maybe_purge(self):
+        if next(self._writes) % PURGE_EVERY == 0:
+            self.purge_expired()
+
+    def get(self, key):
+        """Return the value stored for key, or None if missing or expired"""
+        row = self._connection().execute(
+            'SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_many(self, keys):
+        """Return a list with the value of each key (None when missing)"""
+        if not keys:
+            return []
+        placeholders = ','.join('?' for _ in keys)
+        rows = self._connection().execute(
+            f'SELECT key, value FROM kv WHERE key IN ({placeholders}) '
+            'AND (expires_at IS NULL OR expires_at > ?)',
+            (*keys, time.time())
+        ).fetchall()
+        found = dict(rows)
+        return [found.get(key) for key in keys]
+
+    def set(self, key, value, ttl=None):
+        """Store a value, optionally expiring after ttl seconds"""
+        expires_at = time.time() + ttl if ttl else None
+        self._connection().execute(
+            'INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, value, expires_at)
+        )
+        self._maybe_purge()
+
+    def incr(self, key, amount=1, ttl=None):
+        """Atomically increment an integer counter and return the new value"""
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # An expired counter starts again from zero
+            conn.execute('DELETE FROM kv WHERE key = ? AND expires_at <= ?', (key, now))
+            conn.execute(
+                'INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = value + excluded.value',
+                (key, amount, expires_at)
+            )
+            value = conn.execute('SELECT value FROM kv WHERE key = ?', (key,)).fetchone()[0]
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._maybe_purge()
+        return value
+
+    def incr_windows(self, windows):
+        """
+        Atomically check sliding-window counters and increment them if all are under their limit.
+
+        The check and the increments run in one write transaction, so concurrent
+        workers cannot all pass a limit that only one of them should pass.
+
+        Args:
+            windows (list): (current_key, previous_key, previous_weight, limit, ttl) tuples
+
+        Returns:
+            int: Index of the first window over its limit (nothing is incremented),
+                 or None if every counter was incremented
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            over = None
+            for index, (current_key, previous_key, weight, limit, _) in enumerate(windows):
+                found = dict(conn.execute(
+                    'SELECT key, value FROM kv WHERE key IN (?, ?) AND (expires_at IS NULL OR expires_at > ?)',
+                    (current_key, previous_key, now)
+                ).fetchall())
+                if _window_estimate(found.get(current_key), found.get(previous_key), weight) >= limit:
+                    over = index
+                    break
+            if over is None:
+                for current_key, _, _, _, ttl in windows:
+                    conn.execute('DELETE FROM kv WHERE key = ? AND expires_at <= ?', (current_key, now))
+                    conn.execute(
+                        'INSERT INTO kv (key, value, expires_at) VALUES (?, 1, ?) '
+                        'ON CONFLICT(key) DO UPDATE SET value = value + 1',
+                        (current_key, now + ttl if ttl else None)
+                    )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._maybe_purge()
+        return over
+
+    def delete(self, key):
+        """Remove a key if present"""
+        self._connection().execute('DELETE FROM kv WHERE key = ?', (key,))
+
+    def clear(self):
+        """Remove every key"""
+        self._connection().execute('DELETE FROM kv')
+
+
+def create_store(uri):
+    """
+    Create a store from a URI.
+
+    Args:
+        uri (str): 'memory://' for a process-local store or
+                   'sqlite:////absolute/path.db' for a store shared by local workers
+
+    Returns:
+        MemoryStore or SQLiteStore: The configured store
+
+    Raises:
+        ValueError: If the URI scheme is not supported
+    """
+    if not uri or uri == 'memory://':
+        return MemoryStore()
+    if uri.startswith('sqlite:///'):
+        return SQLiteStore(uri[len('sqlite:///'):])
+    raise ValueError(f"Unsupported store URI: {uri}")
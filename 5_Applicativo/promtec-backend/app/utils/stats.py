@@ -0,0 +1,43 @@
+"""
+Runtime Statistics Registry Module.
+
+Components that keep internal counters (rate limiter, caches, ...) register a
+provider function here. The monitoring blueprint collects all providers to
+expose the current values of the worker that serves the request.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Registered providers, name -> callable returning a JSON-serializable dict
+_providers = {}
+
+
+def register_stats_provider(name, provider):
+    """
+    Register a function returning the statistics of a component.
+
+    Args:
+        name (str): Name under which the statistics are exposed
+        provider (callable): Function without arguments returning a dict
+    """
+    _providers[name] = provider
+
+
+def collect_stats():
+    """
+    Collect the statistics of every registered provider.
+
+    A failing provider does not prevent the others from being collected.
+
+    Returns:
+        dict: Statistics keyed by provider name
+    """
+    stats = {}
+    for name, provider in _providers.items():
+        try:
+            stats[name] = provider()
+        except Exception as e:
+            logger.error("Stats provider %s failed: %s", name, e)
+            stats[name] = {'error': str(e)}
+    return stats
@@ -0,0 +1,230 @@
+"""
+Request Tracing Module.
+
+This module breaks the time of a request down into timed spans (SQL
+statements, Fernet operations, document rendering, LibreOffice conversions,
+email sends, ...). Requests slower than SLOW_REQUEST_THRESHOLD_MS write a
+structured record with the span tree and their most expensive statements to
+the slow request log (logs/slow_requests.log, one JSON object per line).
+
+To keep the overhead low enough for production, spans with the same name under
+the same parent are merged into one node counting the calls and adding up
+their time (a request decrypting 300 values has one 'fernet.decrypt' node), and
+only a timestamp pair is taken per span. Outside a request spans cost a single
+check.
+
+Usage:
+    with span('libreoffice.convert'):
+        subprocess.run(...)
+
+    @traced('enrollment.summaries')
+    def check_and_send_summaries(): ...
+"""
+import json
+import logging
+import time
+from functools import wraps
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Logger of the slow request records, its file handler is set up by the application factory
+slow_request_logger = logging.getLogger('slow_requests')
+
+# Statements listed in a slow request record and their maximum length
+TOP_QUERIES = 5
+STATEMENT_MAX_LENGTH = 500
+
+
+class Span:
+    """
+    Node of the span tree of a request.
+
+    Attributes:
+        name (str): Name of the operation
+        count (int): Number of merged calls
+        duration (float): Total time of the calls in seconds
+        children (dict): Child spans by name
+    """
+    __slots__ = ('name', 'count', 'duration', 'children')
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.duration = 0.0
+        self.children = {}
+
+    def child(self, name):
+        """Return the child span with this name, creating it on first use"""
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = Span(name)
+        return node
+
+    def to_dict(self):
+        """Return the span and its children, slowest first, with times in milliseconds"""
+        children = sorted(self.children.values(), key=lambda node: node.duration, reverse=True)
+        node = {'name': self.name, 'count': self.count, 'duration_ms': round(self.duration * 1000, 3)}
+        if children:
+            node['self_ms'] = round((self.duration - sum(child.duration for child in children)) * 1000, 3)
+            node['children'] = [child.to_dict() for child in children]
+        return node
+
+
+class Trace:
+    """Span tree and statement statistics of one request"""
+    __slots__ = ('root', 'stack', 'queries', 'started')
+
+    def __init__(self, name):
+        self.root = Span(name)
+        self.stack = [self.root]
+        self.queries = {}  # statement -> [count, seconds]
+        self.started = time.perf_counter()
+
+
+def _current_trace():
+    if has_request_context():
+        return g.get('trace')
+    return None
+
+
+class SpanTimer:
+    """Context manager timing a block as a span of the current request (see span())"""
+    __slots__ = ('name', 'trace', 'node', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.trace = _current_trace()
+        if self.trace is not None:
+            self.node = self.trace.stack[-1].child(self.name)
+            self.trace.stack.append(self.node)
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.trace is not None:
+            self.node.count += 1
+            self.node.duration += time.perf_counter() - self.started
+            self.trace.stack.pop()
+        return False
+
+
+def span(name):
+    """
+    Time a block as a span of the current request.
+
+    Does nothing outside a traced request.
+
+    Args:
+        name (str): Name of the operation, for example 'smtp.send'
+
+    Returns:
+        SpanTimer: The context manager timing the block
+    """
+    return SpanTimer(name)
+
+
+def traced(name):
+    """
+    Decorator recording every call of a function as a span.
+
+    Args:
+        name (str): Name of the span
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            with span(name):
+                return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_trace() is not None:
+        conn.info.setdefault('trace_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('trace_started')
+    trace = _current_trace()
+    if not started or trace is None:
+        return
+    duration = time.perf_counter() - started.pop()
+    node = trace.stack[-1].child('sql')
+    node.count += 1
+    node.duration += duration
+    stats = trace.queries.get(statement)
+    if stats is None:
+        stats = trace.queries[statement] = [0, 0.0]
+    stats[0] += 1
+    stats[1] += duration
+
+
+class Tracer:
+    """
+    Request tracing and slow request log, used as a Flask extension.
+
+    Settings:
+        TRACING_ENABLED: Trace the requests (default True)
+        SLOW_REQUEST_THRESHOLD_MS: Duration above which a request is logged
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.threshold = None
+
+    def init_app(self, app):
+        """Start a trace for every request and log the slow ones"""
+        self.enabled = app.config.get('TRACING_ENABLED', True)
+        self.threshold = app.config.get('SLOW_REQUEST_THRESHOLD_MS', 1000) / 1000
+        app.extensions['tracer'] = self
+        if not self.enabled:
+            return
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        app.before_request(self._start_trace)
+        app.after_request(self._finish_trace)
+
+    def _start_trace(self):
+        g.trace = Trace(request.endpoint or 'unmatched')
+
+    def _finish_trace(self, response):
+        trace = g.pop('trace', None)
+        if trace is None:
+            return response
+        duration = time.perf_counter() - trace.started
+        if duration >= self.threshold:
+            trace.root.count = 1
+            trace.root.duration = duration
+            slow_request_logger.warning(json.dumps(self.slow_request_record(trace, response)))
+        return response
+
+    def slow_request_record(self, trace, response):
+        """
+        Build the structured record of a slow request.
+
+        Args:
+            trace (Trace): The finished trace of the request
+            response: The Flask response
+
+        Returns:
+            dict: Request, status, duration, span tree and most expensive statements
+        """
+        queries = sorted(trace.queries.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round(trace.root.duration * 1000, 3),
+            'spans': trace.root.to_dict(),
+            'top_queries': [
+                {'statement': statement[:STATEMENT_MAX_LENGTH], 'count': count, 'total_ms': round(seconds * 1000, 3)}
+                for statement, (count, seconds) in queries[:TOP_QUERIES]
+            ],
+        }
@@ -0,0 +1,31 @@
+"""
+Gunicorn Configuration.
+
+Loaded by the gunicorn command of the Dockerfile. The bind address and the
+number of workers are given on the command line; this file prepares the
+directory where every worker writes its Prometheus metrics, so the /metrics
+endpoint can aggregate the values of all the workers, and tells the workers
+how many of them there are (GUNICORN_WORKERS).
+"""
+import os
+import shutil
+
+# Must be set before the workers import prometheus_client
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/promtec-metrics')
+
+# Imported here: child_exit runs in the SIGCHLD handler of the master, where a
+# first import can be interrupted by the next worker exit
+from prometheus_client import multiprocess  # noqa: E402
+
+
+def on_starting(server):
+    """Start from an empty metrics directory, discarding the values of the previous run"""
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+    # Inherited by the workers, which refuse per-process cache invalidation when there are several
+    os.environ['GUNICORN_WORKERS'] = str(server.cfg.workers)
+
+
+def child_exit(server, worker):
+    """Drop the live gauges (requests in progress) of a worker that exited"""
+    multiprocess.mark_process_dead(worker.pid)
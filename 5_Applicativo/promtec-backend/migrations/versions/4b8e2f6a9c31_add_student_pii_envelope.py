@@ -0,0 +1,36 @@
+"""Add envelope storage for student PII
+
+Revision ID: 4b8e2f6a9c31
+Revises: 7c1d9e4a2b10
+Create Date: 2026-10-19 14:03:27.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b8e2f6a9c31'
+down_revision = '7c1d9e4a2b10'
+branch_labels = None
+depends_on = None
+
+# Columns that were NOT NULL before envelope rows could leave them empty
+REQUIRED_PII_COLUMNS = ('first_name', 'last_name', 'school_class', 'gender',
+                        'address', 'postal_code', 'city', 'mobile')
+
+
+def upgrade():
+    with op.batch_alter_table('student') as batch_op:
+        batch_op.add_column(sa.Column('pii', sa.LargeBinary(), nullable=True))
+        for column in REQUIRED_PII_COLUMNS:
+            batch_op.alter_column(column, existing_type=sa.String(length=255), nullable=True)
+    # Existing rows are converted by scripts/migrate_student_pii.py --to envelope
+
+
+def downgrade():
+    # Envelope rows must be converted back first: scripts/migrate_student_pii.py --to columns
+    with op.batch_alter_table('student') as batch_op:
+        for column in REQUIRED_PII_COLUMNS:
+            batch_op.alter_column(column, existing_type=sa.String(length=255), nullable=False)
+        batch_op.drop_column('pii')
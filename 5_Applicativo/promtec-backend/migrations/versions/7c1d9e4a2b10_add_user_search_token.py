@@ -0,0 +1,81 @@
+"""Add user search token index
+
+Revision ID: 7c1d9e4a2b10
+Revises: 2e20f453deb2
+Create Date: 2026-10-19 09:12:40.118204
+
+"""
+import unicodedata
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1d9e4a2b10'
+down_revision = '2e20f453deb2'
+branch_labels = None
+depends_on = None
+
+# Indexed fields of the user table
+SEARCH_FIELDS = ('email', 'first_name', 'last_name')
+
+# Users indexed per statement batch
+BATCH_SIZE = 1000
+
+
+def _normalize(value):
+    """Lower case and without accents, as app.user_management.search.normalize at this revision"""
+    if not value:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', value.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).strip()
+
+
+def _trigrams(row):
+    """Trigrams of the searchable fields of a user, as app.user_management.search.user_trigrams"""
+    tokens = set()
+    for name in SEARCH_FIELDS:
+        normalized = _normalize(getattr(row, name))
+        if normalized:
+            padded = f'  {normalized} '
+            tokens |= {padded[i:i + 3] for i in range(len(padded) - 2)}
+    return tokens
+
+
+def _index_existing_users():
+    """Fill the index of the users created before it existed, in primary key batches"""
+    connection = op.get_bind()
+    user = sa.table('user', sa.column('id', sa.Integer), *[sa.column(name) for name in SEARCH_FIELDS])
+    token = sa.table('user_search_token', sa.column('user_id', sa.Integer), sa.column('token', sa.String))
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(user).where(user.c.id > last_id).order_by(user.c.id).limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        tokens = [{'user_id': row.id, 'token': value} for row in rows for value in _trigrams(row)]
+        if tokens:
+            connection.execute(token.insert(), tokens)
+        last_id = rows[-1].id
+
+
+def upgrade():
+    op.create_table('user_search_token',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('token', sa.String(length=12), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_user_search_token', 'user_search_token', ['token', 'user_id'], unique=False)
+    op.create_index('idx_user_search_token_user', 'user_search_token', ['user_id'], unique=False)
+    # Without entries the existing users would not be found by the search
+    _index_existing_users()
+
+
+def downgrade():
+    op.drop_index('idx_user_search_token_user', table_name='user_search_token')
+    op.drop_index('idx_user_search_token', table_name='user_search_token')
+    op.drop_table('user_search_token')
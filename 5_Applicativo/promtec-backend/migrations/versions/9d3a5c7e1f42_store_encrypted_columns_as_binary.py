@@ -0,0 +1,89 @@
+"""Store encrypted student columns as binary
+
+Revision ID: 9d3a5c7e1f42
+Revises: 4b8e2f6a9c31
+Create Date: 2026-10-19 16:41:05.930217
+
+"""
+import base64
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3a5c7e1f42'
+down_revision = '4b8e2f6a9c31'
+branch_labels = None
+depends_on = None
+
+ENCRYPTED_COLUMNS = ('first_name', 'last_name', 'school_class', 'gender', 'address',
+                     'postal_code', 'city', 'landline', 'mobile')
+
+# Rows re-encoded per statement batch
+BATCH_SIZE = 1000
+
+# First byte of a raw Fernet token
+FERNET_VERSION = 0x80
+
+
+def _to_raw(value):
+    """Convert a token stored as text into raw bytes"""
+    value = bytes(value) if not isinstance(value, str) else value.encode()
+    if not value or value[0] == FERNET_VERSION:
+        return value
+    return base64.urlsafe_b64decode(value)
+
+
+def _to_text(value):
+    """Convert a raw token into the bytes of its base64 text form"""
+    value = bytes(value) if not isinstance(value, str) else value.encode()
+    if value and value[0] == FERNET_VERSION:
+        return base64.urlsafe_b64encode(value)
+    return value
+
+
+def _reencode(convert):
+    """Rewrite every encrypted value of the student table with convert, in primary key batches"""
+    connection = op.get_bind()
+    student = sa.table('student', sa.column('id', sa.Integer),
+                       *[sa.column(name) for name in ENCRYPTED_COLUMNS])
+    statement = student.update().where(student.c.id == sa.bindparam('row_id')).values(
+        **{name: sa.bindparam(f'new_{name}') for name in ENCRYPTED_COLUMNS}
+    )
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(student).where(student.c.id > last_id).order_by(student.c.id).limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        connection.execute(statement, [
+            {'row_id': row.id, **{f'new_{name}': None if getattr(row, name) is None else convert(getattr(row, name))
+                                  for name in ENCRYPTED_COLUMNS}}
+            for row in rows
+        ])
+        last_id = rows[-1].id
+
+
+def _change_type(existing_type, new_type):
+    # SQLite column types are only affinities and a batch table copy would CAST the
+    # tokens to the new type, so SQLite databases keep their declared types
+    if op.get_bind().dialect.name == 'sqlite':
+        return
+    with op.batch_alter_table('student') as batch_op:
+        for name in ENCRYPTED_COLUMNS:
+            batch_op.alter_column(name, existing_type=existing_type, type_=new_type, existing_nullable=True)
+
+
+def upgrade():
+    # VARCHAR -> VARBINARY keeps the bytes of the text tokens, which are then re-encoded as raw tokens
+    _change_type(sa.String(length=255), sa.VARBINARY(length=255))
+    _reencode(_to_raw)
+    # Set ENCRYPTED_COLUMN_STORAGE=binary once the migration has run
+
+
+def downgrade():
+    # Values longer than 255 characters in text form (only possible in binary storage) must be shortened first
+    _reencode(_to_text)
+    _change_type(sa.VARBINARY(length=255), sa.String(length=255))
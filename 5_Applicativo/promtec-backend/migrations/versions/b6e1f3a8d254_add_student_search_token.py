@@ -0,0 +1,120 @@
+"""Add student search token index
+
+Revision ID: b6e1f3a8d254
+Revises: 9d3a5c7e1f42
+Create Date: 2026-10-19 15:41:07.532810
+
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import unicodedata
+from alembic import op
+import sqlalchemy as sa
+from cryptography.fernet import Fernet, MultiFernet
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e1f3a8d254'
+down_revision = '9d3a5c7e1f42'
+branch_labels = None
+depends_on = None
+
+# Indexed fields of the student table
+SEARCH_FIELDS = ('first_name', 'last_name')
+
+# Lengths of the indexed prefixes of every word, as app.slots.search at this revision
+SEARCH_PREFIX_MIN_LENGTH = 3
+SEARCH_PREFIX_MAX_LENGTH = 10
+
+# Students indexed per statement batch
+BATCH_SIZE = 1000
+
+# First byte of a raw Fernet token
+FERNET_VERSION = 0x80
+
+
+def _normalize(value):
+    """Lower case and without accents, as app.user_management.search.normalize at this revision"""
+    if not value:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', value.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).strip()
+
+
+def _fernet():
+    """Cipher of the student data, from FERNET_KEYS or FERNET_KEY like app.utils.crypto_utils"""
+    keys = [key.strip() for key in os.environ.get('FERNET_KEYS', os.environ.get('FERNET_KEY') or '').split(',')
+            if key.strip()]
+    return MultiFernet([Fernet(key) for key in keys])
+
+
+def _decrypt(cipher, value):
+    """Decrypt a token stored as raw bytes or as base64 text"""
+    value = value.encode() if isinstance(value, str) else bytes(value)
+    if value and value[0] == FERNET_VERSION:
+        value = base64.urlsafe_b64encode(value)
+    return cipher.decrypt(value).decode()
+
+
+def _tokens(cipher, key, row):
+    """Index tokens of a student, as app.slots.search.student_tokens"""
+    if row.pii is not None:
+        # Envelope rows keep every field in one encrypted JSON record
+        record = json.loads(_decrypt(cipher, row.pii))
+        names = [record.get(name) for name in SEARCH_FIELDS]
+    else:
+        names = [None if getattr(row, name) is None else _decrypt(cipher, getattr(row, name))
+                 for name in SEARCH_FIELDS]
+    prefixes = set()
+    for name in names:
+        for word in _normalize(name).split():
+            for length in range(SEARCH_PREFIX_MIN_LENGTH, min(len(word), SEARCH_PREFIX_MAX_LENGTH) + 1):
+                prefixes.add(word[:length])
+    return {hmac.new(key, prefix.encode(), hashlib.sha256).hexdigest()[:24] for prefix in prefixes}
+
+
+def _index_existing_students():
+    """Fill the index of the students created before it existed, in primary key batches"""
+    key = os.environ.get('STUDENT_SEARCH_KEY', '').encode()
+    if not key:
+        raise RuntimeError('STUDENT_SEARCH_KEY must be set to index the existing students')
+    cipher = _fernet()
+    connection = op.get_bind()
+    student = sa.table('student', sa.column('id', sa.Integer), sa.column('pii'),
+                       *[sa.column(name) for name in SEARCH_FIELDS])
+    token = sa.table('student_search_token', sa.column('student_id', sa.Integer), sa.column('token', sa.String))
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(student).where(student.c.id > last_id).order_by(student.c.id).limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        tokens = [{'student_id': row.id, 'token': value} for row in rows for value in _tokens(cipher, key, row)]
+        if tokens:
+            connection.execute(token.insert(), tokens)
+        last_id = rows[-1].id
+
+
+def upgrade():
+    op.create_table('student_search_token',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('token', sa.String(length=24), nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['student_id'], ['student.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_student_search_token', 'student_search_token', ['token', 'student_id'], unique=False)
+    op.create_index('idx_student_search_token_student', 'student_search_token', ['student_id'], unique=False)
+    # Without entries the existing students would not be found by the search
+    _index_existing_students()
+
+
+def downgrade():
+    op.drop_index('idx_student_search_token_student', table_name='student_search_token')
+    op.drop_index('idx_student_search_token', table_name='student_search_token')
+    op.drop_table('student_search_token')
@@ -0,0 +1,65 @@
+import os
+import sys
+import argparse
+import json
+import statistics
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.crypto_utils import (clear_decrypt_cache, decrypt_many, encrypt_value,
+                                    shutdown_decrypt_pools, DECRYPT_POOL_MIN_ITEMS)
+
+def worker_counts(maximum):
+    """Powers of two up to the number of cores, plus the number of cores itself."""
+    counts = [1]
+    while counts[-1] * 2 <= maximum:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != maximum:
+        counts.append(maximum)
+    return counts
+
+def main():
+    """Measure how bulk decryption scales with the number of pool processes."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--count', type=int, default=50000, help='Number of values to decrypt')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement (median reported)')
+    parser.add_argument('--chunk-size', type=int, default=None, help='Values per pool task')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1, help='Largest pool to measure')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    if args.count < DECRYPT_POOL_MIN_ITEMS:
+        sys.exit(f"--count must be at least DECRYPT_POOL_MIN_ITEMS ({DECRYPT_POOL_MIN_ITEMS}) to use the pool")
+
+    # Values similar to student fields (names, addresses, phone numbers)
+    tokens = [encrypt_value(f"Via delle Scuole {i}, 6900 Lugano") for i in range(args.count)]
+
+    results = []
+    for workers in worker_counts(args.max_workers):
+        # The first call starts the pool processes, which is not part of the measurement
+        clear_decrypt_cache()
+        decrypt_many(tokens[:DECRYPT_POOL_MIN_ITEMS], workers=workers, chunk_size=args.chunk_size)
+        durations = []
+        for _ in range(args.repeat):
+            clear_decrypt_cache()
+            started = time.perf_counter()
+            decrypt_many(tokens, workers=workers, chunk_size=args.chunk_size)
+            durations.append(time.perf_counter() - started)
+        seconds = statistics.median(durations)
+        results.append({'workers': workers, 'seconds': round(seconds, 4),
+                        'values_per_second': round(args.count / seconds)})
+    shutdown_decrypt_pools()
+
+    baseline = results[0]['seconds']
+    print(f"{args.count} values, {os.cpu_count()} cores")
+    print(f"{'workers':>8} {'seconds':>9} {'values/s':>10} {'speedup':>8}")
+    for result in results:
+        result['speedup'] = round(baseline / result['seconds'], 2)
+        print(f"{result['workers']:>8} {result['seconds']:>9.3f} {result['values_per_second']:>10} {result['speedup']:>7.2f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'count': args.count, 'cores': os.cpu_count(), 'results': results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import os
+import sys
+import argparse
+import json
+import statistics
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select, text
+from app import create_app
+from app.extensions import db
+from app.slots.models import Student, PII_FIELDS
+from app.utils.crypto_utils import clear_decrypt_cache
+from app.utils.encrypted_type import encrypted_column_storage
+
+def table_size():
+    """Get the bytes used by the encrypted columns and, on MySQL, by the whole table."""
+    table = Student.__table__
+    lengths = db.session.execute(
+        select(func.count(), *[func.coalesce(func.sum(func.length(table.c[field])), 0) for field in PII_FIELDS])
+    ).one()
+    size = {
+        'rows': lengths[0],
+        'column_bytes': {field: int(length) for field, length in zip(PII_FIELDS, lengths[1:])},
+    }
+    size['total_column_bytes'] = sum(size['column_bytes'].values())
+
+    if db.engine.dialect.name == 'mysql':
+        db.session.execute(text('ANALYZE TABLE student'))
+        data_length, index_length = db.session.execute(text(
+            "SELECT data_length, index_length FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = 'student'"
+        )).one()
+        size['data_length'] = int(data_length)
+        size['index_length'] = int(index_length)
+    return size
+
+def timed(function, repeat):
+    """Run a function several times and return the median duration in seconds."""
+    durations = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        clear_decrypt_cache()
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+def raw_scan():
+    """Read every encrypted column of every student without decrypting."""
+    table = Student.__table__
+    return db.session.execute(select(*[table.c[field] for field in PII_FIELDS])).fetchall()
+
+def decrypting_scan():
+    """Load every student and decrypt all of its fields."""
+    for student in Student.query.yield_per(1000):
+        student.pii_fields()
+
+def main():
+    """Report the size of the student table and the time needed to scan it."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (median reported)')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        results = {
+            'storage': encrypted_column_storage(),
+            'size': table_size(),
+            'raw_scan_seconds': timed(raw_scan, args.repeat),
+            'decrypting_scan_seconds': timed(decrypting_scan, args.repeat),
+        }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            before = json.load(f)
+        print(f"Comparison with {args.compare} ({before['storage']} -> {results['storage']}):")
+        metrics = [('total_column_bytes', before['size']['total_column_bytes'], results['size']['total_column_bytes'])]
+        if 'data_length' in before['size'] and 'data_length' in results['size']:
+            metrics.append(('data_length', before['size']['data_length'], results['size']['data_length']))
+        metrics.append(('raw_scan_seconds', before['raw_scan_seconds'], results['raw_scan_seconds']))
+        metrics.append(('decrypting_scan_seconds', before['decrypting_scan_seconds'], results['decrypting_scan_seconds']))
+        for name, old, new in metrics:
+            ratio = f"{new / old:.2f}x" if old else 'n/a'
+            print(f"  {name}: {old} -> {new} ({ratio})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import os
+import sys
+import argparse
+import json
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import date
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Password of every seeded account
+SEED_PASSWORD = 'benchmark'
+
+def percentile(ordered, fraction):
+    """Percentile of a sorted list, interpolated between the closest ranks."""
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def measure(name, request, count, warmup):
+    """
+    Call an endpoint repeatedly and summarize its latency.
+
+    Args:
+        name (str): Endpoint name, used in the progress output
+        request (callable): Function sending one request and returning the response
+        count (int): Number of measured requests
+        warmup (int): Number of requests sent before measuring
+
+    Returns:
+        dict: Latency percentiles in milliseconds, throughput and error count
+    """
+    for _ in range(warmup):
+        request()
+    durations = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(count):
+        request_started = time.perf_counter()
+        response = request()
+        durations.append(time.perf_counter() - request_started)
+        if response.status_code >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - started
+    durations.sort()
+    result = {
+        'requests': count,
+        'errors': errors,
+        'mean_ms': round(statistics.mean(durations) * 1000, 2),
+        'p50_ms': round(percentile(durations, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(durations, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(durations, 0.99) * 1000, 2),
+        'throughput_rps': round(count / elapsed, 1),
+    }
+    print(f"{name:24} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+          f"p99 {result['p99_ms']:8.2f} ms  {result['throughput_rps']:7.1f} req/s  {errors} errors")
+    return result
+
+def current_commit():
+    """The commit being benchmarked, if the code is a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    """
+    Measure the latency of the hot endpoints on a database with season volumes.
+
+    By default a temporary SQLite database is created and seeded with one
+    season of scripts/generate_dataset.py. With --database-url an existing
+    local database (for example a MySQL server started for the benchmark) is
+    used; it is seeded only if it has no slots.
+    Requests go through the Flask test client, so the results measure the
+    application and the database without the network and the WSGI server.
+    get_slots is measured twice: as clients see it (mostly served by the
+    response cache) and with a cache-busting parameter, so every request
+    renders the page.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='SQLAlchemy URL of the local database (default: temporary SQLite file)')
+    parser.add_argument('--slots', type=int, default=180, help='Slots of the seeded season')
+    parser.add_argument('--students', type=int, default=2500, help='Students of the seeded season')
+    parser.add_argument('--users-per-school', type=int, default=3, help='Teacher accounts per school')
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=10, help='Requests per endpoint sent before measuring')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the random data and request parameters')
+    parser.add_argument('--no-response-cache', action='store_true', help='Disable the response cache')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='benchmark-')
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    # Seeded data only: no outgoing email, and a random key unless one is configured
+    os.environ['SMTP_PASSWORD'] = ''
+    if not os.environ.get('FERNET_KEY') and not os.environ.get('FERNET_KEYS'):
+        from cryptography.fernet import Fernet
+        os.environ['FERNET_KEY'] = Fernet.generate_key().decode()
+    os.environ.setdefault('STUDENT_SEARCH_KEY', os.urandom(32).hex())
+    os.environ.setdefault('DEFAULT_ADMIN_EMAIL', 'admin@bench.example.ch')
+    os.environ.setdefault('DEFAULT_ADMIN_PASSWORD', SEED_PASSWORD)
+    os.environ.setdefault('LOG_DIR', workdir)
+
+    from app import create_app
+    from app.config import Config
+    from app.extensions import db
+    from app.security.models import User
+    from app.schools.models import School
+    from app.slots.models import Slot, Student, StudentEnrollment, GenderCategory
+    from app.utils.crypto_utils import shutdown_decrypt_pools
+    from faker import Faker
+    from generate_dataset import generate, student_values
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'SCHEDULER_ENABLED': False,
+        'RATELIMIT_ENABLED': False,
+        'RESPONSE_CACHE_ENABLED': Config.RESPONSE_CACHE_ENABLED and not args.no_response_cache,
+        'CACHE_VERSIONS_URI': f"sqlite:///{os.path.join(workdir, 'cache-versions.db')}",
+    })
+    rng = random.Random(args.seed)
+    fake = Faker('it_IT')
+    fake.seed_instance(args.seed)
+
+    with app.app_context():
+        if Slot.query.count() == 0:
+            started = time.perf_counter()
+            volumes = generate(rng, fake, 1, args.slots, args.students, args.users_per_school, date.today(),
+                               SEED_PASSWORD)
+            shutdown_decrypt_pools()
+            print(f"Seeded {volumes} in {time.perf_counter() - started:.1f}s")
+        else:
+            print("The database already has slots: using the existing data")
+        volumes = {'schools': School.query.count(), 'users': User.query.count(), 'slots': Slot.query.count(),
+                   'students': Student.query.count(), 'enrollments': StudentEnrollment.query.count()}
+        slot_ids = [slot_id for slot_id, in db.session.query(Slot.id).filter(Slot.is_locked == False)]
+        # New students may enroll in any of these slots, whatever their gender
+        mixed_slot_ids = [slot_id for slot_id, in db.session.query(Slot.id).filter(
+            Slot.is_locked == False, Slot.gender_category == GenderCategory.MIXED)]
+        teachers = [(user.email, user.school_name) for user in
+                    User.query.filter_by(is_admin=False, is_active=True, is_approved=True).filter(User.school_name.isnot(None))]
+        admin_email = User.query.filter_by(is_admin=True).first().email
+        pages = max(1, (len(slot_ids) + 9) // 10)
+
+    client = app.test_client()
+    def token_headers(email):
+        response = client.post('/api/security/login', data={'username': email, 'password': SEED_PASSWORD})
+        return {'Authorization': f"Bearer {response.get_json()['token']}"}
+    admin_headers = token_headers(admin_email)
+    teacher_email, teacher_school = rng.choice(teachers)
+    teacher_headers = token_headers(teacher_email)
+    cache_busters = iter(range(10 ** 9))
+
+    endpoints = {
+        'get_slots': lambda: client.get(f"/api/slots/?page={rng.randint(1, pages)}", headers=admin_headers),
+        # An unknown parameter is part of the cache key: every request misses the response cache
+        'get_slots_uncached': lambda: client.get(
+            f"/api/slots/?page={rng.randint(1, pages)}&nocache={next(cache_busters)}", headers=admin_headers),
+        'get_slot_enrollments': lambda: client.get(f"/api/slots/{rng.choice(slot_ids)}/enrollments",
+                                                   headers=admin_headers),
+        'create_enrollment': lambda: client.post(
+            f"/api/slots/{rng.choice(mixed_slot_ids)}/enrollments", headers=teacher_headers,
+            json={**student_values(rng, fake, teacher_school), 'school_name': teacher_school}),
+        'login_view': lambda: client.post('/api/security/login', data={
+            'username': rng.choice(teachers)[0], 'password': SEED_PASSWORD}),
+        'confirm_slot': lambda: client.post(f"/api/slots/{rng.choice(slot_ids)}/confirm", headers=admin_headers),
+    }
+
+    results = {
+        'commit': current_commit(),
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+        'response_cache': app.config['RESPONSE_CACHE_ENABLED'],
+        'volumes': volumes,
+        'endpoints': {name: measure(name, request, args.requests, args.warmup) for name, request in endpoints.items()},
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            before = json.load(f)
+        print(f"Comparison with {args.compare} (commit {before.get('commit')} -> {results['commit']}):")
+        for name, result in results['endpoints'].items():
+            old = before['endpoints'].get(name)
+            if not old:
+                continue
+            changes = []
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'):
+                ratio = f"{result[metric] / old[metric]:.2f}x" if old[metric] else 'n/a'
+                changes.append(f"{metric} {old[metric]} -> {result[metric]} ({ratio})")
+            print(f"  {name}: " + ', '.join(changes))
+
+if __name__ == "__main__":
+    main()
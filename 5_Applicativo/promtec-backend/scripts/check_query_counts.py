@@ -0,0 +1,271 @@
+import os
+import sys
+import argparse
+import json
+import subprocess
+import tempfile
+from collections import Counter
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# File storing the maximum number of queries of every endpoint
+DEFAULT_BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_budget.json')
+
+# Password of every seeded account
+SEED_PASSWORD = 'query-budget'
+
+# Endpoints measured, in order: (name, method, path, JSON body or None)
+# Read endpoints come first, then write endpoints that leave the seeded rows usable.
+ENDPOINTS = [
+    ('security.health', 'GET', '/api/security/health', None),
+    ('security.schools', 'GET', '/api/security/schools', None),
+    ('security.email', 'GET', '/api/security/email/2', None),
+    ('schools.list', 'GET', '/api/schools/', None),
+    ('schools.get', 'GET', '/api/schools/Scuola 0', None),
+    ('user_management.users', 'GET', '/api/user-management/users?per_page=100', None),
+    ('user_management.users_search', 'GET', '/api/user-management/users?per_page=100&search=utente', None),
+    ('user_management.users_cursor', 'GET', '/api/user-management/users?per_page=100&cursor=', None),
+    ('user_management.approved', 'GET', '/api/user-management/users/approved?per_page=100', None),
+    ('user_management.pending', 'GET', '/api/user-management/users/pending?per_page=100', None),
+    ('user_management.user', 'GET', '/api/user-management/users/2', None),
+    ('slots.list', 'GET', '/api/slots/?per_page=100', None),
+    ('slots.list_cursor', 'GET', '/api/slots/?per_page=100&cursor=', None),
+    ('slots.get', 'GET', '/api/slots/1', None),
+    ('slots.enum_values', 'GET', '/api/slots/enum-values', None),
+    ('slots.available_dates', 'GET', '/api/slots/available-dates', None),
+    ('slots.organization_info', 'GET', '/api/slots/organization-info', None),
+    ('slots.enrollments', 'GET', '/api/slots/1/enrollments', None),
+    ('slots.enrollments_sorted', 'GET', '/api/slots/1/enrollments?sort_by=last_name&page=1&per_page=100', None),
+    ('slots.export', 'GET', '/api/slots/enrollments/export', None),
+    ('slots.student_search', 'GET', '/api/slots/students/search?q=stud', None),
+    ('monitoring.stats', 'GET', '/api/monitoring/stats', None),
+    ('slots.create', 'POST', '/api/slots/', {
+        'date': '2031-06-02', 'time_period': 'Pomeriggio', 'department': 'Settore Chimica',
+        'gender_category': 'Misto', 'total_spots': 20, 'max_students_per_school': 5}),
+    ('slots.update', 'PUT', '/api/slots/1', {'total_spots': 500}),
+    ('slots.enroll', 'POST', '/api/slots/1/enrollments', {
+        'first_name': 'Nuovo', 'last_name': 'Iscritto', 'school_class': '3A', 'gender': 'Maschio',
+        'school_name': 'Scuola 0', 'address': 'Via Nuova 1', 'postal_code': '6500',
+        'city': 'Bellinzona', 'mobile': '0790000000'}),
+    ('slots.waiting_list', 'PUT', '/api/slots/enrollments/2/waiting-list', {'is_in_waiting_list': True}),
+    ('slots.update_student', 'PUT', '/api/slots/students/1', {'city': 'Lugano'}),
+    ('slots.confirm', 'POST', '/api/slots/1/confirm', None),
+    ('slots.unenroll', 'DELETE', '/api/slots/enrollments/3', None),
+    ('user_management.update_user', 'PUT', '/api/user-management/users/2', {'first_name': 'Modificato'}),
+    ('user_management.approve', 'POST', '/api/user-management/users/approve/3', {'is_approved': True}),
+    ('user_management.activate', 'POST', '/api/user-management/users/3/activate', {'is_active': True}),
+    ('schools.create', 'POST', '/api/schools/', {'name': 'Scuola nuova'}),
+    ('schools.update', 'PUT', '/api/schools/Scuola nuova', {'name': 'Scuola rinominata'}),
+    ('security.login', 'POST', '/api/security/login', None),
+    ('security.logout', 'POST', '/api/security/logout', None),
+]
+
+def check_letters():
+    """Load and render the letters of slot 1, without the PDF conversion that needs LibreOffice."""
+    from app.utils.letter import load_letter_enrollments, letter_context
+    slot, enrollments = load_letter_enrollments(1)
+    for enrollment in enrollments:
+        letter_context(enrollment.student, slot)
+
+def check_summary_email():
+    """Build the summary email of the seeded activity (not sent: SMTP_PASSWORD is empty)."""
+    from app.slots.models import EnrollmentActivity
+    from app.security.models import User
+    from app.utils.email_utils import send_enrollment_summary_email
+    activity = EnrollmentActivity.query.filter_by(email_sent=False).first()
+    user = User.query.get(activity.user_id)
+    send_enrollment_summary_email(user_email=user.email, user_name=f"{user.first_name} {user.last_name}",
+                                  enrollments=activity.summary_enrollments())
+
+def check_summaries():
+    """Run the periodic summary job, which marks the seeded activity as sent."""
+    from app.slots.models import EnrollmentActivity
+    EnrollmentActivity.check_and_send_summaries()
+
+# Background jobs measured after the endpoints, in order: (name, function)
+JOBS = [
+    ('letters.slot', check_letters),
+    ('email.enrollment_summary', check_summary_email),
+    ('jobs.enrollment_summaries', check_summaries),
+]
+
+# Every measured code path
+CHECKS = [name for name, _, _, _ in ENDPOINTS] + [name for name, _ in JOBS]
+
+def seed(size):
+    """
+    Fill the empty database with size schools, users and slots, each slot
+    holding size enrollments, so every listing grows with the size. The first
+    user enrolled a student in every slot 45 minutes ago and has a pending
+    enrollment summary.
+    """
+    from datetime import date, datetime, timedelta
+    from werkzeug.security import generate_password_hash
+    from app.extensions import db
+    from app.security.models import School, User, UserApproval
+    from app.slots.models import (Slot, Student, StudentEnrollment, EnrollmentActivity, TimePeriod, Department,
+                                  GenderCategory, Gender)
+
+    password = generate_password_hash(SEED_PASSWORD, method='pbkdf2:sha256')
+    admin = User.query.filter_by(is_admin=True).first()
+    for i in range(size):
+        db.session.add(School(name=f'Scuola {i}'))
+    db.session.flush()
+    users = []
+    for i in range(size):
+        user = User(email=f'utente{i}@example.ch', password=password, first_name='Utente', last_name=str(i),
+                    school_name=f'Scuola {i}', is_admin=False, is_approved=i % 2 == 0)
+        db.session.add(user)
+        users.append(user)
+    db.session.flush()
+    for user in users:
+        if user.is_approved:
+            db.session.add(UserApproval(is_approved=True, user_admin_id=admin.id, user_to_approve_id=user.id))
+
+    students = []
+    for i in range(size):
+        student = Student(first_name=f'Studente{i}', last_name=f'Cognome{i}', school_class='3A',
+                          school_name=f'Scuola {i}', gender=Gender.BOY, address=f'Via {i}',
+                          postal_code='6500', city='Bellinzona', mobile=f'079{i:07d}')
+        db.session.add(student)
+        students.append(student)
+    for i in range(size):
+        slot = Slot(date=date.today() + timedelta(days=30 + i), time_period=TimePeriod.MORNING,
+                    department=list(Department)[i % len(Department)], gender_category=GenderCategory.MIXED,
+                    total_spots=size * 2, max_students_per_school=size * 2)
+        db.session.add(slot)
+        db.session.flush()
+        for j, student in enumerate(students):
+            db.session.add(StudentEnrollment(slot_id=slot.id, student_id=student.id, user_id=users[j].id))
+    db.session.flush()
+
+    now = datetime.utcnow()
+    StudentEnrollment.query.filter_by(user_id=users[0].id).update({'created_at': now - timedelta(minutes=45)})
+    db.session.add(EnrollmentActivity(user_id=users[0].id, last_activity=now - timedelta(minutes=40),
+                                      email_sent=False))
+    db.session.commit()
+
+def measure(size, output):
+    """Seed a throwaway database of the given size and count the queries of every endpoint and job."""
+    from cryptography.fernet import Fernet
+    workdir = tempfile.mkdtemp(prefix='query-budget-')
+    # Throwaway data: a random key and no outgoing email
+    os.environ.setdefault('FERNET_KEY', Fernet.generate_key().decode())
+    os.environ.setdefault('STUDENT_SEARCH_KEY', os.urandom(32).hex())
+    os.environ['SMTP_PASSWORD'] = ''
+    os.environ['DEFAULT_ADMIN_EMAIL'] = 'admin@example.ch'
+    os.environ['DEFAULT_ADMIN_PASSWORD'] = SEED_PASSWORD
+    os.environ['LOG_DIR'] = workdir
+
+    from app import create_app
+    from app.utils.query_counter import count_queries
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(workdir, "budget.db")}',
+        'SCHEDULER_ENABLED': False,
+        'RATELIMIT_ENABLED': False,
+        'RESPONSE_CACHE_ENABLED': False,
+    })
+    client = app.test_client()
+    with app.app_context():
+        seed(size)
+
+    credentials = {'username': 'admin@example.ch', 'password': SEED_PASSWORD}
+    token = client.post('/api/security/login', data=credentials).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    results = {}
+    with app.app_context():
+        for name, method, path, body in ENDPOINTS:
+            with count_queries() as counter:
+                if name == 'security.login':
+                    response = client.post(path, data=credentials)
+                else:
+                    response = client.open(path, method=method, json=body, headers=headers)
+            results[name] = {'status': response.status_code, 'count': counter.count,
+                             'statements': counter.statements}
+    for name, job in JOBS:
+        # A fresh application context per job, so no row is already in the session
+        with app.app_context():
+            with count_queries() as counter:
+                job()
+            results[name] = {'status': 200, 'count': counter.count, 'statements': counter.statements}
+    with open(output, 'w') as f:
+        json.dump(results, f)
+
+def run_size(size):
+    """Measure one size in a fresh process, so no in-process cache is shared between sizes."""
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        output = f.name
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', str(size), '--output', output],
+                             capture_output=True, text=True)
+    if process.returncode:
+        sys.exit(f"Measuring {size} rows failed:\n{process.stderr}")
+    with open(output) as f:
+        results = json.load(f)
+    os.remove(output)
+    return results
+
+def print_statements(statements):
+    """Print the executed statements, most repeated first."""
+    for statement, count in Counter(statements).most_common():
+        print(f"      {count}x {' '.join(statement.split())[:200]}")
+
+def main():
+    """
+    Check that the number of SQL queries of every endpoint and background job
+    does not grow with the data.
+
+    Every endpoint and job is run on a small and on a large seeded database. A
+    check fails if its query count differs between the two sizes (a query
+    per row) or exceeds its budget in the budget file. Run with --record to
+    write the current counts as the new budget.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--small', type=int, default=3, help='Rows per table of the small database')
+    parser.add_argument('--large', type=int, default=15, help='Rows per table of the large database')
+    parser.add_argument('--budget', default=DEFAULT_BUDGET_FILE, help='Budget file')
+    parser.add_argument('--record', action='store_true', help='Write the measured counts to the budget file')
+    parser.add_argument('--measure', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.output)
+        return
+
+    small = run_size(args.small)
+    large = run_size(args.large)
+    budget = {}
+    if os.path.exists(args.budget) and not args.record:
+        with open(args.budget) as f:
+            budget = json.load(f)
+
+    failures = 0
+    for name in CHECKS:
+        small_result, large_result = small[name], large[name]
+        problems = []
+        if large_result['status'] >= 400:
+            problems.append(f"status {large_result['status']}")
+        if large_result['count'] != small_result['count']:
+            problems.append(f"{small_result['count']} queries with {args.small} rows, "
+                            f"{large_result['count']} with {args.large} rows")
+        if name in budget and large_result['count'] > budget[name]:
+            problems.append(f"{large_result['count']} queries, budget is {budget[name]}")
+        elif budget and name not in budget:
+            problems.append("no budget recorded")
+
+        print(f"{'FAIL' if problems else 'ok':4} {name:34} {large_result['count']:3} queries"
+              + (f"  ({'; '.join(problems)})" if problems else ''))
+        if problems:
+            failures += 1
+            print_statements(large_result['statements'])
+
+    if args.record:
+        with open(args.budget, 'w') as f:
+            json.dump({name: large[name]['count'] for name in CHECKS}, f, indent=2)
+            f.write('\n')
+        print(f"Budget written to {args.budget}")
+    if failures:
+        sys.exit(f"{failures} checks failed the query count check")
+
+if __name__ == "__main__":
+    main()
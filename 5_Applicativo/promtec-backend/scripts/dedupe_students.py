@@ -0,0 +1,184 @@
+import os
+import sys
+import argparse
+import re
+import time
+from collections import defaultdict
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, select, update
+from app import create_app
+from app.extensions import db, response_cache
+from app.slots.models import Slot, Student, StudentEnrollment, StudentSearchToken, PII_FIELDS
+from app.user_management.search import normalize
+from app.utils.crypto_utils import blind_index
+
+# Fields compared as phone numbers: only the digits are significant
+PHONE_FIELDS = ('landline', 'mobile')
+
+def identity_fingerprint(student):
+    """
+    Get the keyed fingerprint of the normalized identity of a student.
+
+    Two students are duplicates when every PII field and the school match
+    after normalization (case, accents and repeated spaces are ignored, phone
+    numbers are compared on their digits). The fingerprint is a keyed HMAC, so
+    the groups can be kept in memory without holding the plaintext.
+    """
+    fields = student.pii_fields()
+    parts = []
+    for field in PII_FIELDS:
+        value = normalize(fields[field])
+        if field in PHONE_FIELDS:
+            value = re.sub(r'\D', '', value)
+        parts.append(' '.join(value.split()))
+    parts.append(normalize(student.school_name))
+    return blind_index('\x1f'.join(parts))
+
+def find_duplicate_sets(batch_size):
+    """
+    Stream every student and group them by identity fingerprint.
+
+    Students are loaded with yield_per and their PII is decrypted one
+    partition at a time, then the partition is removed from the session, so
+    memory only grows with the number of fingerprints.
+
+    Returns:
+        tuple: (number of scanned students, list of duplicate sets as sorted ID lists)
+    """
+    groups = defaultdict(list)
+    scanned = 0
+    result = db.session.execute(
+        select(Student).order_by(Student.id).execution_options(yield_per=batch_size)
+    ).scalars()
+    for students in result.partitions():
+        Student.prefetch_pii(students)
+        for student in students:
+            groups[identity_fingerprint(student)].append(student.id)
+            db.session.expunge(student)
+        scanned += len(students)
+    db.session.rollback()
+    return scanned, [ids for ids in groups.values() if len(ids) > 1]
+
+def plan_merge(ids):
+    """
+    Decide what happens to the enrollments of a duplicate set.
+
+    The oldest student survives. For every slot one enrollment is kept: an
+    enrollment holding a place is preferred to one on the waiting list, then
+    the survivor's enrollment to a duplicate's, then the oldest one. The other
+    enrollments of the same slot would conflict and are dropped.
+
+    Returns:
+        tuple: (survivor ID, IDs of enrollments to move, IDs of enrollments to drop, affected slot IDs)
+    """
+    survivor = ids[0]
+    rows = db.session.execute(
+        select(StudentEnrollment.id, StudentEnrollment.student_id, StudentEnrollment.slot_id)
+        .where(StudentEnrollment.student_id.in_(ids))
+        .order_by(StudentEnrollment.slot_id, StudentEnrollment.is_in_waiting_list,
+                  StudentEnrollment.student_id != survivor, StudentEnrollment.id)
+    ).all()
+    kept_slots = set()
+    moved, dropped = [], []
+    for enrollment_id, student_id, slot_id in rows:
+        if slot_id in kept_slots:
+            dropped.append(enrollment_id)
+            continue
+        kept_slots.add(slot_id)
+        if student_id != survivor:
+            moved.append(enrollment_id)
+    return survivor, moved, dropped, sorted({slot_id for _, _, slot_id in rows})
+
+def merge_set(ids):
+    """
+    Merge one duplicate set in a single transaction.
+
+    The students are locked and their fingerprints checked again, so a student
+    edited since the scan is left out of the merge. Enrollments are re-pointed
+    and dropped with set-based statements, then the duplicates are deleted.
+    The statements bypass the ORM events, so the affected slots lose their
+    confirmation here, as they would when their enrollments change through the
+    API. The cached responses of the slots are invalidated through the version
+    store shared with the workers (CACHE_VERSIONS_URI).
+
+    Returns:
+        tuple: (survivor ID, merged duplicate IDs, moved enrollments, dropped enrollments), or None
+    """
+    students = Student.query.filter(Student.id.in_(ids)).order_by(Student.id).with_for_update().all()
+    Student.prefetch_pii(students)
+    if not students:
+        db.session.rollback()
+        return None
+    fingerprint = identity_fingerprint(students[0])
+    ids = [student.id for student in students if identity_fingerprint(student) == fingerprint]
+    if len(ids) < 2:
+        db.session.rollback()
+        return None
+
+    survivor, moved, dropped, slot_ids = plan_merge(ids)
+    duplicates = ids[1:]
+    if dropped:
+        db.session.execute(delete(StudentEnrollment).where(StudentEnrollment.id.in_(dropped)))
+    if moved:
+        db.session.execute(
+            update(StudentEnrollment).where(StudentEnrollment.id.in_(moved)).values(student_id=survivor)
+        )
+    db.session.execute(delete(StudentSearchToken).where(StudentSearchToken.student_id.in_(duplicates)))
+    db.session.execute(delete(Student).where(Student.id.in_(duplicates)))
+    db.session.execute(
+        update(Slot).where(Slot.id.in_(slot_ids)).where(Slot.is_confirmed == True).values(is_confirmed=False)
+    )
+    db.session.commit()
+    db.session.expunge_all()
+
+    response_cache.invalidate(*[f'slot:{slot_id}' for slot_id in slot_ids])
+    return survivor, duplicates, len(moved), len(dropped)
+
+def main():
+    """
+    Find students stored more than once and merge them.
+
+    Without --apply only the report of the duplicate sets is printed; with
+    --apply the report is printed first, then the sets are merged.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apply', action='store_true', help='Merge the duplicates instead of only reporting them')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Students loaded per partition of the scan')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        started = time.perf_counter()
+        scanned, duplicate_sets = find_duplicate_sets(args.batch_size)
+        print(f"Scanned {scanned} students in {time.perf_counter() - started:.1f}s: "
+              f"{len(duplicate_sets)} duplicate sets, "
+              f"{sum(len(ids) - 1 for ids in duplicate_sets)} students to remove")
+
+        for ids in duplicate_sets:
+            survivor, moved, dropped, _ = plan_merge(ids)
+            print(f"  keep {survivor}, merge {ids[1:]}: "
+                  f"{len(moved)} enrollments moved, {len(dropped)} dropped")
+        db.session.rollback()
+        if not args.apply:
+            print("Dry run: run again with --apply to merge")
+            return
+
+        totals = {'merged': 0, 'moved': 0, 'dropped': 0, 'skipped': 0}
+        for ids in duplicate_sets:
+            result = merge_set(ids)
+            if result is None:
+                totals['skipped'] += 1
+                print(f"  skipped {ids}: changed since the scan")
+                continue
+            survivor, duplicates, moved, dropped = result
+            totals['merged'] += len(duplicates)
+            totals['moved'] += moved
+            totals['dropped'] += dropped
+            print(f"  kept {survivor}, merged {duplicates}: {moved} enrollments moved, {dropped} dropped")
+
+        print(f"Merged {totals['merged']} students: {totals['moved']} enrollments moved, "
+              f"{totals['dropped']} dropped, {totals['skipped']} sets skipped")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import os
+import sys
+import argparse
+import json
+import random
+import time
+from datetime import date, datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from faker import Faker
+from sqlalchemy import func, insert, select
+from tqdm import tqdm
+from werkzeug.security import generate_password_hash
+from app import create_app
+from app.extensions import db
+from app.security.models import School, User, UserApproval
+from app.slots.models import Slot, Student, StudentEnrollment, StudentSearchToken, PII_FIELDS, pii_storage_mode
+from app.slots.models import Department, Gender, GenderCategory, TimePeriod
+from app.slots.search import SEARCH_FIELDS as STUDENT_SEARCH_FIELDS, name_prefixes
+from app.user_management.models import UserSearchToken
+from app.user_management.search import SEARCH_FIELDS as USER_SEARCH_FIELDS, value_trigrams
+from app.utils.crypto_utils import blind_index, encrypt_many, shutdown_decrypt_pools
+
+# Share of the slots of each gender category
+GENDER_CATEGORY_WEIGHTS = {GenderCategory.MIXED: 0.8, GenderCategory.GIRLS: 0.1, GenderCategory.BOYS: 0.1}
+
+def next_id(column):
+    """First free value of an integer primary key."""
+    return (db.session.scalar(select(func.max(column))) or 0) + 1
+
+def insert_rows(target, rows, batch_size):
+    """Insert rows into a model or table, batch_size rows per executemany statement."""
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(insert(target), rows[start:start + batch_size])
+
+def school_weights(rng, schools):
+    """
+    Relative number of students of every school.
+
+    School sizes follow a Zipf-like distribution (a few large schools, many
+    small ones); which school is large depends on the seed.
+    """
+    ranks = list(range(1, len(schools) + 1))
+    rng.shuffle(ranks)
+    return [1 / rank ** 0.8 for rank in ranks]
+
+def generate_users(rng, fake, schools, per_school, password, batch_size):
+    """
+    Insert per_school approved teacher accounts for every school, with their search index.
+
+    Returns:
+        dict: School name mapped to the IDs of its teachers
+    """
+    admin_id = db.session.scalar(select(User.id).where(User.is_admin == True).order_by(User.id))
+    user_id = next_id(User.id)
+    users, approvals, tokens = [], [], []
+    teachers = {}
+    for school_name in schools:
+        teachers[school_name] = []
+        for _ in range(per_school):
+            first_name, last_name = fake.first_name(), fake.last_name()
+            email = f"{first_name}.{last_name}.{user_id}@example.ch".lower().replace(' ', '')
+            users.append({'id': user_id, 'email': email, 'password': password, 'first_name': first_name,
+                          'last_name': last_name, 'school_name': school_name, 'is_admin': False,
+                          'is_active': True, 'deleted': False, 'is_approved': True})
+            approvals.append({'is_approved': True, 'user_admin_id': admin_id, 'user_to_approve_id': user_id,
+                              'created_at': datetime.utcnow()})
+            values = {'email': email, 'first_name': first_name, 'last_name': last_name}
+            trigrams = set()
+            for field in USER_SEARCH_FIELDS:
+                trigrams |= value_trigrams(values[field])
+            tokens.extend({'user_id': user_id, 'token': token} for token in sorted(trigrams))
+            teachers[school_name].append(user_id)
+            user_id += 1
+    insert_rows(User, users, batch_size)
+    insert_rows(UserApproval, approvals, batch_size)
+    insert_rows(UserSearchToken, tokens, batch_size)
+    db.session.commit()
+    return teachers
+
+def generate_slots(rng, first_day, count, reference_date, past):
+    """
+    Insert the slots of one season: six slots (two periods, three departments)
+    on every weekday from first_day.
+
+    Returns:
+        list: (slot ID, gender category, total spots) of the new slots
+    """
+    slot_id = next_id(Slot.id)
+    rows, slots = [], []
+    day = first_day
+    while len(rows) < count:
+        if day.weekday() < 5:
+            for time_period in TimePeriod:
+                for department in Department:
+                    if len(rows) == count:
+                        break
+                    category = rng.choices(list(GENDER_CATEGORY_WEIGHTS), list(GENDER_CATEGORY_WEIGHTS.values()))[0]
+                    total_spots = rng.randint(12, 20)
+                    rows.append({'id': slot_id, 'date': day, 'time_period': time_period, 'department': department,
+                                 'gender_category': category, 'total_spots': total_spots,
+                                 'max_students_per_school': rng.randint(3, 6),
+                                 'is_locked': reference_date >= day - timedelta(weeks=2),
+                                 'is_confirmed': past})
+                    slots.append((slot_id, category, total_spots))
+                    slot_id += 1
+        day += timedelta(days=1)
+    insert_rows(Slot, rows, 1000)
+    db.session.commit()
+    return slots
+
+def student_values(rng, fake, school_name):
+    """Plaintext personal data of a new student."""
+    gender = rng.choice([Gender.BOY, Gender.GIRL])
+    address = fake.street_address()
+    return {
+        'first_name': fake.first_name_male() if gender == Gender.BOY else fake.first_name_female(),
+        'last_name': fake.last_name(),
+        'school_class': f"{rng.randint(1, 4)}{rng.choice('ABCDE')}",
+        'gender': gender.value,
+        # Addresses start with 'Via', like the Student.address setter enforces
+        'address': address if address.lower().startswith(('via ', 'viale ')) else f"Via {address}",
+        'postal_code': fake.postcode(),
+        'city': fake.city(),
+        'landline': fake.phone_number() if rng.random() < 0.4 else None,
+        'mobile': fake.phone_number(),
+    }
+
+def encrypt_students(batch, storage, workers):
+    """
+    Encrypt the plaintext data of a batch of students with one bulk call.
+
+    Returns:
+        list: The encrypted column values of every student
+    """
+    if storage == 'envelope':
+        records = [json.dumps(values, separators=(',', ':'), ensure_ascii=False) for values in batch]
+        return [{**{field: None for field in PII_FIELDS}, 'pii': token}
+                for token in encrypt_many(records, raw=True, workers=workers)]
+    tokens = encrypt_many([values[field] for values in batch for field in PII_FIELDS], workers=workers)
+    width = len(PII_FIELDS)
+    return [{**dict(zip(PII_FIELDS, tokens[i * width:(i + 1) * width])), 'pii': None} for i in range(len(batch))]
+
+def generate_students(rng, fake, slots, count, schools, weights, teachers, storage, batch_size, workers, progress):
+    """
+    Insert the students of one season with their enrollments and search index.
+
+    Every student enrolls in one to three slots compatible with their gender.
+    Occupancy is tracked in memory, so students beyond the capacity of a slot
+    go to its waiting list without counting the enrollments in the database.
+
+    Returns:
+        tuple: (number of students, number of enrollments)
+    """
+    student_id = next_id(Student.id)
+    enrollment_id = next_id(StudentEnrollment.id)
+    occupied = {slot_id: 0 for slot_id, _, _ in slots}
+    open_slots = {gender: [slot for slot in slots if slot[1].allows_gender(gender)] for gender in Gender}
+    enrollments_total = 0
+
+    for start in range(0, count, batch_size):
+        batch, schools_of_batch = [], []
+        for _ in range(min(batch_size, count - start)):
+            school_name = rng.choices(schools, weights)[0]
+            batch.append(student_values(rng, fake, school_name))
+            schools_of_batch.append(school_name)
+
+        students, tokens, enrollments = [], [], []
+        for values, school_name, encrypted in zip(batch, schools_of_batch, encrypt_students(batch, storage, workers)):
+            students.append({'id': student_id, 'school_name': school_name, **encrypted})
+            prefixes = set()
+            for field in STUDENT_SEARCH_FIELDS:
+                prefixes |= name_prefixes(values[field])
+            tokens.extend({'student_id': student_id, 'token': blind_index(prefix)} for prefix in sorted(prefixes))
+            user_id = rng.choice(teachers[school_name])
+            candidates = open_slots[Gender(values['gender'])]
+            for slot_id, _, total_spots in rng.sample(candidates, min(rng.randint(1, 3), len(candidates))):
+                enrollments.append({'id': enrollment_id, 'user_id': user_id, 'student_id': student_id,
+                                    'slot_id': slot_id, 'is_in_waiting_list': occupied[slot_id] >= total_spots})
+                occupied[slot_id] += 1
+                enrollment_id += 1
+            student_id += 1
+
+        # The table is used directly: the encrypted columns are mapped to private attributes
+        insert_rows(Student.__table__, students, batch_size)
+        insert_rows(StudentSearchToken, tokens, batch_size * 4)
+        insert_rows(StudentEnrollment, enrollments, batch_size)
+        db.session.commit()
+        enrollments_total += len(enrollments)
+        progress.update(len(batch))
+    return count, enrollments_total
+
+def generate(rng, fake, seasons, slots_per_season, students_per_season, users_per_school, reference_date,
+             password, batch_size=2000, workers=None):
+    """
+    Append the teachers, slots, students and enrollments of the seasons to the
+    database of the current application context.
+
+    Seasons are a year apart and the last one opens three weeks after the
+    reference date, so its slots accept enrollments.
+
+    Args:
+        password (str): Plaintext password of every generated account
+
+    Returns:
+        dict: The generated volumes
+    """
+    storage = pii_storage_mode()
+    schools = [name for name, in db.session.execute(select(School.name).order_by(School.name))]
+    weights = school_weights(rng, schools)
+    # Hashing is deliberately slow: every generated account shares one hash
+    password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+    teachers = generate_users(rng, fake, schools, users_per_school, password_hash, batch_size)
+
+    totals = {'schools': len(schools), 'users': len(schools) * users_per_school,
+              'slots': 0, 'students': 0, 'enrollments': 0, 'storage': storage}
+    with tqdm(total=seasons * students_per_season, unit='students') as progress:
+        for season in range(seasons):
+            first_day = reference_date + timedelta(weeks=3) - timedelta(days=364 * (seasons - 1 - season))
+            slots = generate_slots(rng, first_day, slots_per_season, reference_date, past=season < seasons - 1)
+            students, enrollments = generate_students(
+                rng, fake, slots, students_per_season, schools, weights, teachers,
+                storage, batch_size, workers, progress)
+            totals['slots'] += len(slots)
+            totals['students'] += students
+            totals['enrollments'] += enrollments
+    return totals
+
+def main():
+    """
+    Generate a multi-season dataset for load tests and benchmarks.
+
+    The data is appended to the configured database (or --database-url) with
+    bulk INSERT statements, and the student data is encrypted in bulk on the
+    process pool. The generated values depend only on the seed, the options
+    and the reference date, so a run can be reproduced exactly; only the
+    ciphertexts differ, as every encryption uses a random IV.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the generated values')
+    parser.add_argument('--seasons', type=int, default=3, help='Seasons, the last one starting after the lock period')
+    parser.add_argument('--slots-per-season', type=int, default=1200, help='Slots of every season')
+    parser.add_argument('--students-per-season', type=int, default=50000, help='Students of every season')
+    parser.add_argument('--users-per-school', type=int, default=4, help='Teacher accounts per school')
+    parser.add_argument('--reference-date', type=date.fromisoformat, default=date.today(),
+                        help='Date the seasons are placed around (YYYY-MM-DD, default: today)')
+    parser.add_argument('--batch-size', type=int, default=2000, help='Students encrypted and inserted per batch')
+    parser.add_argument('--workers', type=int, default=None, help='Encryption processes (default: DECRYPT_POOL_WORKERS)')
+    parser.add_argument('--database-url', help='SQLAlchemy URL of the database to fill (default: the configured one)')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    fake = Faker('it_IT')
+    fake.seed_instance(args.seed)
+
+    test_config = {'SCHEDULER_ENABLED': False}
+    if args.database_url:
+        test_config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    app = create_app(test_config)
+    with app.app_context():
+        started = time.perf_counter()
+        totals = generate(rng, fake, args.seasons, args.slots_per_season, args.students_per_season,
+                          args.users_per_school, args.reference_date, f"seed-{args.seed}",
+                          args.batch_size, args.workers)
+        shutdown_decrypt_pools()
+        print(f"Created {totals['users']} users (password: seed-{args.seed})")
+        print(f"Generated {totals['slots']} slots, {totals['students']} students and "
+              f"{totals['enrollments']} enrollments ({totals['storage']} storage) in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
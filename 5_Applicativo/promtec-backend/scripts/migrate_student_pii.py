@@ -0,0 +1,77 @@
+import os
+import sys
+import argparse
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import bindparam, update
+from app import create_app
+from app.extensions import db
+from app.slots.models import Student, PII_FIELDS
+from app.utils.crypto_utils import encrypt_record, encrypt_value
+
+def converted_values(student, mode):
+    """Get the new column values of a student stored in the given format."""
+    fields = student.pii_fields()
+    if mode == 'envelope':
+        values = {field: None for field in PII_FIELDS}
+        values['pii'] = encrypt_record(fields)
+    else:
+        values = {field: encrypt_value(fields[field]) for field in PII_FIELDS}
+        values['pii'] = None
+    return values
+
+def migrate(mode, batch_size):
+    """
+    Convert the student PII of every row to the given storage format.
+
+    Rows are processed in primary key order, one locked batch per transaction,
+    and the session is cleared after every batch so memory use stays flat.
+    The rows are written with plain UPDATE statements: the content does not
+    change, so the ORM listeners (like resetting slot confirmations) and the
+    updated_at timestamp are left alone.
+    """
+    table = Student.__table__
+    statement = update(table).where(table.c.id == bindparam('row_id')).values(
+        updated_at=table.c.updated_at,
+        **{column: bindparam(f'new_{column}') for column in PII_FIELDS + ('pii',)}
+    )
+    # Only rows still stored in the other format need to be converted
+    pending = Student._pii.is_(None) if mode == 'envelope' else Student._pii.isnot(None)
+
+    converted = 0
+    last_id = 0
+    started = time.perf_counter()
+    while True:
+        students = Student.query.filter(pending, Student.id > last_id) \
+            .order_by(Student.id).limit(batch_size).with_for_update().all()
+        if not students:
+            break
+        rows = []
+        for student in students:
+            values = converted_values(student, mode)
+            rows.append({'row_id': student.id, **{f'new_{column}': value for column, value in values.items()}})
+        db.session.execute(statement, rows)
+        db.session.commit()
+        db.session.expunge_all()
+
+        converted += len(rows)
+        last_id = rows[-1]['row_id']
+        print(f"Converted {converted} students (last id {last_id}, {time.perf_counter() - started:.1f}s)")
+    return converted
+
+def main():
+    """Convert student PII between column storage and envelope storage."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--to', choices=['columns', 'envelope'], required=True,
+                        help='Target storage format (set STUDENT_PII_STORAGE to the same value)')
+    parser.add_argument('--batch-size', type=int, default=500, help='Students converted per transaction')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        count = migrate(args.to, args.batch_size)
+        print(f"Done: {count} students stored as {args.to}")
+
+if __name__ == "__main__":
+    main()
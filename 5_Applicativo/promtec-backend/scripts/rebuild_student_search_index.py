@@ -0,0 +1,21 @@
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.slots.search import rebuild_index
+
+def main():
+    """Rebuild the blind prefix index used by the student name search."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--batch-size', type=int, default=1000, help='Students indexed per transaction')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        count = rebuild_index(batch_size=args.batch_size)
+        print(f"Indexed {count} students")
+
+if __name__ == "__main__":
+    main()
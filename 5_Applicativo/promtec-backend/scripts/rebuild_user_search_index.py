@@ -0,0 +1,16 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.user_management.search import rebuild_index
+
+def main():
+    """Rebuild the trigram index used by the user administration search."""
+    app = create_app()
+    with app.app_context():
+        count = rebuild_index()
+        print(f"Indexed {count} users")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import os
+import sys
+import argparse
+import json
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select, update
+from tqdm import tqdm
+from app import create_app
+from app.extensions import db
+from app.slots.models import Student, PII_FIELDS
+from app.utils.crypto_utils import FERNET_KEYS, primary_key_fingerprint, rotate_value
+
+# Encrypted columns of the student table: one token per field plus the envelope record
+ENCRYPTED_COLUMNS = PII_FIELDS + ('pii',)
+
+# Attempts to re-encrypt a row that keeps being modified by the application
+MAX_ATTEMPTS = 3
+
+def load_checkpoint(path, restart):
+    """Load the progress of an interrupted rotation to the same key, or start from the beginning."""
+    fingerprint = primary_key_fingerprint()
+    if not restart and os.path.exists(path):
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint['key'] != fingerprint:
+            sys.exit(f"{path} belongs to a rotation to another key, use --restart to discard it")
+        return checkpoint
+    return {'key': fingerprint, 'last_id': 0, 'rotated': 0, 'up_to_date': 0, 'conflicts': 0, 'finished': False}
+
+def save_checkpoint(path, checkpoint):
+    """Write the checkpoint atomically, so an interruption never leaves it half written."""
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(temporary, path)
+
+def rotate_row(table, row_id):
+    """
+    Re-encrypt the columns of one student that still use an old key.
+
+    The UPDATE only succeeds if the columns still hold the values that were
+    read, so a concurrent change made by the application (always encrypted with
+    the new key) is never overwritten; the row is then read again.
+
+    Returns:
+        str: 'rotated', 'up_to_date' or 'conflict'
+    """
+    for _ in range(MAX_ATTEMPTS):
+        row = db.session.execute(
+            select(*[table.c[column] for column in ENCRYPTED_COLUMNS]).where(table.c.id == row_id)
+        ).one_or_none()
+        if row is None:
+            return 'up_to_date'  # Deleted in the meantime
+
+        changes = {}
+        for column in ENCRYPTED_COLUMNS:
+            value = getattr(row, column)
+            if value is not None:
+                rotated = rotate_value(value)
+                if rotated is not None:
+                    changes[column] = (value, rotated)
+        if not changes:
+            return 'up_to_date'
+
+        result = db.session.execute(
+            update(table)
+            .where(table.c.id == row_id, *[table.c[column] == old for column, (old, _) in changes.items()])
+            # The content does not change, so the update time is kept
+            .values(updated_at=table.c.updated_at, **{column: new for column, (_, new) in changes.items()})
+        )
+        db.session.commit()
+        if result.rowcount == 1:
+            return 'rotated'
+    return 'conflict'
+
+def rotate(batch_size, rows_per_second, checkpoint_path, restart):
+    """Re-encrypt every student row with the primary key, in primary key order."""
+    table = Student.__table__
+    checkpoint = load_checkpoint(checkpoint_path, restart)
+    total = db.session.execute(select(func.count()).select_from(table)).scalar()
+    done = db.session.execute(select(func.count()).where(table.c.id <= checkpoint['last_id'])).scalar()
+
+    with tqdm(total=total, initial=done, unit='row', desc='Rotating') as progress:
+        while True:
+            started = time.monotonic()
+            row_ids = db.session.execute(
+                select(table.c.id).where(table.c.id > checkpoint['last_id']).order_by(table.c.id).limit(batch_size)
+            ).scalars().all()
+            db.session.commit()  # Do not keep a transaction open between batches
+            if not row_ids:
+                break
+
+            for row_id in row_ids:
+                outcome = rotate_row(table, row_id)
+                checkpoint['conflicts' if outcome == 'conflict' else outcome] += 1
+            checkpoint['last_id'] = row_ids[-1]
+            save_checkpoint(checkpoint_path, checkpoint)
+            progress.update(len(row_ids))
+            progress.set_postfix(rotated=checkpoint['rotated'], conflicts=checkpoint['conflicts'])
+
+            if rows_per_second:
+                # Throttle to leave database capacity to the application
+                pause = len(row_ids) / rows_per_second - (time.monotonic() - started)
+                if pause > 0:
+                    time.sleep(pause)
+
+    checkpoint['finished'] = True
+    save_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint
+
+def main():
+    """
+    Re-encrypt the student data with the first key of FERNET_KEYS.
+
+    Procedure: deploy FERNET_KEYS=<new key>,<old key> to every worker, run this
+    command (it can be interrupted and resumed at any time), then remove the
+    old key from FERNET_KEYS once it reports no conflicts.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=200, help='Rows read per batch')
+    parser.add_argument('--rows-per-second', type=float, default=500, help='Maximum rotation rate, 0 for no limit')
+    parser.add_argument('--checkpoint', default='key_rotation_checkpoint.json', help='File storing the progress')
+    parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint and start over')
+    args = parser.parse_args()
+
+    if len(FERNET_KEYS) < 2:
+        sys.exit("FERNET_KEYS must list the new key followed by the old key(s)")
+
+    app = create_app()
+    with app.app_context():
+        checkpoint = rotate(args.batch_size, args.rows_per_second, args.checkpoint, args.restart)
+    print(f"Rotated {checkpoint['rotated']} rows, {checkpoint['up_to_date']} already up to date, "
+          f"{checkpoint['conflicts']} conflicts")
+    if checkpoint['conflicts']:
+        print("Rows with conflicts were changed repeatedly during the rotation: run again with --restart")
+
+if __name__ == "__main__":
+    main()